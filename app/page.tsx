@@ -5,6 +5,18 @@ import ECGVisualization from '@/components/ECGVisualization'
 import ProcessingStage from '@/components/ProcessingStage'
 import { ProcessingResponse } from '@/types/ecg'
 import { processECG } from '@/lib/lambda-client'
+import { encodeECGBinary, parseECGCSV } from '@/lib/csv-parser'
+
+// Puntos por señal: mínimo y máximo por cada pixel del ancho del gráfico (1200 px)
+const PREVIEW_POINTS = 2400
+
+/**
+ * Frecuencia efectiva de una señal submuestreada (para el eje de tiempo del gráfico)
+ */
+const previewFs = (response: ProcessingResponse, key: keyof NonNullable<ProcessingResponse['previews']>, fs: number): number => {
+  const preview = response.previews?.[key]
+  return preview ? (fs * preview.puntos) / preview.muestras_originales : fs
+}
 
 export default function Home() {
   const [csvFile, setCsvFile] = useState<File | null>(null)
@@ -42,7 +54,13 @@ export default function Home() {
 
     try {
       // Llamar a Lambda - TODO el procesamiento se hace en Lambda
-      const data = await processECG(csvContent, 'default')
+      // El ECG se sube en binario (float32, ~la mitad que el CSV) y se piden previews
+      // del tamaño del gráfico en binario para reducir la respuesta
+      const { data: rawData, fs } = parseECGCSV(csvContent)
+      const data = await processECG(encodeECGBinary(rawData, fs), 'default', {
+        previewPoints: PREVIEW_POINTS,
+        encoding: 'base64-float32',
+      })
       setResponse(data)
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Error desconocido')
@@ -161,7 +179,7 @@ export default function Home() {
               <ECGVisualization
                 signal={response.signal_original}
                 title="ECG Crudo"
-                fs={response.estados.calidad.fs_original || 500}
+                fs={previewFs(response, 'signal_original', response.estados.calidad.fs_original || 500)}
               />
             </ProcessingStage>
 
@@ -175,7 +193,7 @@ export default function Home() {
                 <ECGVisualization
                   signal={response.signal_filtrada}
                   title="ECG Filtrado"
-                  fs={response.estados.calidad.fs_original || 500}
+                  fs={previewFs(response, 'signal_filtrada', response.estados.calidad.fs_original || 500)}
                 />
               </ProcessingStage>
             )}
@@ -190,7 +208,7 @@ export default function Home() {
                 <ECGVisualization
                   signal={response.signal_normalizada}
                   title="ECG Normalizado"
-                  fs={response.estados.calidad.fs_original || 500}
+                  fs={previewFs(response, 'signal_normalizada', response.estados.calidad.fs_original || 500)}
                 />
               </ProcessingStage>
             )}
@@ -205,7 +223,7 @@ export default function Home() {
                 <ECGVisualization
                   signal={response.signal_resampleada}
                   title="ECG Resampleado a 200 Hz"
-                  fs={200}
+                  fs={previewFs(response, 'signal_resampleada', 200)}
                 />
               </ProcessingStage>
             )}
@@ -221,7 +239,7 @@ export default function Home() {
                   <ECGVisualization
                     signal={response.signal_resampleada}
                     title="ECG Final (Tensor [1, 2000, 3])"
-                    fs={200}
+                    fs={previewFs(response, 'signal_resampleada', 200)}
                   />
                   <div className="bg-gray-800 rounded-lg p-4 border border-gray-700">
                     <h4 className="text-sm font-semibold text-gray-300 mb-2">📊 Información del Tensor</h4>
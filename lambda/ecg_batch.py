@@ -0,0 +1,237 @@
+"""
+Procesamiento por lotes del pipeline de ECG (línea de comandos)
+Recorre un directorio de CSVs (o un manifiesto con una ruta por línea), ejecuta las
+etapas parseo → calidad → filtrado → normalización → resampling → tensor en un pool
+de procesos y guarda los tensores en shards .npz con un índice JSONL. Si se corta,
+al volver a ejecutarlo se saltean los archivos que ya están en el índice.
+
+Uso:
+    python ecg_batch.py public/examples --output salida/ --workers 8
+"""
+
+import os
+
+# Un hilo de BLAS por proceso: el paralelismo lo da el pool
+for _variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_variable, '1')
+# Cada archivo se procesa una sola vez: la caché de etapas solo ocuparía memoria
+os.environ.setdefault('ECG_STAGE_CACHE_ENABLED', 'false')
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ecg_processor import invoke_model, pipeline_parameters, preprocess_ecg
+
+logger = logging.getLogger()
+
+INDEX_FILE = 'index.jsonl'
+PARAMETERS_FILE = 'parametros.json'
+SHARD_SIZE = 256
+
+
+def list_inputs(source: str) -> List[str]:
+    """Archivos CSV de un directorio (recursivo) o de un manifiesto (una ruta por línea)"""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith('.csv'))
+        return sorted(paths)
+    
+    # Manifiesto: rutas relativas al directorio del manifiesto; se ignoran vacías y comentarios
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding='utf-8') as f:
+        entries = [line.strip() for line in f]
+    return [os.path.join(base, entry) for entry in entries if entry and not entry.startswith('#')]
+
+
+def load_index(output_dir: str) -> Tuple[Set[str], int]:
+    """Archivos ya procesados (sin error) según el índice y el próximo número de shard"""
+    done: Set[str] = set()
+    next_shard = 0
+    path = os.path.join(output_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return done, next_shard
+    
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Línea truncada por un corte a mitad de escritura
+            if 'error' not in entry:
+                done.add(entry['archivo'])
+            if entry.get('shard'):
+                next_shard = max(next_shard, int(entry['shard'].split('-')[1].split('.')[0]) + 1)
+    return done, next_shard
+
+
+def check_parameters(output_dir: str, parameters: Dict[str, Any]) -> None:
+    """Guarda los parámetros del pipeline y evita mezclar corridas con parámetros distintos"""
+    path = os.path.join(output_dir, PARAMETERS_FILE)
+    # Se comparan tal como quedan en el JSON (p. ej. las tuplas se leen como listas)
+    parameters = json.loads(json.dumps(parameters))
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous != parameters:
+            raise SystemExit(f'{output_dir} contiene resultados con otros parámetros: {previous}')
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(parameters, f, indent=2, sort_keys=True)
+
+
+def process_file(task: Tuple[str, str, Dict[str, Any], bool, str]) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    """Procesa un CSV (en un proceso del pool): (entrada del índice, tensor o None)"""
+    path, name, request_data, predict, dtype = task
+    start = time.perf_counter()
+    try:
+        with open(path, encoding='utf-8') as f:
+            csv_content = f.read()
+        response_data, model_input = preprocess_ecg(csv_content, request_data)
+        entry = {
+            'archivo': name,
+            'estados': response_data['estados'],
+            'etiqueta_real': response_data['etiqueta_real']
+        }
+        if model_input is not None:
+            if predict:
+                entry['prediccion'], entry['modelo'] = invoke_model(
+                    model_input, request_data.get('windowAggregation', 'mean'))
+            model_input = model_input.astype(dtype, copy=False)
+            entry['shape'] = list(model_input.shape)
+    except Exception as e:
+        entry = {'archivo': name, 'error': str(e)}
+        model_input = None
+    entry['segundos'] = round(time.perf_counter() - start, 4)
+    return entry, model_input
+
+
+class ShardWriter:
+    """Acumula tensores y los escribe en shards .npz seguidos de sus líneas del índice"""
+    
+    def __init__(self, output_dir: str, next_shard: int = 0, shard_size: int = SHARD_SIZE):
+        self.output_dir = output_dir
+        self.next_shard = next_shard
+        self.shard_size = shard_size
+        self._tensors: Dict[str, np.ndarray] = {}
+        self._entries: List[Dict[str, Any]] = []
+        self._index = open(os.path.join(output_dir, INDEX_FILE), 'a', encoding='utf-8')
+    
+    def add(self, entry: Dict[str, Any], tensor: Optional[np.ndarray]) -> None:
+        if tensor is not None:
+            entry['clave'] = f'r{len(self._tensors)}'
+            self._tensors[entry['clave']] = tensor
+        self._entries.append(entry)
+        if len(self._tensors) >= self.shard_size:
+            self.flush()
+    
+    def flush(self) -> None:
+        """Escribe el shard (atómicamente) antes que el índice: el índice nunca apunta a un shard incompleto"""
+        if self._tensors:
+            shard = f'shard-{self.next_shard:05d}.npz'
+            fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **self._tensors)
+            os.replace(tmp_path, os.path.join(self.output_dir, shard))
+            self.next_shard += 1
+            for entry in self._entries:
+                if 'clave' in entry:
+                    entry['shard'] = shard
+        
+        for entry in self._entries:
+            self._index.write(json.dumps(entry, default=float) + '\n')
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        self._tensors = {}
+        self._entries = []
+    
+    def close(self) -> None:
+        self.flush()
+        self._index.close()
+
+
+def run_batch(paths: List[str], output_dir: str, request_data: Dict[str, Any], workers: int = None,
+              shard_size: int = SHARD_SIZE, predict: bool = False, dtype: str = 'float32',
+              root: str = None) -> Dict[str, Any]:
+    """Procesa los archivos pendientes en un pool de procesos y retorna un resumen"""
+    os.makedirs(output_dir, exist_ok=True)
+    check_parameters(output_dir, {**pipeline_parameters(request_data), 'prediccion': predict, 'dtype': dtype})
+    done, next_shard = load_index(output_dir)
+    
+    # En el índice los archivos se identifican por su ruta relativa a root
+    if root is None:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else ''
+    names = [(path, os.path.relpath(os.path.abspath(path), root)) for path in paths]
+    pending = [(path, name) for path, name in names if name not in done]
+    tasks = ((path, name, request_data, predict, dtype) for path, name in pending)
+    logger.info(f"{len(paths)} archivos, {len(pending)} pendientes, {workers or os.cpu_count()} procesos")
+    
+    summary = {'procesados': 0, 'con_tensor': 0, 'rechazados': 0, 'errores': 0, 'omitidos': len(paths) - len(pending)}
+    start = time.perf_counter()
+    writer = ShardWriter(output_dir, next_shard, shard_size)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for entry, tensor in executor.map(process_file, tasks, chunksize=4):
+                writer.add(entry, tensor)
+                summary['procesados'] += 1
+                if 'error' in entry:
+                    summary['errores'] += 1
+                    logger.warning(f"Error en {entry['archivo']}: {entry['error']}")
+                elif tensor is None:
+                    summary['rechazados'] += 1
+                else:
+                    summary['con_tensor'] += 1
+                if summary['procesados'] % 100 == 0:
+                    rate = summary['procesados'] / (time.perf_counter() - start)
+                    logger.info(f"{summary['procesados']}/{len(pending)} archivos ({rate:.1f} archivos/s)")
+    finally:
+        writer.close()
+    
+    summary['segundos'] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Procesa un directorio de CSVs de ECG con el pipeline de la Lambda')
+    parser.add_argument('source', help='Directorio con CSVs o manifiesto con una ruta por línea')
+    parser.add_argument('--output', '-o', required=True, help='Directorio de salida (shards .npz + index.jsonl)')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Procesos del pool (por defecto, uno por CPU)')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='Registros con tensor por shard')
+    parser.add_argument('--dtype', choices=('float32', 'float64'), default='float32', help='Tipo de los tensores guardados')
+    parser.add_argument('--predict', action='store_true', help='Invocar también el endpoint de SageMaker')
+    parser.add_argument('--first-window', action='store_true', help='Solo los primeros 10 s (multiWindow=false)')
+    parser.add_argument('--window-hop', type=int, default=None, help='Muestras entre ventanas')
+    parser.add_argument('--window-aggregation', choices=('mean', 'max'), default='mean')
+    parser.add_argument('--zero-phase', action='store_true', help='Filtrado ida y vuelta (fase cero)')
+    parser.add_argument('--staged', action='store_true', help='Procesar etapa por etapa en lugar del modo fusionado')
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    
+    request_data = {
+        'multiWindow': not args.first_window,
+        'windowHop': args.window_hop,
+        'windowAggregation': args.window_aggregation,
+        'zeroPhase': args.zero_phase,
+        # Solo se guardan los tensores: sin señales intermedias aplica el modo fusionado
+        'outputs': ['tensor'],
+        'fused': not args.staged
+    }
+    paths = list_inputs(args.source)
+    root = args.source if os.path.isdir(args.source) else os.path.dirname(os.path.abspath(args.source))
+    summary = run_batch(paths, args.output, request_data, args.workers, args.shard_size,
+                        args.predict, args.dtype, root)
+    print(json.dumps(summary))
+    return 1 if summary['errores'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
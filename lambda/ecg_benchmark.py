@@ -0,0 +1,491 @@
+"""
+Benchmark reproducible del pipeline de ECG
+Genera ECGs sintéticos (duración, frecuencia de muestreo y nivel de ruido configurables)
+además de los CSVs de public/examples, mide cada etapa y el lambda_handler completo
+(con el endpoint local de ecg_local_endpoint) y escribe un reporte JSON comparable entre
+commits. Cada caso guarda una huella de sus salidas para verificar que una optimización
+no cambie los tensores ni las predicciones. Con --load-requests agrega una prueba de
+carga del handler (varios hilos, endpoint local con latencia y errores inyectados).
+
+Uso:
+    python ecg_benchmark.py --output bench.json
+    python ecg_benchmark.py --output bench_nuevo.json --compare bench.json
+    python ecg_benchmark.py --streaming-hours 24 --output bench_holter.json
+    python ecg_benchmark.py --durations '' --no-examples --load-requests 500 --load-concurrency 16 \
+        --endpoint-latency-ms 80 --endpoint-error-rate 0.05 --output carga.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import ecg_instrumentation
+import ecg_processor
+from ecg_instrumentation import peak_rss_bytes
+from ecg_local_endpoint import LocalEndpointClient
+from ecg_processor import (
+    DEFAULT_MODEL_ID,
+    check_quality,
+    filter_signal,
+    lambda_handler,
+    normalize_signal,
+    parse_csv_content,
+    resample_to_200hz,
+    window_signal,
+)
+from ecg_stream import fused_model_input
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'public', 'examples')
+REPORT_VERSION = 1
+
+DEFAULT_DURATIONS = (10, 60, 600)
+DEFAULT_RATES = (250, 360, 500, 1000)
+# Ruido blanco (mV) y amplitud de la interferencia de red (mV) por nivel
+NOISE_LEVELS = {'bajo': (0.01, 0.02), 'alto': (0.08, 0.15)}
+
+# Tolerancias para comparar huellas entre commits
+EQUIVALENCE_RTOL = 1e-6
+EQUIVALENCE_ATOL = 1e-9
+
+
+# ----------------------------------------------------------------------------
+# ECG sintético
+# ----------------------------------------------------------------------------
+
+# Ondas del latido: (posición en el ciclo, ancho, amplitud por derivación II / V1 / V5)
+_WAVES = (
+    (0.16, 0.025, (0.15, 0.08, 0.10)),   # P
+    (0.285, 0.008, (-0.10, -0.05, -0.08)),  # Q
+    (0.30, 0.010, (1.20, -0.60, 1.50)),  # R
+    (0.315, 0.009, (-0.25, -0.90, -0.30)),  # S
+    (0.55, 0.050, (0.30, 0.10, 0.35)),   # T
+)
+
+
+def synthetic_ecg(duration_s: float, fs: float, noise: str = 'bajo', seed: int = 0,
+                  start_sample: int = 0, num_samples: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ECG sintético de 3 derivaciones: (tiempo_s, señal [muestras, 3]) en mV
+    
+    Latidos con variabilidad del intervalo RR, deriva de línea de base, interferencia
+    de red y ruido blanco. Con start_sample / num_samples se genera solo un tramo; la
+    secuencia de latidos es la misma en todos, así que los tramos encadenados forman
+    un registro continuo.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(round(duration_s * fs))
+    num_samples = total - start_sample if num_samples is None else min(num_samples, total - start_sample)
+    
+    # Secuencia de latidos (~70 lpm) para todo el registro
+    num_beats = int(duration_s / 0.5) + 2
+    rr = 0.86 + 0.05 * np.sin(np.arange(num_beats) * 0.3) + rng.normal(0, 0.02, num_beats)
+    beat_starts = np.concatenate([[-rr[0] * rng.uniform()], np.cumsum(rr)[:-1]])
+    
+    n = np.arange(start_sample, start_sample + num_samples)
+    t = n / fs
+    beat = np.searchsorted(beat_starts, t, side='right') - 1
+    phase = (t - beat_starts[beat]) / rr[beat]
+    
+    signal = np.zeros((num_samples, 3))
+    for position, width, amplitudes in _WAVES:
+        shape = np.exp(-0.5 * ((phase - position) / width) ** 2)
+        signal += shape[:, np.newaxis] * np.array(amplitudes)
+    
+    white, powerline = NOISE_LEVELS[noise]
+    noise_rng = np.random.default_rng((seed, start_sample))
+    signal += 0.2 * np.sin(2 * np.pi * 0.25 * t)[:, np.newaxis]  # Deriva de línea de base
+    signal += powerline * np.sin(2 * np.pi * 50 * t)[:, np.newaxis]
+    signal += noise_rng.normal(0, white, signal.shape)
+    return t, signal
+
+
+def _format_rows(t: np.ndarray, signal: np.ndarray) -> str:
+    buffer = io.StringIO()
+    columns = np.column_stack([t, signal, np.zeros(t.size), np.zeros(t.size)])
+    np.savetxt(buffer, columns, fmt=('%.12f', '%.5f', '%.5f', '%.5f', '%d', '%d'), delimiter=',')
+    # label 0 (normal), is_anomalo False
+    return buffer.getvalue().replace(',0,0\n', ',0,False\n')
+
+
+def synthetic_csv(duration_s: float, fs: float, noise: str = 'bajo', seed: int = 0) -> str:
+    """CSV sintético con el formato de public/examples"""
+    t, signal = synthetic_ecg(duration_s, fs, noise, seed)
+    return 'tiempo_s,II,V1,V5,label,is_anomalo\n' + _format_rows(t, signal)
+
+
+def iter_synthetic_csv_lines(duration_s: float, fs: float, noise: str = 'bajo', seed: int = 0,
+                             block_s: float = 60) -> Iterator[str]:
+    """Líneas de un CSV sintético generadas por tramos (registros de horas sin tenerlos en memoria)"""
+    yield 'tiempo_s,II,V1,V5,label,is_anomalo'
+    total = int(round(duration_s * fs))
+    block = int(block_s * fs)
+    for start in range(0, total, block):
+        t, signal = synthetic_ecg(duration_s, fs, noise, seed, start, block)
+        yield from _format_rows(t, signal).splitlines()
+
+
+# ----------------------------------------------------------------------------
+# Medición
+# ----------------------------------------------------------------------------
+
+def fingerprint(array: Optional[np.ndarray], points: int = 32) -> Optional[Dict[str, Any]]:
+    """Huella de un array: forma, suma, norma y una muestra equiespaciada de valores"""
+    if array is None:
+        return None
+    flat = np.asarray(array, dtype=np.float64).ravel()
+    finite = np.where(np.isfinite(flat), flat, 0.0)
+    sample = finite[np.linspace(0, flat.size - 1, min(points, flat.size)).astype(np.int64)] if flat.size else finite
+    return {
+        'shape': list(np.shape(array)),
+        'suma': float(finite.sum()),
+        'norma': float(np.sqrt(np.dot(finite, finite))),
+        'muestra': sample.tolist()
+    }
+
+
+def measure(function: Callable[[], Any], repeat: int, num_samples: int = None,
+            trace_memory: bool = True) -> Tuple[Dict[str, Any], Any]:
+    """Tiempos (min / mediana / p95) de repeat ejecuciones y pico de memoria de una ejecución extra"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    
+    stats: Dict[str, Any] = {
+        'min_ms': round(min(times) * 1000, 4),
+        'mediana_ms': round(statistics.median(times) * 1000, 4),
+        'p95_ms': round(float(np.percentile(times, 95)) * 1000, 4)
+    }
+    if num_samples:
+        stats['muestras_por_s'] = round(num_samples / max(statistics.median(times), 1e-12), 1)
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            function()
+            stats['pico_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return stats, result
+
+
+def benchmark_csv(name: str, csv_content: str, repeat: int, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """Mide cada etapa y el handler completo sobre un CSV"""
+    case: Dict[str, Any] = {'nombre': name, **parameters, 'bytes_csv': len(csv_content), 'etapas': {}}
+    stages = case['etapas']
+    
+    stats, parsed = measure(lambda: parse_csv_content(csv_content), repeat)
+    signal, _, fs, _ = parsed
+    num_samples = signal.shape[0]
+    stats['muestras_por_s'] = round(num_samples / max(stats['mediana_ms'] / 1000, 1e-12), 1)
+    stages['parse_csv_content'] = stats
+    case['muestras'] = num_samples
+    case['fs_estimada'] = fs
+    
+    stages['check_quality'], quality = measure(lambda: check_quality(signal, fs), repeat, num_samples)
+    stages['filter_signal'], (filtered, _) = measure(lambda: filter_signal(signal, fs), repeat, num_samples)
+    stages['normalize_signal'], (normalized, _) = measure(lambda: normalize_signal(filtered), repeat, num_samples)
+    stages['resample_to_200hz'], (resampled, _) = measure(lambda: resample_to_200hz(normalized, fs), repeat, num_samples)
+    stages['window_signal'], windows = measure(lambda: window_signal(resampled), repeat, resampled.shape[0])
+    # Filtrado, normalización, resampling y ventanas en una pasada (modo fusionado)
+    model = ecg_processor.resolve_models()[0][1]
+    stages['fused_model_input'], _ = measure(
+        lambda: fused_model_input(signal, fs, ecg_processor.filter_parameters(), model, {}), repeat, num_samples)
+    
+    # Extremo a extremo: handler con el cliente simulado y sin caché de resultados
+    event = {'body': json.dumps({'csvContent': csv_content})}
+    stats, response = measure(lambda: lambda_handler(event, None), repeat, num_samples)
+    body = json.loads(response['body'])
+    stats['bytes_respuesta'] = len(response['body'])
+    case['lambda_handler'] = stats
+    
+    case['huella'] = {
+        'calidad': quality['status'],
+        'filtrada': fingerprint(filtered),
+        'resampleada': fingerprint(resampled),
+        'tensor': fingerprint(windows),
+        'prediccion': body.get('prediccion')
+    }
+    return case
+
+
+def benchmark_stream(hours: float, fs: float, noise: str) -> Dict[str, Any]:
+    """
+    Registro largo en modo streaming (p. ej. Holter de 24 h), generado al vuelo.
+    
+    Se descuenta el tiempo de generación del CSV sintético (que se lee dos veces, ver
+    process_stream). La memoria se reporta como pico de RSS del proceso: tracemalloc
+    sobre millones de líneas distorsiona el tiempo.
+    """
+    from ecg_stream import process_stream
+    
+    generation = [0.0]
+    
+    def timed_lines(lines):
+        while True:
+            start = time.perf_counter()
+            line = next(lines, None)
+            generation[0] += time.perf_counter() - start
+            if line is None:
+                return
+            yield line
+    
+    # Huella del tensor acumulada por grupos de ventanas (nunca se tiene completo)
+    windows = {'ventanas': 0, 'suma': 0.0, 'cuadrados': 0.0, 'primera': None}
+    
+    def on_windows(model_id: str, group: np.ndarray) -> None:
+        if model_id != DEFAULT_MODEL_ID:
+            return
+        finite = np.where(np.isfinite(group), group, 0.0).astype(np.float64)
+        windows['ventanas'] += group.shape[0]
+        windows['suma'] += float(finite.sum())
+        windows['cuadrados'] += float(np.dot(finite.ravel(), finite.ravel()))
+        if windows['primera'] is None:
+            windows['primera'] = group[:1].copy()
+    
+    duration_s = hours * 3600
+    start = time.perf_counter()
+    response_data = process_stream(lambda: timed_lines(iter_synthetic_csv_lines(duration_s, fs, noise)),
+                                   on_windows=on_windows)
+    elapsed = time.perf_counter() - start - generation[0]
+    
+    num_samples = response_data['streaming']['muestras_totales']
+    return {
+        'nombre': f'streaming_{hours:g}h_{fs:g}hz_{noise}',
+        'duracion_s': duration_s,
+        'fs': fs,
+        'ruido': noise,
+        'muestras': num_samples,
+        'process_stream': {
+            'segundos': round(elapsed, 3),
+            'segundos_generacion': round(generation[0], 3),
+            'muestras_por_s': round(num_samples / max(elapsed, 1e-12), 1),
+            'rss_max_bytes': peak_rss_bytes()
+        },
+        'huella': {
+            'calidad': response_data['estados']['calidad']['status'],
+            'tensor': {
+                'ventanas': windows['ventanas'],
+                'suma': windows['suma'],
+                'norma': float(np.sqrt(windows['cuadrados'])),
+                'primera_ventana': fingerprint(windows['primera'])
+            } if windows['ventanas'] else None
+        }
+    }
+
+
+def benchmark_load(csv_content: str, requests: int, concurrency: int,
+                   endpoint: LocalEndpointClient) -> Dict[str, Any]:
+    """
+    Prueba de carga: requests llamadas al handler desde concurrency hilos contra el
+    endpoint local dado (con su latencia y errores inyectados). Retorna throughput,
+    percentiles de latencia y cuántos requests quedaron sin predicción.
+    """
+    ecg_processor.sagemaker_runtime = endpoint
+    event = {'body': json.dumps({'csvContent': csv_content, 'outputs': ['tensor']})}
+    
+    def call(_: int) -> Tuple[float, int, bool]:
+        start = time.perf_counter()
+        response = lambda_handler(event, None)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return elapsed_ms, response['statusCode'], json.loads(response['body']).get('prediccion') is not None
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency, thread_name_prefix='ecg-carga') as pool:
+        results = list(pool.map(call, range(requests)))
+    seconds = time.perf_counter() - start
+    
+    latencies = np.array([elapsed_ms for elapsed_ms, _, _ in results])
+    predicted = sum(has_prediction for _, _, has_prediction in results)
+    return {
+        'requests': requests,
+        'concurrencia': concurrency,
+        'segundos': round(seconds, 3),
+        'requests_por_s': round(requests / seconds, 2),
+        'latencia_ms': {
+            **{f'p{q}': round(float(np.percentile(latencies, q)), 3) for q in (50, 90, 99)},
+            'max': round(float(latencies.max()), 3)
+        },
+        'estados_http': {str(status): count for status, count in sorted(Counter(status for _, status, _ in results).items())},
+        'con_prediccion': predicted,
+        'sin_prediccion': requests - predicted,
+        'endpoint': {
+            'latencia_ms': endpoint.latency_ms,
+            'jitter_ms': endpoint.jitter_ms,
+            **endpoint.rates,
+            'llamadas': endpoint.calls,
+            'errores_inyectados': endpoint.errors
+        }
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Datos del entorno para comparar reportes entre commits y máquinas"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    }
+
+
+def run_benchmark(durations=DEFAULT_DURATIONS, rates=DEFAULT_RATES, noises=tuple(NOISE_LEVELS),
+                  repeat: int = 5, include_examples: bool = True, streaming_hours: float = None,
+                  seed: int = 0) -> Dict[str, Any]:
+    """Ejecuta todos los casos y retorna el reporte"""
+    # Endpoint local sin latencia ni errores, sin cachés de resultados ni de etapas ni líneas de métricas en stdout
+    ecg_processor.sagemaker_runtime = LocalEndpointClient()
+    ecg_processor.result_cache = None
+    ecg_processor.stage_cache = None
+    ecg_instrumentation.METRICS_ENABLED = False
+    
+    cases = []
+    # El registro largo va primero para que el pico de RSS sea el suyo
+    if streaming_hours:
+        cases.append(benchmark_stream(streaming_hours, 500, 'bajo'))
+        print(f"{cases[-1]['nombre']}: {cases[-1]['process_stream']['segundos']} s", file=sys.stderr)
+    
+    if include_examples and os.path.isdir(EXAMPLES_DIR):
+        for name in sorted(os.listdir(EXAMPLES_DIR)):
+            if name.endswith('.csv'):
+                with open(os.path.join(EXAMPLES_DIR, name), encoding='utf-8') as f:
+                    cases.append(benchmark_csv(f'ejemplo_{name}', f.read(), repeat, {'origen': 'public/examples'}))
+                print(f"{cases[-1]['nombre']}: {cases[-1]['lambda_handler']['mediana_ms']} ms", file=sys.stderr)
+    
+    for duration in durations:
+        for fs in rates:
+            for noise in noises:
+                csv_content = synthetic_csv(duration, fs, noise, seed)
+                name = f'sintetico_{duration:g}s_{fs:g}hz_{noise}'
+                # Los casos largos se repiten menos veces
+                case_repeat = max(1, repeat if duration <= 60 else repeat // 2)
+                cases.append(benchmark_csv(name, csv_content, case_repeat,
+                                           {'duracion_s': duration, 'fs': fs, 'ruido': noise, 'semilla': seed}))
+                print(f"{name}: {cases[-1]['lambda_handler']['mediana_ms']} ms", file=sys.stderr)
+    
+    return {'version': REPORT_VERSION, 'entorno': environment(), 'repeticiones': repeat, 'casos': cases}
+
+
+# ----------------------------------------------------------------------------
+# Comparación de reportes
+# ----------------------------------------------------------------------------
+
+def _compare_values(path: str, current: Any, baseline: Any, differences: List[str]) -> None:
+    if isinstance(baseline, dict) and isinstance(current, dict):
+        for key in baseline:
+            _compare_values(f'{path}.{key}', current.get(key), baseline[key], differences)
+    elif isinstance(baseline, list) and isinstance(current, list):
+        if len(baseline) != len(current):
+            differences.append(f'{path}: longitud {len(current)} != {len(baseline)}')
+            return
+        for i, (a, b) in enumerate(zip(current, baseline)):
+            _compare_values(f'{path}[{i}]', a, b, differences)
+    elif isinstance(baseline, float) and isinstance(current, (int, float)):
+        if not abs(current - baseline) <= EQUIVALENCE_ATOL + EQUIVALENCE_RTOL * abs(baseline):
+            differences.append(f'{path}: {current} != {baseline}')
+    elif current != baseline:
+        differences.append(f'{path}: {current!r} != {baseline!r}')
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Compara huellas (equivalencia numérica) y tiempos de extremo a extremo con otro reporte"""
+    baseline_cases = {case['nombre']: case for case in baseline['casos']}
+    comparison: Dict[str, Any] = {'base': baseline.get('entorno', {}).get('commit'), 'casos': {}, 'diferencias': []}
+    for case in current['casos']:
+        previous = baseline_cases.get(case['nombre'])
+        if previous is None:
+            continue
+        differences: List[str] = []
+        _compare_values(case['nombre'], case['huella'], previous['huella'], differences)
+        comparison['diferencias'].extend(differences)
+        
+        timing = 'lambda_handler' if 'lambda_handler' in case else 'process_stream'
+        key = 'mediana_ms' if timing == 'lambda_handler' else 'segundos'
+        if timing in previous and previous[timing].get(key):
+            comparison['casos'][case['nombre']] = {
+                'aceleracion': round(previous[timing][key] / max(case[timing][key], 1e-12), 3),
+                'equivalente': not differences
+            }
+    comparison['equivalente'] = not comparison['diferencias']
+    return comparison
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark del pipeline de ECG de la Lambda')
+    parser.add_argument('--output', '-o', default='-', help='Archivo del reporte JSON (- para stdout)')
+    parser.add_argument('--compare', help='Reporte anterior para verificar equivalencia y comparar tiempos')
+    parser.add_argument('--durations', default=','.join(map(str, DEFAULT_DURATIONS)), help='Duraciones en segundos')
+    parser.add_argument('--rates', default=','.join(map(str, DEFAULT_RATES)), help='Frecuencias de muestreo (Hz)')
+    parser.add_argument('--noise', default=','.join(NOISE_LEVELS), help='Niveles de ruido')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por medición')
+    parser.add_argument('--no-examples', action='store_true', help='No incluir public/examples')
+    parser.add_argument('--streaming-hours', type=float, default=None,
+                        help='Agregar un registro de N horas en modo streaming (p. ej. 24)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--load-requests', type=int, default=0, help='Requests de la prueba de carga (0 = sin prueba de carga)')
+    parser.add_argument('--load-concurrency', type=int, default=8, help='Hilos que llaman al handler en la prueba de carga')
+    parser.add_argument('--load-duration', type=float, default=10, help='Duración en segundos del ECG de la prueba de carga')
+    parser.add_argument('--endpoint-latency-ms', type=float, default=0.0, help='Latencia del endpoint local en la prueba de carga')
+    parser.add_argument('--endpoint-jitter-ms', type=float, default=0.0, help='Variación aleatoria (±) de esa latencia')
+    parser.add_argument('--endpoint-error-rate', type=float, default=0.0, help='Fracción de llamadas con error transitorio (503)')
+    parser.add_argument('--endpoint-model-error-rate', type=float, default=0.0, help='Fracción de llamadas con ModelError (sin reintento)')
+    args = parser.parse_args(argv)
+    
+    report = run_benchmark(
+        durations=[float(d) for d in args.durations.split(',') if d],
+        rates=[float(r) for r in args.rates.split(',') if r],
+        noises=[n for n in args.noise.split(',') if n],
+        repeat=args.repeat,
+        include_examples=not args.no_examples,
+        streaming_hours=args.streaming_hours,
+        seed=args.seed
+    )
+    
+    if args.load_requests:
+        endpoint = LocalEndpointClient(args.endpoint_latency_ms, args.endpoint_jitter_ms, error_rate=args.endpoint_error_rate,
+                                       model_error_rate=args.endpoint_model_error_rate, seed=args.seed)
+        report['carga'] = benchmark_load(synthetic_csv(args.load_duration, 500, 'bajo', args.seed),
+                                         args.load_requests, args.load_concurrency, endpoint)
+        print(f"carga: {report['carga']['requests_por_s']} requests/s, p99 {report['carga']['latencia_ms']['p99']} ms",
+              file=sys.stderr)
+    
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            report['comparacion'] = compare_reports(report, json.load(f))
+        if not report['comparacion']['equivalente']:
+            status = 1
+            for difference in report['comparacion']['diferencias'][:20]:
+                print(f'DIFERENCIA {difference}', file=sys.stderr)
+    
+    text = json.dumps(report, indent=2, default=float)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
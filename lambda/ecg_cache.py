@@ -0,0 +1,299 @@
+"""
+Caché de resultados del pipeline de ECG
+Los resultados se indexan por un hash del CSV y de los parámetros del pipeline, así un
+mismo archivo subido de nuevo no se vuelve a parsear, filtrar ni enviar a SageMaker.
+Hay una capa LRU en memoria (contenedores calientes) y un backend persistente
+intercambiable (FileSystemBackend para disco local, /tmp o EFS).
+
+Además, la caché de etapas memoriza la salida de cada etapa por la clave de su entrada
+más sus propios parámetros: si solo cambia un parámetro de una etapa (p. ej. la
+frecuencia del notch), las anteriores se reutilizan y solo se recalculan esa y las siguientes.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger()
+
+
+def cache_key(csv_content: str, parameters: Dict[str, Any]) -> str:
+    """Clave de contenido: SHA-256 del CSV más los parámetros del pipeline"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(csv_content.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def stage_key(parent: str, name: str, parameters: Any = None) -> str:
+    """Clave de una etapa: hash de la clave de su entrada, su nombre y sus parámetros"""
+    digest = hashlib.sha256()
+    digest.update(parent.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps([name, parameters], sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def read_only(value: Any) -> Any:
+    """Marca como de solo lectura los arrays de un valor memorizado (se comparten entre requests)"""
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, dict):
+        for item in value.values():
+            read_only(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            read_only(item)
+    return value
+
+
+def _entry_size(value: Any) -> int:
+    """Tamaño aproximado en bytes de un resultado (arrays + estructura)"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return 64 + sum(_entry_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return 64 + sum(_entry_size(v) for v in value)
+    return 32
+
+
+def _pack(value: Any, arrays: Dict[str, np.ndarray]) -> Any:
+    """Reemplaza los arrays por referencias para guardar la estructura como JSON"""
+    if isinstance(value, np.ndarray):
+        name = f'a{len(arrays)}'
+        arrays[name] = value
+        return {'__ndarray__': name}
+    if isinstance(value, dict):
+        return {k: _pack(v, arrays) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_pack(v, arrays) for v in value]
+    return value
+
+
+def _unpack(value: Any, arrays: Dict[str, np.ndarray]) -> Any:
+    """Inverso de _pack"""
+    if isinstance(value, dict):
+        if set(value) == {'__ndarray__'}:
+            return arrays[value['__ndarray__']]
+        return {k: _unpack(v, arrays) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_unpack(v, arrays) for v in value]
+    return value
+
+
+class LRUCache:
+    """Caché en memoria con desalojo LRU por cantidad de entradas y bytes, y TTL"""
+    
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[str, Tuple[float, int, Any]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key: str, value: Any, ttl_seconds: float = None) -> None:
+        """Guarda value por ttl_seconds (por defecto el TTL de la caché)"""
+        size = _entry_size(value)
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if size > self.max_bytes or ttl_seconds <= 0:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (time.time() + ttl_seconds, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CacheBackend:
+    """Interfaz de los backends persistentes de la caché"""
+    
+    def get_entry(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """(valor, instante en que vence) o None si no está o ya venció"""
+        raise NotImplementedError
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+    
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class FileSystemBackend(CacheBackend):
+    """
+    Backend en disco: un archivo .npz por entrada (arrays + estructura JSON, sin pickle)
+    
+    Las entradas vencen por TTL según su fecha de modificación (la de escritura: las
+    lecturas no la cambian) y, si el directorio supera max_bytes, se borran las menos
+    usadas recientemente según su fecha de acceso, que se actualiza en cada lectura.
+    """
+    
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024,
+                 ttl_seconds: float = 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.npz')
+    
+    def get_entry(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        path = self._path(key)
+        try:
+            written = os.path.getmtime(path)
+            if time.time() - written > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            # Marcar como usada recientemente para el desalojo (solo la fecha de acceso:
+            # la de modificación sigue siendo la de escritura y define el vencimiento)
+            os.utime(path, (time.time(), written))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Entrada de caché ilegible {key}: {str(e)}")
+            return None
+        structure = json.loads(arrays.pop('__structure__').tobytes().decode('utf-8'))
+        return _unpack(structure, arrays), written + self.ttl_seconds
+    
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        arrays: Dict[str, np.ndarray] = {}
+        structure = json.dumps(_pack(value, arrays)).encode('utf-8')
+        buffer = io.BytesIO()
+        np.savez(buffer, __structure__=np.frombuffer(structure, dtype=np.uint8), **arrays)
+        
+        # Escritura atómica: archivo temporal + rename
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+    
+    def _evict(self) -> None:
+        """Borra entradas vencidas y, si hace falta, las menos usadas hasta entrar en max_bytes"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl_seconds:
+                os.remove(path)
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class ResultCache:
+    """Caché de dos niveles: LRU en memoria y backend persistente opcional"""
+    
+    def __init__(self, memory: LRUCache = None, backend: CacheBackend = None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.backend = backend
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None and self.backend is not None:
+            entry = self.backend.get_entry(key)
+            if entry is not None:
+                # En memoria solo por lo que le queda en el backend
+                value, expires_at = entry
+                self.memory.put(key, value, expires_at - time.time())
+        return value
+    
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.put(key, value)
+        if self.backend is not None:
+            try:
+                self.backend.put(key, value)
+            except Exception as e:
+                logger.warning(f"No se pudo guardar en la caché persistente: {str(e)}")
+
+
+def result_cache_from_env() -> Optional[ResultCache]:
+    """
+    Crea la caché según variables de entorno:
+    ECG_CACHE_ENABLED, ECG_CACHE_MAX_ENTRIES, ECG_CACHE_MAX_BYTES, ECG_CACHE_TTL_SECONDS
+    y, para el backend en disco, ECG_CACHE_DIR y ECG_CACHE_DIR_MAX_BYTES
+    """
+    if os.environ.get('ECG_CACHE_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    
+    ttl_seconds = float(os.environ.get('ECG_CACHE_TTL_SECONDS', 3600))
+    memory = LRUCache(
+        max_entries=int(os.environ.get('ECG_CACHE_MAX_ENTRIES', 64)),
+        max_bytes=int(os.environ.get('ECG_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+        ttl_seconds=ttl_seconds
+    )
+    
+    backend = None
+    directory = os.environ.get('ECG_CACHE_DIR')
+    if directory:
+        backend = FileSystemBackend(
+            directory,
+            max_bytes=int(os.environ.get('ECG_CACHE_DIR_MAX_BYTES', 512 * 1024 * 1024)),
+            ttl_seconds=ttl_seconds
+        )
+    return ResultCache(memory, backend)
+
+
+def stage_cache_from_env() -> Optional[LRUCache]:
+    """
+    Caché en memoria de salidas por etapa según ECG_STAGE_CACHE_ENABLED,
+    ECG_STAGE_CACHE_MAX_ENTRIES, ECG_STAGE_CACHE_MAX_BYTES y ECG_CACHE_TTL_SECONDS
+    """
+    if os.environ.get('ECG_STAGE_CACHE_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    return LRUCache(
+        max_entries=int(os.environ.get('ECG_STAGE_CACHE_MAX_ENTRIES', 256)),
+        max_bytes=int(os.environ.get('ECG_STAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+        ttl_seconds=float(os.environ.get('ECG_CACHE_TTL_SECONDS', 3600))
+    )
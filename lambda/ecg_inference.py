@@ -0,0 +1,182 @@
+"""
+Cliente de inferencia para el endpoint de SageMaker
+Envuelve el cliente de boto3 con timeouts explícitos, un pool de conexiones dimensionado
+para las llamadas concurrentes, reintentos acotados con backoff exponencial (solo ante
+errores transitorios), hedging opcional (una segunda llamada idéntica si la primera
+tarda más que un umbral) y envío concurrente de varios payloads con un pool de hilos.
+Con ECG_INFERENCE_ENDPOINT_URL se puede apuntar a un servidor HTTP local que imite el
+endpoint (rutas /endpoints/<nombre>/invocations, ver ecg_local_endpoint) y con
+ECG_INFERENCE_BACKEND se reemplaza el cliente de boto3 por otro backend.
+"""
+
+import importlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger()
+
+CONNECT_TIMEOUT_S = float(os.environ.get('ECG_INFERENCE_CONNECT_TIMEOUT', 2))
+# Un endpoint serverless en frío puede tardar decenas de segundos en responder
+READ_TIMEOUT_S = float(os.environ.get('ECG_INFERENCE_READ_TIMEOUT', 60))
+MAX_ATTEMPTS = int(os.environ.get('ECG_INFERENCE_MAX_ATTEMPTS', 3))
+BACKOFF_BASE_S = float(os.environ.get('ECG_INFERENCE_BACKOFF_BASE', 0.2))
+BACKOFF_MAX_S = float(os.environ.get('ECG_INFERENCE_BACKOFF_MAX', 2))
+# 0 desactiva el hedging
+HEDGE_AFTER_MS = float(os.environ.get('ECG_INFERENCE_HEDGE_AFTER_MS', 0))
+CONCURRENCY = int(os.environ.get('ECG_INFERENCE_CONCURRENCY', 4))
+ENDPOINT_URL = os.environ.get('ECG_INFERENCE_ENDPOINT_URL') or None
+# 'sagemaker' (boto3), 'local' (modelo liviano en el proceso, sin AWS) o 'modulo:Clase' de
+# un cliente propio con el método invoke_endpoint(EndpointName, ContentType, Body) de boto3
+BACKEND = os.environ.get('ECG_INFERENCE_BACKEND', 'sagemaker')
+
+# Códigos de error de SageMaker Runtime que indican un problema transitorio
+RETRYABLE_ERROR_CODES = ('ThrottlingException', 'ServiceUnavailable', 'InternalFailure', 'ModelNotReadyException')
+
+
+def client_config():
+    """Configuración de botocore: timeouts, pool de conexiones y sin reintentos propios (los maneja InferenceClient)"""
+    from botocore.config import Config
+    return Config(
+        connect_timeout=CONNECT_TIMEOUT_S,
+        read_timeout=READ_TIMEOUT_S,
+        # Cada payload puede tener en vuelo la llamada original y un hedge
+        max_pool_connections=max(10, 2 * CONCURRENCY),
+        retries={'total_max_attempts': 1, 'mode': 'standard'}
+    )
+
+
+def create_backend_client(backend: str = BACKEND) -> Any:
+    """Cliente de un backend distinto de SageMaker ('local' o 'modulo:Clase'); ValueError si no es válido"""
+    if backend == 'local':
+        from ecg_local_endpoint import LocalEndpointClient
+        return LocalEndpointClient.from_env()
+    module_name, _, class_name = backend.partition(':')
+    if not module_name or not class_name:
+        raise ValueError(f"ECG_INFERENCE_BACKEND no válido: {backend} (sagemaker, local o modulo:Clase)")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def is_retryable(error: Exception) -> bool:
+    """Errores de conexión/timeout, throttling y 5xx; los 4xx (payload inválido, error del modelo) no"""
+    try:
+        from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
+    except ImportError:
+        BotoConnectionError = HTTPClientError = ()
+    if isinstance(error, (BotoConnectionError, HTTPClientError, TimeoutError, ConnectionError)):
+        return True
+    
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    code = response.get('Error', {}).get('Code')
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    return code in RETRYABLE_ERROR_CODES or status == 429 or status >= 500
+
+
+class InferenceClient:
+    """Llamadas al endpoint con reintentos, hedging y envío concurrente"""
+    
+    def __init__(self, client_factory: Callable[[], Any], max_attempts: int = MAX_ATTEMPTS,
+                 backoff_base: float = BACKOFF_BASE_S, backoff_max: float = BACKOFF_MAX_S,
+                 hedge_after_ms: float = HEDGE_AFTER_MS, concurrency: int = CONCURRENCY):
+        # La fábrica se consulta en cada llamada: así se respeta un cliente reemplazado (tests, benchmark)
+        self.client_factory = client_factory
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms > 0 else None
+        self.concurrency = max(1, concurrency)
+        self._lock = threading.Lock()
+        self._calls: Optional[ThreadPoolExecutor] = None
+        self._fanout: Optional[ThreadPoolExecutor] = None
+    
+    def _executors(self) -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+        """Pools separados para payloads y llamadas HTTP (un payload espera a sus llamadas sin bloquear el pool)"""
+        with self._lock:
+            if self._calls is None:
+                self._calls = ThreadPoolExecutor(2 * self.concurrency, thread_name_prefix='ecg-inference')
+                self._fanout = ThreadPoolExecutor(self.concurrency, thread_name_prefix='ecg-fanout')
+        return self._calls, self._fanout
+    
+    def _call(self, endpoint_name: str, body: bytes) -> Dict[str, Any]:
+        """Una llamada HTTP al endpoint; retorna la respuesta JSON"""
+        response = self.client_factory().invoke_endpoint(
+            EndpointName=endpoint_name,
+            ContentType='application/json',
+            Body=body
+        )
+        return json.loads(response['Body'].read().decode('utf-8'))
+    
+    def _attempt(self, endpoint_name: str, body: bytes, stats: Dict[str, int]) -> Dict[str, Any]:
+        """Un intento: si no hay respuesta tras el umbral de hedging se lanza una segunda llamada y gana la primera que responda bien"""
+        stats['intentos'] += 1
+        if self.hedge_after is None:
+            return self._call(endpoint_name, body)
+        
+        self.client_factory()
+        calls, _ = self._executors()
+        pending = {calls.submit(self._call, endpoint_name, body)}
+        done, pending = wait(pending, timeout=self.hedge_after)
+        if not done:
+            stats['hedges'] += 1
+            pending.add(calls.submit(self._call, endpoint_name, body))
+        
+        error = None
+        while done or pending:
+            for future in done:
+                try:
+                    # La llamada perdedora termina en segundo plano y su respuesta se descarta
+                    return future.result()
+                except Exception as e:
+                    error = e
+            done, pending = wait(pending, return_when=FIRST_COMPLETED) if pending else (set(), set())
+        raise error
+    
+    def invoke(self, endpoint_name: str, body: bytes) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """Invoca el endpoint con reintentos acotados; retorna (respuesta, {'intentos', 'hedges'})"""
+        stats = {'intentos': 0, 'hedges': 0}
+        for attempt in range(self.max_attempts):
+            try:
+                return self._attempt(endpoint_name, body, stats), stats
+            except Exception as e:
+                if attempt + 1 >= self.max_attempts or not is_retryable(e):
+                    raise
+                # Backoff exponencial con jitter para no sincronizar reintentos de contenedores distintos
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1)
+                logger.warning(f"Reintentando el endpoint en {delay:.2f}s ({attempt + 1}/{self.max_attempts}): {str(e)}")
+                time.sleep(delay)
+    
+    def invoke_many(self, requests: List[Tuple[str, bytes]],
+                    return_exceptions: bool = False) -> Tuple[List[Any], Dict[str, int]]:
+        """
+        Invoca varios (endpoint, body) en paralelo; retorna las respuestas en el mismo orden
+        y las estadísticas sumadas. Si una llamada falla tras los reintentos se propaga el
+        error, o con return_exceptions=True se devuelve la excepción en su lugar.
+        """
+        def invoke(request: Tuple[str, bytes]) -> Tuple[Any, Dict[str, int]]:
+            try:
+                return self.invoke(*request)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e, {'intentos': 0, 'hedges': 0}
+        
+        if len(requests) == 1:
+            results = [invoke(requests[0])]
+        else:
+            # El cliente de boto3 se crea antes de repartir en hilos (su creación no es thread-safe)
+            self.client_factory()
+            _, fanout = self._executors()
+            results = list(fanout.map(invoke, requests))
+        
+        totals = {'intentos': 0, 'hedges': 0}
+        for _, stats in results:
+            for key, value in stats.items():
+                totals[key] += value
+        return [response for response, _ in results], totals
@@ -0,0 +1,190 @@
+"""
+Instrumentación por etapa del pipeline de ECG
+Registra tiempo de pared, tiempo de CPU y (opcionalmente) pico de memoria asignada de
+cada etapa, y los emite como una línea JSON en formato EMF (CloudWatch Embedded Metric
+Format) por request. Las etapas se marcan con `with stage('filtrado'):`; si no hay un
+registro activo, stage no hace nada. El registro del request mide además el pico de
+memoria residente del propio request (no el del proceso desde el arranque).
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, Iterator, List, Optional
+
+METRICS_NAMESPACE = os.environ.get('ECG_METRICS_NAMESPACE', 'ECGPipeline')
+METRICS_ENABLED = os.environ.get('ECG_METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+# tracemalloc agrega overhead a cada asignación: solo si se pide explícitamente
+TRACE_MEMORY = os.environ.get('ECG_TRACE_MEMORY', 'false').lower() in ('1', 'true', 'yes')
+
+_current: 'contextvars.ContextVar[Optional[StageRecorder]]' = contextvars.ContextVar('ecg_stage_recorder', default=None)
+
+
+def peak_rss_bytes() -> int:
+    """Pico de memoria residente del proceso (ru_maxrss está en KB en Linux)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def rss_status() -> Dict[str, int]:
+    """Memoria residente actual (VmRSS) y pico desde el último reinicio (VmHWM), en bytes; {} fuera de Linux"""
+    try:
+        with open('/proc/self/status') as status:
+            values = dict(line.split(':', 1) for line in status if line.startswith(('VmRSS', 'VmHWM')))
+    except OSError:
+        return {}
+    return {name: int(value.split()[0]) * 1024 for name, value in values.items()}
+
+
+def reset_peak_rss() -> bool:
+    """Reinicia el pico de memoria residente del proceso (VmHWM); False si el kernel no lo permite"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class StageRecorder:
+    """
+    Mediciones de las etapas de un request. Con request_memory reinicia el pico de
+    memoria residente al empezar, así rss_pico_bytes es el pico de este request; si el
+    kernel no lo permite se usa ru_maxrss, que solo vale si el request superó el pico previo.
+    """
+    
+    def __init__(self, trace_memory: bool = False, request_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.reused: List[str] = []
+        self._request_memory = request_memory
+        if request_memory:
+            self._peak_reset = reset_peak_rss()
+            self._rss_start = rss_status().get('VmRSS')
+            self._maxrss_start = peak_rss_bytes()
+        self._start = time.perf_counter()
+    
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Mide una etapa; si se repite el nombre, los tiempos se acumulan"""
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            measurement = self.stages.setdefault(name, {'wall_ms': 0.0, 'cpu_ms': 0.0})
+            measurement['wall_ms'] += (time.perf_counter() - wall_start) * 1000
+            measurement['cpu_ms'] += (time.process_time() - cpu_start) * 1000
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - memory_start
+                measurement['peak_bytes'] = max(measurement.get('peak_bytes', 0), peak)
+    
+    def request_memory(self) -> Dict[str, int]:
+        """RSS al empezar el request y pico durante el request (sin pico si no se pudo medir)"""
+        if not self._request_memory:
+            return {}
+        memory = {} if self._rss_start is None else {'rss_inicio_bytes': self._rss_start}
+        peak = rss_status().get('VmHWM') if self._peak_reset else None
+        if peak is None and peak_rss_bytes() > self._maxrss_start:
+            peak = peak_rss_bytes()
+        if peak is not None:
+            memory['rss_pico_bytes'] = peak
+        return memory
+    
+    def summary(self) -> Dict[str, Any]:
+        """Bloque `timings` de la respuesta (valores redondeados)"""
+        stages = {name: {key: round(value, 3) if key != 'peak_bytes' else int(value)
+                         for key, value in measurement.items()}
+                  for name, measurement in self.stages.items()}
+        summary = {
+            'etapas': stages,
+            'total_ms': round((time.perf_counter() - self._start) * 1000, 3),
+            'rss_max_bytes': peak_rss_bytes(),
+            **self.request_memory()
+        }
+        if self.reused:
+            summary['etapas_reutilizadas'] = list(self.reused)
+        return summary
+    
+    def emf_record(self, dimensions: Dict[str, str] = None, properties: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Registro EMF: una métrica por etapa y medición (p. ej. filtrado_wall_ms)"""
+        dimensions = dimensions or {}
+        record: Dict[str, Any] = dict(properties or {})
+        record.update(dimensions)
+        metrics: List[Dict[str, str]] = []
+        
+        for name, measurement in self.stages.items():
+            for key, value in measurement.items():
+                metric = f'{name}_{key}'
+                unit = 'Bytes' if key == 'peak_bytes' else 'Milliseconds'
+                metrics.append({'Name': metric, 'Unit': unit})
+                record[metric] = round(value, 3)
+        record['total_ms'] = round((time.perf_counter() - self._start) * 1000, 3)
+        record['rss_max_bytes'] = peak_rss_bytes()
+        memory = self.request_memory()
+        record.update(memory)
+        if self.reused:
+            record['etapas_reutilizadas'] = list(self.reused)
+        metrics.append({'Name': 'total_ms', 'Unit': 'Milliseconds'})
+        metrics.append({'Name': 'rss_max_bytes', 'Unit': 'Bytes'})
+        metrics.extend({'Name': name, 'Unit': 'Bytes'} for name in memory)
+        
+        record['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': metrics
+            }]
+        }
+        return record
+    
+    def emit(self, dimensions: Dict[str, str] = None, properties: Dict[str, Any] = None) -> None:
+        """Escribe el registro EMF en stdout (CloudWatch Logs extrae las métricas)"""
+        if METRICS_ENABLED:
+            print(json.dumps(self.emf_record(dimensions, properties), default=str), flush=True)
+
+
+@contextlib.contextmanager
+def recording(trace_memory: bool = TRACE_MEMORY, request_memory: bool = False) -> Iterator[StageRecorder]:
+    """
+    Activa un StageRecorder para las etapas ejecutadas dentro del bloque (request_memory:
+    mide el pico de memoria del request; solo el registro del handler, no los anidados)
+    """
+    recorder = StageRecorder(trace_memory, request_memory)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+        if started_tracing:
+            tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Mide una etapa en el registro activo (no hace nada si no hay ninguno)"""
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    with recorder.stage(name):
+        yield
+
+
+def mark_reused(name: str) -> None:
+    """Registra que una etapa reutilizó un resultado memorizado (no hace nada sin registro activo)"""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.reused.append(name)
@@ -0,0 +1,198 @@
+"""
+Endpoint de inferencia local (sin AWS)
+Imita el contrato del endpoint de SageMaker ({"signals": [ventanas]} → {"probability":
+[una por ventana]}) con un modelo liviano determinista, latencia configurable e inyección
+de errores, para pruebas offline y pruebas de carga del handler. Se usa de dos formas:
+- En el proceso: ECG_INFERENCE_BACKEND=local reemplaza al cliente de boto3 por
+  LocalEndpointClient (configurado con las variables ECG_LOCAL_*).
+- Como servidor HTTP: con ECG_INFERENCE_ENDPOINT_URL=http://localhost:8080 el cliente de
+  boto3 llama a /endpoints/<nombre>/invocations como en SageMaker (reintentos, hedging y
+  timeouts incluidos).
+
+Uso:
+    python ecg_local_endpoint.py --port 8080 --latency-ms 80 --jitter-ms 20 --error-rate 0.02
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger()
+
+# Errores inyectados: (código de SageMaker Runtime, estado HTTP). Los dos primeros son
+# transitorios (el cliente reintenta); ModelError no se reintenta y deja sin predicción
+INJECTED_ERRORS = {
+    'error_rate': ('ServiceUnavailable', 503),
+    'throttle_rate': ('ThrottlingException', 429),
+    'model_error_rate': ('ModelError', 424)
+}
+
+INVOCATIONS_PATH = re.compile(r'^/endpoints/([^/]+)/invocations$')
+
+
+class EndpointError(Exception):
+    """Error del endpoint con la misma forma que ClientError de botocore (atributo response)"""
+    
+    def __init__(self, code: str, status: int, message: str):
+        super().__init__(f'{code}: {message}')
+        self.response = {'Error': {'Code': code, 'Message': message},
+                         'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+def predict_probabilities(windows: np.ndarray) -> np.ndarray:
+    """Modelo liviano: probabilidad por ventana a partir de su energía (sensible a cualquier cambio del tensor)"""
+    energy = windows.std(axis=(1, 2))
+    return 1 / (1 + np.exp(-(energy - 0.15) * 20))
+
+
+class LocalEndpoint:
+    """Modelo local con latencia (fija, aleatoria y por ventana) e inyección de errores"""
+    
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, per_window_ms: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, model_error_rate: float = 0.0,
+                 seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_window_ms = per_window_ms
+        self.rates = {'error_rate': error_rate, 'throttle_rate': throttle_rate, 'model_error_rate': model_error_rate}
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls) -> 'LocalEndpoint':
+        """
+        Configuración desde las variables ECG_LOCAL_* (LATENCY_MS, JITTER_MS, PER_WINDOW_MS,
+        ERROR_RATE, THROTTLE_RATE, MODEL_ERROR_RATE y SEED)
+        """
+        seed = os.environ.get('ECG_LOCAL_SEED')
+        return cls(latency_ms=float(os.environ.get('ECG_LOCAL_LATENCY_MS', 0)),
+                   jitter_ms=float(os.environ.get('ECG_LOCAL_JITTER_MS', 0)),
+                   per_window_ms=float(os.environ.get('ECG_LOCAL_PER_WINDOW_MS', 0)),
+                   error_rate=float(os.environ.get('ECG_LOCAL_ERROR_RATE', 0)),
+                   throttle_rate=float(os.environ.get('ECG_LOCAL_THROTTLE_RATE', 0)),
+                   model_error_rate=float(os.environ.get('ECG_LOCAL_MODEL_ERROR_RATE', 0)),
+                   seed=int(seed) if seed else None)
+    
+    def _draw(self) -> Tuple[Optional[Tuple[str, int]], float]:
+        """Sorteo de la llamada: (error inyectado o None, demora aleatoria en segundos)"""
+        with self._lock:
+            self.calls += 1
+            draw = self._random.random()
+            jitter = self._random.uniform(-1, 1) * self.jitter_ms
+            for name, rate in self.rates.items():
+                if draw < rate:
+                    self.errors += 1
+                    return INJECTED_ERRORS[name], jitter / 1000
+                draw -= rate
+        return None, jitter / 1000
+    
+    def invoke(self, endpoint_name: str, body: bytes) -> Dict[str, Any]:
+        """Una invocación: {"probability": [...]} o EndpointError (inyectado o payload inválido)"""
+        error, jitter = self._draw()
+        try:
+            windows = np.asarray(json.loads(body)['signals'], dtype=np.float64)
+        except (ValueError, KeyError, TypeError) as e:
+            raise EndpointError('ValidationError', 400, f'Payload inválido: {str(e)}')
+        if windows.ndim != 3:
+            raise EndpointError('ValidationError', 400, f'signals debe ser [ventanas, muestras, canales], no {list(windows.shape)}')
+        
+        time.sleep(max(0.0, self.latency_ms / 1000 + jitter + self.per_window_ms * windows.shape[0] / 1000))
+        if error is not None:
+            raise EndpointError(*error, f'Error inyectado en {endpoint_name}')
+        return {'probability': predict_probabilities(windows).tolist()}
+
+
+class LocalEndpointClient(LocalEndpoint):
+    """Reemplazo del cliente sagemaker-runtime de boto3 (mismo método invoke_endpoint)"""
+    
+    def invoke_endpoint(self, EndpointName: str, ContentType: str, Body: bytes) -> Dict[str, Any]:
+        response = self.invoke(EndpointName, Body)
+        return {'Body': io.BytesIO(json.dumps(response).encode('utf-8'))}
+
+
+def make_server(endpoint: LocalEndpoint, host: str = '127.0.0.1', port: int = 8080) -> ThreadingHTTPServer:
+    """
+    Servidor HTTP con las rutas de SageMaker: POST /endpoints/<nombre>/invocations y
+    GET /ping. Los errores llevan el código en x-amzn-ErrorType, como el runtime real
+    (boto3 los convierte en ClientError con ese código y estado HTTP).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: Dict[str, Any], error_code: str = None) -> None:
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if error_code:
+                self.send_header('x-amzn-ErrorType', error_code)
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_GET(self):
+            if self.path == '/ping':
+                self._send(200, {'status': 'OK'})
+            else:
+                self._send(404, {'message': f'Ruta desconocida: {self.path}'}, 'ValidationError')
+        
+        def do_POST(self):
+            match = INVOCATIONS_PATH.match(self.path)
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if match is None:
+                self._send(404, {'message': f'Ruta desconocida: {self.path}'}, 'ValidationError')
+                return
+            try:
+                self._send(200, endpoint.invoke(match.group(1), body))
+            except EndpointError as e:
+                self._send(e.response['ResponseMetadata']['HTTPStatusCode'],
+                           {'message': e.response['Error']['Message']}, e.response['Error']['Code'])
+        
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(format, *args)
+    
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Endpoint de inferencia local con el contrato de SageMaker')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latencia fija por llamada')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Variación aleatoria (±) de la latencia')
+    parser.add_argument('--per-window-ms', type=float, default=0.0, help='Latencia adicional por ventana del lote')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de llamadas con 503 ServiceUnavailable')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fracción de llamadas con 429 ThrottlingException')
+    parser.add_argument('--model-error-rate', type=float, default=0.0, help='Fracción de llamadas con 424 ModelError')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    
+    endpoint = LocalEndpoint(args.latency_ms, args.jitter_ms, args.per_window_ms, args.error_rate,
+                             args.throttle_rate, args.model_error_rate, args.seed)
+    server = make_server(endpoint, args.host, args.port)
+    print(f'Endpoint local en http://{args.host}:{server.server_address[1]} '
+          f'(ECG_INFERENCE_ENDPOINT_URL=http://{args.host}:{server.server_address[1]})', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f'{endpoint.calls} llamadas, {endpoint.errors} errores inyectados', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
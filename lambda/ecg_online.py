@@ -0,0 +1,264 @@
+"""
+Procesamiento en línea de ECG (sesiones para monitores en vivo)
+Una OnlineSession recibe bloques de muestras a medida que llegan: el filtrado (notch +
+pasa banda) y el remuestreo arrastran su estado entre bloques y se mantiene una ventana
+móvil de input_length muestras a la fs del modelo (2000 = 10 s a 200 Hz). Cada hop
+muestras se emite el tensor de la ventana y su predicción, con trabajo proporcional al
+bloque en cada push en lugar de reprocesar el registro completo.
+
+Como en el modo streaming el filtrado es causal. La normalización se calcula sobre cada
+ventana (en línea no se conoce el registro completo), después del remuestreo.
+
+Uso (reproduce un CSV como si llegara del monitor, una línea JSON por ventana):
+    python ecg_online.py registro.csv --block-ms 250 --hop-s 2
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from ecg_instrumentation import stage
+from ecg_processor import (
+    PRECISIONS,
+    SQI_MAX_INVALID_FRACTION,
+    apply_sos,
+    design_filter_bank,
+    filter_parameters,
+    invoke_records,
+    lead_channels,
+    normalize_signal,
+    parse_csv_content,
+    request_leads,
+    resolve_models,
+    signal_precision,
+    valid_mask,
+)
+from ecg_stream import StreamResampler
+
+logger = logging.getLogger()
+
+# Avance por defecto entre ventanas emitidas (windowHop, en muestras, lo reemplaza)
+ONLINE_HOP_S = float(os.environ.get('ECG_ONLINE_HOP_S', 2))
+
+
+class OnlineSession:
+    """
+    Sesión de procesamiento en línea de un monitor. request_data admite las mismas
+    opciones del pipeline que un request (modelId, leads, filtros, windowHop, precision);
+    los modelos de la sesión deben compartir target_fs e input_length.
+    """
+    
+    def __init__(self, fs: float, request_data: Dict[str, Any] = None, predict: bool = True):
+        request_data = request_data or {}
+        self.models = resolve_models(request_data.get('modelId'))
+        self.leads = request_leads(request_data, self.models)
+        shapes = {(model['target_fs'], model['input_length']) for _, model in self.models}
+        if len(shapes) > 1:
+            raise ValueError('Los modelos de una sesión deben tener la misma target_fs e input_length')
+        self.target_fs, self.window_length = shapes.pop()
+        hop = request_data.get('windowHop')
+        self.hop = int(hop) if hop and int(hop) > 0 else max(1, int(round(ONLINE_HOP_S * self.target_fs)))
+        self.fs = float(fs)
+        if not self.fs > 0:
+            raise ValueError(f'fs debe ser positiva: {fs}')
+        self.predict = predict
+        self.dtype = PRECISIONS[signal_precision(request_data)]
+        
+        self._sos, self.filtros = design_filter_bank(self.fs, dict(filter_parameters(request_data), zero_phase=False))
+        self._filter_states = None
+        self._resampler = StreamResampler(self.fs, self.target_fs)
+        self._last_valid = np.zeros(len(self.leads))
+        # Últimas muestras resampleadas (hasta una ventana) y fin de la próxima ventana a emitir
+        self._window = np.zeros((0, len(self.leads)), dtype=self.dtype)
+        self._next_end = self.window_length
+        # Muestras de entrada con algún valor inválido, desde el índice _flags_start
+        self._invalid_flags = np.zeros(0, dtype=bool)
+        self._flags_start = 0
+        
+        self.samples = 0
+        self.windows = 0
+        self.predictions = 0
+    
+    def push(self, block: Any) -> List[Dict[str, Any]]:
+        """
+        Agrega un bloque [muestras, derivaciones] (en el orden de leads) y retorna las
+        ventanas que se completaron (normalmente ninguna o una). ValueError si la forma
+        del bloque no corresponde a las derivaciones de la sesión.
+        """
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim == 1 and len(self.leads) == 1:
+            block = block[:, np.newaxis]
+        if block.ndim != 2 or block.shape[1] != len(self.leads):
+            raise ValueError(f'El bloque debe ser [muestras, {len(self.leads)}] ({", ".join(self.leads)}), '
+                             f'no {list(block.shape)}')
+        if block.shape[0] == 0:
+            return []
+        
+        with stage('filtrado'):
+            valid = valid_mask(block)
+            invalid = ~valid.all(axis=1)
+            if invalid.any():
+                block = self._hold_last_valid(block, valid)
+            self._last_valid = block[-1]
+            filtered, self._filter_states = apply_sos(self._sos, block, self._filter_states)
+        self._invalid_flags = np.concatenate([self._invalid_flags, invalid])
+        self.samples += block.shape[0]
+        with stage('resampling'):
+            resampled = self._resampler.push(filtered)
+        return self._emit(resampled)
+    
+    def flush(self) -> List[Dict[str, Any]]:
+        """Fin de la señal: remuestrea las últimas muestras y emite las ventanas pendientes"""
+        if self.samples == 0:
+            return []
+        return self._emit(self._resampler.finish())
+    
+    def status(self) -> Dict[str, Any]:
+        """Resumen de la sesión: muestras recibidas, ventanas emitidas y configuración"""
+        return {
+            'fs': self.fs,
+            'derivaciones': list(self.leads),
+            'muestras': self.samples,
+            'duracion_s': round(self.samples / self.fs, 3),
+            'ventanas': self.windows,
+            'predicciones': self.predictions,
+            'hop_s': round(self.hop / self.target_fs, 3),
+            'filtros_aplicados': list(self.filtros),
+            'resampling': self._resampler.metodo or 'ninguno'
+        }
+    
+    def _hold_last_valid(self, block: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        """
+        Reemplaza cada valor inválido por el último válido de su canal: un NaN dejaría
+        al filtro recursivo inválido para el resto de la sesión
+        """
+        rows = np.arange(block.shape[0])[:, np.newaxis]
+        last = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+        held = block[np.maximum(last, 0), np.arange(block.shape[1])]
+        return np.where(last >= 0, held, self._last_valid)
+    
+    def _invalid_fraction(self, start: int, end: int) -> float:
+        """Fracción de muestras de entrada con valores inválidos en la ventana resampleada [start, end)"""
+        first = max(int(start * self.fs / self.target_fs) - self._flags_start, 0)
+        last = max(int(np.ceil(end * self.fs / self.target_fs)) - self._flags_start, first + 1)
+        flags = self._invalid_flags[first:last]
+        return float(flags.mean()) if flags.size else 0.0
+    
+    def _emit(self, resampled: np.ndarray) -> List[Dict[str, Any]]:
+        """Ventanas que cierran con las muestras resampleadas nuevas (tensor y predicción)"""
+        history = np.concatenate([self._window, resampled.astype(self.dtype, copy=False)])
+        produced = self._resampler.next_output
+        history_start = produced - history.shape[0]
+        
+        events = []
+        windows = []
+        while self._next_end <= produced:
+            end = self._next_end
+            start = end - self.window_length
+            window = history[start - history_start:end - history_start]
+            invalid = self._invalid_fraction(start, end)
+            calidad = {'status': 'OK', 'invalidos': round(invalid, 4)}
+            if invalid > SQI_MAX_INVALID_FRACTION:
+                calidad.update(status='RECHAZADA', mensaje=f'Demasiados valores inválidos: {invalid:.1%}')
+            event = {'ventana': self.windows, 'inicio_s': start / self.target_fs,
+                     'fin_s': end / self.target_fs, 'calidad': calidad}
+            if calidad['status'] == 'OK':
+                with stage('normalizacion'):
+                    event['model_inputs'] = self._model_inputs(window)
+                windows.append(event)
+            events.append(event)
+            self.windows += 1
+            self._next_end += self.hop
+        
+        if windows and self.predict:
+            with stage('inferencia'):
+                results, _ = invoke_records(self.models, [event['model_inputs'] for event in windows])
+            for event, (prediccion, modelo_info) in zip(windows, results):
+                event['prediccion'], event['modelo'] = prediccion, modelo_info
+                self.predictions += prediccion is not None
+        
+        self._window = history[-self.window_length:].copy()
+        # Solo hacen falta las marcas de inválidos desde el inicio de la próxima ventana
+        drop = int((self._next_end - self.window_length) * self.fs / self.target_fs) - self._flags_start
+        if drop > 0:
+            self._invalid_flags = self._invalid_flags[drop:]
+            self._flags_start += drop
+        return events
+    
+    def _model_inputs(self, window: np.ndarray) -> Dict[str, np.ndarray]:
+        """Tensor [1, input_length, canales] de cada modelo, normalizado sobre la ventana"""
+        inputs = {}
+        normalized = {}
+        for model_id, model in self.models:
+            method = model['normalizacion']
+            if method not in normalized:
+                normalized[method], _ = normalize_signal(window, method)
+            channels = lead_channels(self.leads, model['derivaciones'])
+            inputs[model_id] = normalized[method][np.newaxis, :, channels]
+        return inputs
+
+
+def replay_csv(csv_content: str, block_ms: float = 250, request_data: Dict[str, Any] = None,
+               predict: bool = True, realtime: bool = False) -> Dict[str, Any]:
+    """
+    Reproduce un CSV en bloques de block_ms como si llegara de un monitor. Retorna
+    {'sesion', 'eventos', 'push_ms'}: eventos sin los tensores (solo su forma) y los
+    tiempos de cada push.
+    """
+    request_data = request_data or {}
+    models = resolve_models(request_data.get('modelId'))
+    signal, _, fs, _ = parse_csv_content(csv_content, request_leads(request_data, models))
+    session = OnlineSession(fs, request_data, predict)
+    block_samples = max(1, int(round(block_ms * fs / 1000)))
+    
+    events = []
+    push_ms = []
+    for start in range(0, signal.shape[0], block_samples):
+        started = time.perf_counter()
+        events.extend(session.push(signal[start:start + block_samples]))
+        push_ms.append((time.perf_counter() - started) * 1000)
+        if realtime:
+            time.sleep(max(0.0, block_ms / 1000 - push_ms[-1] / 1000))
+    events.extend(session.flush())
+    
+    for event in events:
+        inputs = event.pop('model_inputs', None)
+        if inputs is not None:
+            event['shape'] = {model_id: list(tensor.shape) for model_id, tensor in inputs.items()}
+    return {'sesion': session.status(), 'eventos': events, 'push_ms': push_ms}
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Reproduce un CSV de ECG como una sesión en línea')
+    parser.add_argument('csv', help='Archivo CSV (tiempo_s y derivaciones)')
+    parser.add_argument('--block-ms', type=float, default=250, help='Duración de cada bloque que llega del monitor')
+    parser.add_argument('--hop-s', type=float, default=ONLINE_HOP_S, help='Avance entre ventanas emitidas')
+    parser.add_argument('--model-id', default=None)
+    parser.add_argument('--no-predict', action='store_true', help='Solo tensores, sin llamar al endpoint')
+    parser.add_argument('--realtime', action='store_true', help='Respetar el ritmo real de llegada de los bloques')
+    args = parser.parse_args(argv)
+    
+    with open(args.csv, encoding='utf-8') as f:
+        csv_content = f.read()
+    request_data = {'modelId': args.model_id}
+    models = resolve_models(args.model_id)
+    request_data['windowHop'] = max(1, int(round(args.hop_s * models[0][1]['target_fs'])))
+    
+    result = replay_csv(csv_content, args.block_ms, request_data, not args.no_predict, args.realtime)
+    for event in result['eventos']:
+        print(json.dumps(event, ensure_ascii=False))
+    push_ms = np.array(result['push_ms'] or [0.0])
+    print(json.dumps({**result['sesion'], 'pushes': len(result['push_ms']),
+                      'push_ms_p50': round(float(np.percentile(push_ms, 50)), 3),
+                      'push_ms_max': round(float(push_ms.max()), 3)}, ensure_ascii=False), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,136 +3,469 @@ Función Lambda para procesar ECG completo
 Hace todo el pipeline: parsear CSV, procesar señal, llamar a SageMaker
 """
 
+import time
+
+# Inicio de la carga del módulo (para medir la fase de inicialización en frío)
+_MODULE_LOAD_START = time.perf_counter()
+
+import base64
+import contextlib
+import contextvars
 import json
 import os
-import boto3
 import logging
 import csv
 import io
 import math
-from typing import Dict, List, Any, Tuple
-from botocore.exceptions import ClientError
+import itertools
+import functools
+import warnings
+import numpy as np
+from fractions import Fraction
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Callable, Dict, Iterator, List, Any, Optional, Sequence, Set, Tuple, Union
+
+from ecg_cache import cache_key, read_only, result_cache_from_env, stage_cache_from_env, stage_key
+from ecg_inference import BACKEND as INFERENCE_BACKEND, ENDPOINT_URL, InferenceClient, client_config, create_backend_client
+from ecg_instrumentation import StageRecorder, mark_reused, recording, stage
+from ecg_startup import handle_warmup, initialize, is_warmup_event
 
 # Configurar logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Cliente de SageMaker Runtime
+# Límite de payload por llamada al endpoint (4 MB en inferencia serverless)
+SAGEMAKER_MAX_PAYLOAD_BYTES = int(os.environ.get('SAGEMAKER_MAX_PAYLOAD_BYTES', 4 * 1000 * 1000))
+# Largo máximo de un float en JSON (repr de float64: signo, 17 dígitos, punto y exponente)
+JSON_FLOAT_MAX_CHARS = 24
+
+# Caché de resultados (LRU en memoria del contenedor + backend persistente opcional)
+result_cache = result_cache_from_env()
+
+# Salidas memorizadas por etapa (re-ejecuciones del mismo registro con otros parámetros)
+stage_cache = stage_cache_from_env()
+
+# Arranque: 'lazy' (por defecto) difiere boto3 hasta la primera llamada a AWS;
+# 'prewarm' crea los clientes y precalcula coeficientes en la fase de inicialización
+STARTUP_MODE = os.environ.get('ECG_STARTUP_MODE', 'lazy')
+
+# Clientes de AWS (se crean una sola vez por contenedor; boto3 se importa recién acá,
+# así los requests rechazados en calidad no pagan ~0.2 s de import)
 sagemaker_runtime = None
+s3_client = None
+inference_client = None
 
 def get_sagemaker_client():
-    """Inicializa el cliente de SageMaker Runtime"""
+    """Inicializa el cliente de SageMaker Runtime (o el del backend de ECG_INFERENCE_BACKEND)"""
     global sagemaker_runtime
+    if sagemaker_runtime is None and INFERENCE_BACKEND != 'sagemaker':
+        sagemaker_runtime = create_backend_client(INFERENCE_BACKEND)
     if sagemaker_runtime is None:
+        import boto3
         region = os.environ.get('AWS_REGION', 'us-east-1')
-        sagemaker_runtime = boto3.client('sagemaker-runtime', region_name=region)
+        sagemaker_runtime = boto3.client('sagemaker-runtime', region_name=region,
+                                         endpoint_url=ENDPOINT_URL, config=client_config())
     return sagemaker_runtime
 
 
+def get_inference_client() -> InferenceClient:
+    """Cliente de inferencia (reintentos, hedging y llamadas concurrentes) sobre el de SageMaker"""
+    global inference_client
+    if inference_client is None:
+        inference_client = InferenceClient(get_sagemaker_client)
+    return inference_client
+
+
+def get_endpoint_name() -> str:
+    """Nombre del endpoint de SageMaker configurado"""
+    return os.environ.get('SAGEMAKER_ENDPOINT', 'cnn1d-lstm-ecg-v1-serverless')
+
+
+def get_s3_client():
+    """Inicializa el cliente de S3 (entrada de registros largos en modo streaming)"""
+    global s3_client
+    if s3_client is None:
+        import boto3
+        region = os.environ.get('AWS_REGION', 'us-east-1')
+        s3_client = boto3.client('s3', region_name=region)
+    return s3_client
+
+
 # ============================================================================
 # PIPELINE DE PROCESAMIENTO DE SEÑAL
 # ============================================================================
 
-def parse_csv_content(csv_content: str) -> Tuple[List[float], List[float], List[float], List[float], float, Dict[str, Any]]:
-    """Parsea el contenido CSV y extrae las señales y metadata"""
-    reader = csv.DictReader(io.StringIO(csv_content))
-    
-    tiempo_s = []
-    II = []
-    V1 = []
-    V5 = []
-    labels = []
-    is_anomalo_list = []
-    
-    for row in reader:
-        if 'tiempo_s' in row and row['tiempo_s']:
-            tiempo_s.append(float(row['tiempo_s']))
-        if 'II' in row and row['II']:
-            II.append(float(row['II']))
-        if 'V1' in row and row['V1']:
-            V1.append(float(row['V1']))
-        if 'V5' in row and row['V5']:
-            V5.append(float(row['V5']))
-        # Extraer etiquetas si existen
-        # IMPORTANTE: Verificar que existe y no es None/vacío, pero 0 es válido
-        # csv.DictReader lee todo como strings, así que "0" es válido
-        if 'label' in row:
-            label_str = str(row['label']).strip() if row['label'] is not None else ''
-            if label_str != '':
-                try:
-                    label_val = int(float(label_str))
-                    labels.append(label_val)  # 0 y 1 son valores válidos
-                except (ValueError, TypeError):
-                    pass
-        
-        # Extraer is_anomalo si existe
-        # IMPORTANTE: False es un valor válido, no debe ser descartado
-        # csv.DictReader lee "False" como string, no como boolean
-        if 'is_anomalo' in row:
-            is_anomalo_str = str(row['is_anomalo']).strip() if row['is_anomalo'] is not None else ''
-            if is_anomalo_str != '':
-                try:
-                    # Siempre viene como string desde CSV
-                    val_lower = is_anomalo_str.lower()
-                    # "false", "0", "no" → False (Normal)
-                    # "true", "1", "yes" → True (Anómalo)
-                    is_anomalo_list.append(val_lower in ['true', '1', 'yes'])
-                except (ValueError, TypeError):
-                    pass
+# Derivaciones por defecto (las del modelo por defecto); el request puede pedir otras con "leads"
+ECG_LEADS = ('II', 'V1', 'V5')
+
+# Columnas numéricas del CSV de entrada
+CSV_NUMERIC_COLUMNS = ('tiempo_s',) + ECG_LEADS
+
+# Precisión de las señales ("precision" en el request): float32 usa la mitad de memoria
+# por copia y ejecuta filtrado y normalización en el lugar (ver in_place_stages). Los
+# filtros calculan en float64 por bloques de STAGE_BLOCK_SAMPLES muestras.
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+DEFAULT_PRECISION = os.environ.get('ECG_PRECISION', 'float64')
+STAGE_BLOCK_SAMPLES = 65536
+
+# Parámetros del pipeline (también forman parte de la clave de la caché de resultados)
+PIPELINE_VERSION = 4
+NOTCH_Q = 30
+BANDPASS_ORDER = 2  # Butterworth: orden 4 en la banda de paso
+BANDPASS_LOW_HZ = 0.5
+BANDPASS_HIGH_HZ = 40
+TARGET_FS = 200
+MODEL_INPUT_LENGTH = 2000
+
+def _column_to_array(values) -> np.ndarray:
+    """Convierte una columna de strings del CSV a float64, omitiendo celdas vacías"""
+    return np.fromiter(map(float, filter(None, values)), dtype=np.float64)
+
+
+def _load_numeric_columns(csv_content: str, header_lines: int, indices: List[int]) -> np.ndarray:
+    """
+    Lee en bloque las columnas numéricas indicadas con el parser en C de numpy.
     
-    # Calcular frecuencia de muestreo
-    fs = 500  # Valor por defecto
-    if len(tiempo_s) > 1:
-        time_diff = tiempo_s[1] - tiempo_s[0]
-        if time_diff > 0:
-            fs = 1 / time_diff
-    
-    # Determinar etiqueta real (si está disponible)
-    # Prioridad: label > is_anomalo (si ambos existen, usar label)
+    Retorna una matriz [filas, columnas], o None si el CSV tiene celdas vacías o filas
+    irregulares (en ese caso se usa el camino general).
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            data = np.loadtxt(io.StringIO(csv_content), delimiter=',', skiprows=header_lines,
+                              usecols=indices, comments=None, ndmin=2, dtype=np.float64)
+    except ValueError:
+        return None
+    return data if data.shape[0] > 0 else None
+
+
+def first_label(values) -> Any:
+    """Primera etiqueta válida de la columna label (0 y 1 son valores válidos)"""
+    for value in values:
+        label_str = str(value).strip() if value is not None else ''
+        if label_str != '':
+            try:
+                return int(float(label_str))
+            except (ValueError, TypeError):
+                pass
+    return None
+
+
+def first_is_anomalo(values) -> Any:
+    """Primer valor no vacío de la columna is_anomalo (False es un valor válido)"""
+    for value in values:
+        is_anomalo_str = str(value).strip() if value is not None else ''
+        if is_anomalo_str != '':
+            # "false", "0", "no" → False (Normal)
+            # "true", "1", "yes" → True (Anómalo)
+            return is_anomalo_str.lower() in ['true', '1', 'yes']
+    return None
+
+
+def build_label_metadata(label_real: Any, is_anomalo_real: Any) -> Dict[str, Any]:
+    """
+    Determina la etiqueta real (si está disponible)
+    Prioridad: label > is_anomalo (si ambos existen, usar label)
+    """
     metadata = {}
-    if labels:
-        # Usar la primera etiqueta (todas las filas deberían tener la misma)
-        label_real = labels[0] if labels else None
-        if label_real is not None:
-            metadata['label_real'] = int(label_real)
-            metadata['is_anomalo_real'] = (label_real == 1)
-    elif is_anomalo_list:
-        # Usar is_anomalo si está disponible (todas las filas deberían tener el mismo valor)
-        is_anomalo_real = is_anomalo_list[0] if is_anomalo_list else None
-        if is_anomalo_real is not None:
-            metadata['is_anomalo_real'] = bool(is_anomalo_real)
-            metadata['label_real'] = 1 if is_anomalo_real else 0
-    
-    # Si tenemos ambos, usar label como fuente de verdad (más confiable)
-    if labels and is_anomalo_list:
-        label_real = labels[0]
-        is_anomalo_real = is_anomalo_list[0]
-        # Verificar consistencia (solo para logging, no afecta el resultado)
-        if (label_real == 1) != is_anomalo_real:
+    if label_real is not None:
+        # Si tenemos ambos, verificar consistencia (solo para logging, no afecta el resultado)
+        if is_anomalo_real is not None and (label_real == 1) != is_anomalo_real:
             logger.warning(f"Inconsistencia detectada: label={label_real} pero is_anomalo={is_anomalo_real}. Usando label como fuente de verdad.")
-        # Usar label como fuente de verdad
         metadata['label_real'] = int(label_real)
         metadata['is_anomalo_real'] = (label_real == 1)
+    elif is_anomalo_real is not None:
+        metadata['is_anomalo_real'] = bool(is_anomalo_real)
+        metadata['label_real'] = 1 if is_anomalo_real else 0
+    return metadata
+
+
+def parse_numeric_columns(csv_content: str, column_index: Dict[str, int], header_lines: int = 0,
+                          names: Sequence[str] = CSV_NUMERIC_COLUMNS) -> Dict[str, np.ndarray]:
+    """
+    Lee las columnas numéricas indicadas (por defecto tiempo_s, II, V1, V5) de un bloque de texto CSV
+    
+    Solo se leen esas columnas, por índice y en bloque directamente a arrays float64.
+    Las columnas ausentes quedan como arrays vacíos.
+    """
+    empty = np.empty(0, dtype=np.float64)
+    columns = {name: empty for name in names}
+    numeric_names = [name for name in names if name in column_index]
+    if not numeric_names:
+        return columns
+    
+    data = _load_numeric_columns(csv_content, header_lines,
+                                 [column_index[name] for name in numeric_names])
+    if data is not None:
+        for j, name in enumerate(numeric_names):
+            columns[name] = data[:, j]
+        return columns
+    
+    # Camino general: celdas vacías o filas cortas (las celdas vacías se omiten)
+    reader = csv.reader(io.StringIO(csv_content))
+    rows = list(filter(None, itertools.islice(reader, header_lines, None)))
+    for name in numeric_names:
+        i = column_index[name]
+        columns[name] = _column_to_array(row[i] if i < len(row) else '' for row in rows)
+    return columns
+
+
+# Análisis de tiempo_s: los intervalos entre 0.5 y 1.5 veces la mediana son regulares
+# (jitter o redondeo del timestamp); los mayores son huecos
+TIMESTAMP_SHORT_FACTOR = 0.5
+TIMESTAMP_GAP_FACTOR = 1.5
+# Diferencia de fs entre la primera y la segunda mitad a partir de la cual el reloj se considera irregular
+TIMESTAMP_MAX_DRIFT_PPM = 1000
+# Una fs a menos de 0.05 % de un entero se redondea (timestamps con pocos decimales)
+FS_SNAP_TOLERANCE = 5e-4
+# Timestamps que usa el modo streaming para estimar fs antes de procesar
+FS_ESTIMATION_SAMPLES = 10000
+# Máximo de muestras del reloj uniforme de regridTimestamps, en veces las muestras originales
+REGRID_MAX_EXPANSION = float(os.environ.get('ECG_REGRID_MAX_EXPANSION', 4))
+
+
+def timestamp_analysis(tiempo_s: np.ndarray) -> Optional[Dict[str, Any]]:
+    """
+    Análisis vectorizado de la columna tiempo_s: fs robusta (promedio de los intervalos
+    regulares, insensible a timestamps redondeados o con jitter), deriva del reloj entre
+    la primera y la segunda mitad, huecos, duplicados y retrocesos. None si no hay al
+    menos un intervalo positivo.
+    """
+    diffs = np.diff(tiempo_s[np.isfinite(tiempo_s)])
+    positive = diffs[diffs > 0]
+    if positive.size == 0:
+        return None
+    step = float(np.median(positive))
+    regular = (diffs >= step * TIMESTAMP_SHORT_FACTOR) & (diffs <= step * TIMESTAMP_GAP_FACTOR)
+    regular_diffs = diffs[regular]
+    fs = regular_diffs.size / float(regular_diffs.sum())
+    if abs(fs - round(fs)) <= FS_SNAP_TOLERANCE * fs:
+        fs = float(round(fs))
+    
+    gaps = diffs[diffs > step * TIMESTAMP_GAP_FACTOR]
+    half = regular_diffs.size // 2
+    drift = 0.0
+    if half > 0:
+        first_fs = half / float(regular_diffs[:half].sum())
+        second_fs = (regular_diffs.size - half) / float(regular_diffs[half:].sum())
+        drift = (second_fs - first_fs) / fs * 1e6
+    
+    analysis = {
+        'fs': fs,
+        'intervalos': int(diffs.size),
+        'huecos': int(gaps.size),
+        'muestras_faltantes': int(np.maximum(np.round(gaps * fs) - 1, 0).sum()),
+        'duplicados': int((diffs == 0).sum()),
+        'retrocesos': int((diffs < 0).sum()),
+        'intervalos_cortos': int(((diffs > 0) & (diffs < step * TIMESTAMP_SHORT_FACTOR)).sum()),
+        'deriva_ppm': round(drift, 1),
+        'jitter_max_ms': round(float(np.abs(regular_diffs - 1 / fs).max()) * 1000, 4)
+    }
+    analysis['irregular'] = (any(analysis[key] for key in ('huecos', 'duplicados', 'retrocesos', 'intervalos_cortos'))
+                             or abs(drift) > TIMESTAMP_MAX_DRIFT_PPM)
+    return analysis
+
+
+def estimate_fs(tiempo_s: np.ndarray) -> float:
+    """Calcula la frecuencia de muestreo a partir de la columna tiempo_s (500 Hz si no se puede)"""
+    analysis = timestamp_analysis(tiempo_s)
+    return analysis['fs'] if analysis is not None else 500
+
+
+def regrid_signal(signal: np.ndarray, tiempo_s: np.ndarray, fs: float) -> np.ndarray:
+    """
+    Interpola la señal a un reloj uniforme t0 + k / fs entre el primer y el último
+    timestamp (los huecos se interpolan linealmente). Se descartan las muestras sin
+    tiempo y las que no avanzan respecto de las anteriores (duplicados y retrocesos).
+    ValueError si el reloj uniforme tendría más de REGRID_MAX_EXPANSION veces las
+    muestras originales (huecos o timestamps fuera de escala).
+    """
+    num_samples = min(signal.shape[0], tiempo_s.shape[0])
+    t = tiempo_s[:num_samples]
+    finite = np.isfinite(t)
+    t, signal = t[finite], signal[:num_samples][finite]
+    if t.size < 2:
+        return signal
+    keep = np.concatenate([[True], t[1:] > np.maximum.accumulate(t)[:-1]])
+    t, signal = t[keep], signal[keep]
+    
+    grid_samples = int(round((t[-1] - t[0]) * fs)) + 1
+    if grid_samples > REGRID_MAX_EXPANSION * t.size:
+        raise ValueError(f'Los timestamps abarcan {t[-1] - t[0]:.1f} s para {t.size} muestras: el reloj uniforme '
+                         f'tendría {grid_samples} muestras (máximo: {REGRID_MAX_EXPANSION:g} veces las originales)')
+    grid = t[0] + np.arange(grid_samples) / fs
+    # Interpolación lineal de todos los canales a la vez: mismo intervalo y peso por fila
+    left = np.clip(np.searchsorted(t, grid, side='right') - 1, 0, t.size - 2)
+    weight = np.clip((grid - t[left]) / (t[left + 1] - t[left]), 0, 1)[:, np.newaxis]
+    return (signal[left] * (1 - weight) + signal[left + 1] * weight).astype(signal.dtype, copy=False)
+
+
+def parse_csv_content(csv_content: str, leads: Sequence[str] = ECG_LEADS,
+                      dtype: Any = np.float64) -> Tuple[np.ndarray, np.ndarray, float, Dict[str, Any]]:
+    """
+    Parsea el contenido CSV: (señal [muestras, derivaciones], tiempo_s, fs, metadata)
+    
+    Solo se leen tiempo_s y las columnas de leads, por índice y en bloque directamente
+    a float64; las columnas label/is_anomalo solo se leen hasta el primer valor válido.
+    La señal queda en dtype (tiempo_s siempre en float64). Si falta alguna derivación
+    la señal queda vacía.
+    """
+    reader = csv.reader(io.StringIO(csv_content))
+    # csv.reader devuelve [] para líneas vacías; se descartan como hace DictReader
+    header = next(filter(None, reader), None)
+    if header is None:
+        return np.empty((0, len(leads)), dtype=dtype), np.empty(0), 500, {}
+    
+    # Como en DictReader, si una columna está repetida gana la última
+    column_index = {name: i for i, name in enumerate(header)}
+    columns = parse_numeric_columns(csv_content, column_index, reader.line_num, ('tiempo_s', *leads))
+    tiempo_s = columns['tiempo_s']
+    signal = raw_to_signal(*(columns[lead] for lead in leads), dtype=dtype)
+    
+    # Calcular frecuencia de muestreo
+    fs = estimate_fs(tiempo_s)
     
-    return II, V1, V5, tiempo_s, fs, metadata
+    # Extraer etiquetas si existen (todas las filas deberían tener la misma),
+    # leyendo solo hasta la primera fila con un valor válido
+    def metadata_column(name):
+        i = column_index.get(name)
+        if i is None:
+            return iter(())
+        rows = filter(None, csv.reader(io.StringIO(csv_content)))
+        next(rows)  # Encabezado
+        return (row[i] if i < len(row) else None for row in rows)
+    
+    metadata = build_label_metadata(first_label(metadata_column('label')),
+                                    first_is_anomalo(metadata_column('is_anomalo')))
+    
+    return signal, tiempo_s, fs, metadata
 
 
-def raw_to_signal(II: List[float], V1: List[float], V5: List[float]) -> List[List[float]]:
-    """Convierte las señales raw a formato estándar [muestras, 3 canales]"""
-    num_samples = min(len(II), len(V1), len(V5))
-    signal = []
-    for i in range(num_samples):
-        signal.append([II[i] if i < len(II) else 0,
-                       V1[i] if i < len(V1) else 0,
-                       V5[i] if i < len(V5) else 0])
+def raw_to_signal(*leads: np.ndarray, dtype: Any = np.float64) -> np.ndarray:
+    """
+    Convierte las derivaciones raw (una columna cada una) a formato estándar [muestras,
+    derivaciones] en dtype, copiando cada columna directamente al array final
+    """
+    num_samples = min(len(lead) for lead in leads)
+    signal = np.empty((num_samples, len(leads)), dtype=dtype)
+    for channel, lead in enumerate(leads):
+        signal[:, channel] = lead[:num_samples]
     return signal
 
 
-def check_quality(signal: List[List[float]], fs: float) -> Dict[str, Any]:
-    """Etapa 1: Chequeo de calidad"""
-    num_samples = len(signal)
-    num_channels = len(signal[0]) if signal else 0
+def lead_channels(leads: Sequence[str], selected: Sequence[str]) -> Union[slice, List[int]]:
+    """
+    Índices de las derivaciones selected dentro de leads, como slice si son equiespaciados
+    (la selección es una vista, sin copiar la señal) o como lista si no
+    """
+    indices = [list(leads).index(lead) for lead in selected]
+    step = indices[1] - indices[0] if len(indices) > 1 else 1
+    if step > 0 and all(b - a == step for a, b in zip(indices, indices[1:])):
+        return slice(indices[0], indices[-1] + 1, step)
+    return indices
+
+
+# ECG binario (ecgData): muestras intercaladas [muestras, derivaciones] en base64
+# little-endian, con un encabezado JSON {encoding, shape, fs, leads, gain, label, is_anomalo}
+BINARY_ENCODINGS = {'base64-float32': '<f4', 'base64-int16': '<i2'}
+
+
+def ecg_payload_header(payload: Dict[str, Any], leads: Sequence[str] = ECG_LEADS) -> Dict[str, Any]:
+    """Valida el encabezado de un ECG binario sin decodificar los datos (ValueError si es inválido)"""
+    if not isinstance(payload, dict) or not isinstance(payload.get('data'), str):
+        raise ValueError('ecgData debe ser un objeto con el campo data (base64)')
+    encoding = payload.get('encoding', 'base64-float32')
+    if encoding not in BINARY_ENCODINGS:
+        raise ValueError(f"ecgData.encoding no soportado: {encoding} (disponibles: {', '.join(BINARY_ENCODINGS)})")
+    dtype = np.dtype(BINARY_ENCODINGS[encoding])
+    
+    payload_leads = list(payload.get('leads') or ECG_LEADS)
+    missing = [lead for lead in leads if lead not in payload_leads]
+    if missing:
+        raise ValueError(f"ecgData no incluye las derivaciones: {', '.join(missing)}")
+    shape = payload.get('shape')
+    if not (isinstance(shape, list) and len(shape) == 2 and all(isinstance(n, int) for n in shape)
+            and shape[0] >= 0 and shape[1] == len(payload_leads)):
+        raise ValueError(f'ecgData.shape debe ser [muestras, {len(payload_leads)}]')
+    try:
+        fs = numeric_option(payload, 'fs', 0.0)
+    except ValueError:
+        fs = 0.0
+    if not 0 < fs < 1e5:
+        raise ValueError('ecgData.fs debe ser la frecuencia de muestreo en Hz')
+    try:
+        gain = np.asarray(payload.get('gain', 1.0), dtype=np.float64)
+        valid_gain = gain.ndim == 0 or (gain.ndim == 1 and gain.size == len(payload_leads))
+    except (TypeError, ValueError):
+        valid_gain = False
+    if not valid_gain or not np.isfinite(gain).all():
+        raise ValueError(f'ecgData.gain debe ser un número o uno por derivación ({len(payload_leads)})')
+    
+    # Largo en base64 de muestras * derivaciones valores (con relleno)
+    num_samples = shape[0]
+    expected = 4 * -(-num_samples * len(payload_leads) * dtype.itemsize // 3)
+    if len(payload['data']) != expected:
+        raise ValueError(f"ecgData.data tiene {len(payload['data'])} caracteres; se esperaban {expected} para shape {shape}")
+    
+    columns = lead_channels(payload_leads, leads)
+    return {
+        'dtype': dtype,
+        'shape': (num_samples, len(payload_leads)),
+        'columns': columns,
+        'fs': fs,
+        'gain': gain[columns] if gain.ndim else gain
+    }
+
+
+def parse_ecg_payload(payload: Dict[str, Any], leads: Sequence[str] = ECG_LEADS,
+                      dtype: Any = np.float64) -> Tuple[np.ndarray, float, Dict[str, Any]]:
+    """
+    Decodifica un ECG binario: (señal [muestras, derivaciones], fs, metadata)
+    
+    Los bytes se interpretan sin copiar (np.frombuffer) y las derivaciones pedidas se
+    convierten a dtype en una sola copia, ya en el orden de leads y multiplicadas por gain.
+    """
+    header = ecg_payload_header(payload, leads)
+    raw = np.frombuffer(base64.b64decode(payload['data']), dtype=header['dtype']).reshape(header['shape'])
+    signal = raw[:, header['columns']].astype(dtype)
+    if np.any(header['gain'] != 1):
+        signal *= header['gain']
+    
+    metadata = build_label_metadata(first_label([payload.get('label')]),
+                                    first_is_anomalo([payload.get('is_anomalo')]))
+    return signal, header['fs'], metadata
+
+
+def ecg_content_key(content: Any) -> str:
+    """Texto que identifica el ECG de un request (CSV o ecgData) para las claves de caché"""
+    if isinstance(content, dict):
+        return json.dumps(content, sort_keys=True)
+    return content
+
+
+def valid_mask(signal: np.ndarray) -> np.ndarray:
+    """Máscara de valores válidos (descarta NaN, Inf y valores fuera de rango)"""
+    # Las comparaciones con NaN son False, así que quedan excluidos
+    return (signal > -1e10) & (signal < 1e10)
+
+
+def channel_statistics(signal: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Estadísticas por canal de los valores válidos en una sola pasada vectorizada.
     
+    Retorna (conteos, medias, m2) donde m2 es la suma de desvíos cuadráticos.
+    """
+    mask = valid_mask(signal)
+    counts = mask.sum(axis=0)
+    means = np.where(mask, signal, 0.0).sum(axis=0) / np.maximum(counts, 1)
+    m2 = (np.where(mask, signal - means, 0.0) ** 2).sum(axis=0)
+    return counts, means, m2
+
+
+def quality_from_statistics(num_samples: int, num_channels: int, fs: float,
+                            stats: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                            expected_channels: int = len(ECG_LEADS)) -> Dict[str, Any]:
+    """Evalúa el chequeo de calidad a partir del tamaño y las estadísticas por canal"""
     if num_samples == 0:
         return {
             'status': 'RECHAZADA',
@@ -140,10 +473,10 @@ def check_quality(signal: List[List[float]], fs: float) -> Dict[str, Any]:
             'razon_rechazo': 'La señal no contiene muestras'
         }
     
-    if num_channels != 3:
+    if num_channels != expected_channels:
         return {
             'status': 'RECHAZADA',
-            'mensaje': f'Número de canales incorrecto: {num_channels} (se esperan 3)',
+            'mensaje': f'Número de canales incorrecto: {num_channels} (se esperan {expected_channels})',
             'razon_rechazo': 'Formato de señal inválido'
         }
     
@@ -157,29 +490,24 @@ def check_quality(signal: List[List[float]], fs: float) -> Dict[str, Any]:
             'fs_original': fs
         }
     
-    # Validar cada canal
-    for channel in range(num_channels):
-        channel_values = [s[channel] for s in signal if len(s) > channel and 
-                          not (s[channel] != s[channel] or not (-1e10 < s[channel] < 1e10))]
-        
-        if len(channel_values) == 0:
+    counts, _, m2 = stats
+    std_devs = np.sqrt(m2 / np.maximum(counts, 1))
+    
+    # Validar todos los canales a la vez y reportar el primero que falla
+    failing = np.flatnonzero((counts == 0) | (std_devs < 0.01))
+    if failing.size:
+        channel = int(failing[0])
+        if counts[channel] == 0:
             return {
                 'status': 'RECHAZADA',
                 'mensaje': f'Canal {channel} completamente inválido',
                 'razon_rechazo': 'Canal sin valores válidos'
             }
-        
-        # Calcular estadísticas
-        mean = sum(channel_values) / len(channel_values)
-        variance = sum((v - mean) ** 2 for v in channel_values) / len(channel_values)
-        std_dev = variance ** 0.5
-        
-        if std_dev < 0.01:
-            return {
-                'status': 'RECHAZADA',
-                'mensaje': f'Canal {channel} tiene desviación estándar muy baja: {std_dev:.6f}',
-                'razon_rechazo': 'Señal demasiado plana'
-            }
+        return {
+            'status': 'RECHAZADA',
+            'mensaje': f'Canal {channel} tiene desviación estándar muy baja: {float(std_devs[channel]):.6f}',
+            'razon_rechazo': 'Señal demasiado plana'
+        }
     
     return {
         'status': 'OK',
@@ -189,9 +517,280 @@ def check_quality(signal: List[List[float]], fs: float) -> Dict[str, Any]:
     }
 
 
-def apply_notch_filter(signal: List[float], fs: float, notch_freq: float = 50, Q: float = 30) -> List[float]:
-    """Aplica filtro notch para eliminar ruido de red"""
+# Índices de calidad (SQI): se calculan para todos los canales a la vez y permiten
+# rechazar registros inservibles antes de filtrar, resamplear y pagar la inferencia
+SQI_WINDOW_S = 10
+SQI_WINDOW_GROUP = 32  # Ventanas por FFT en signal_quality_indices
+SQI_FLATLINE_MIN_S = 0.5  # Tramos constantes más cortos no cuentan como señal plana
+SQI_MAX_INVALID_FRACTION = 0.2
+SQI_MAX_FLATLINE_FRACTION = 0.5
+SQI_MAX_CLIPPING_FRACTION = 0.2
+SQI_BASELINE_HZ = 0.5
+SQI_ECG_BAND_HZ = (0.5, 40)
+SQI_POWERLINE_HZ = (50, 60)
+SQI_POWERLINE_HALF_WIDTH_HZ = 1
+SQI_MIN_WINDOW_SQI = 0.25  # Ventana buena: al menos un cuarto de la potencia (sin línea de base ni red) en la banda del ECG
+SQI_MIN_GOOD_WINDOWS = 0.5
+
+
+def flatline_runs(channels: np.ndarray, min_samples: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tramos de muestras consecutivas iguales de cada canal ([canales, muestras]): (fracción
+    de muestras en tramos de al menos min_samples, largo del tramo más largo en muestras)
+    """
+    num_channels, num_samples = channels.shape
+    # Con False en los extremos de cada fila los tramos nunca cruzan de canal
+    equal = np.zeros((num_channels, num_samples + 1), dtype=np.int8)
+    equal[:, 1:-1] = channels[:, 1:] == channels[:, :-1]
+    edges = np.diff(equal.ravel())
+    starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - starts + 1  # k diferencias nulas = k + 1 muestras
+    rows = starts // (num_samples + 1)
+    
+    longest = np.zeros(num_channels, dtype=np.int64)
+    np.maximum.at(longest, rows, lengths)
+    flat = np.bincount(rows, weights=np.where(lengths >= min_samples, lengths, 0), minlength=num_channels)
+    return flat / num_samples, longest
+
+
+def band_power_ratios(windows: np.ndarray, fs: float) -> Dict[str, np.ndarray]:
+    """
+    Potencia relativa de cada ventana (muestras en el último eje) a partir de la FFT de
+    todas a la vez: línea de base, red eléctrica y SQI (potencia en la banda del ECG
+    sobre la total sin línea de base ni red)
+    """
+    spectrum = np.fft.rfft(windows - windows.mean(axis=-1, keepdims=True), axis=-1)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    freqs = np.fft.rfftfreq(windows.shape[-1], 1 / fs)
+    
+    powerline_mask = np.zeros(freqs.shape, dtype=bool)
+    for freq in SQI_POWERLINE_HZ:
+        if freq < fs / 2:
+            powerline_mask |= np.abs(freqs - freq) <= SQI_POWERLINE_HALF_WIDTH_HZ
+    baseline_mask = (freqs > 0) & (freqs < SQI_BASELINE_HZ)
+    ecg_mask = (freqs >= SQI_ECG_BAND_HZ[0]) & (freqs <= SQI_ECG_BAND_HZ[1]) & ~powerline_mask
+    
+    total = power[..., 1:].sum(axis=-1)
+    baseline = power[..., baseline_mask].sum(axis=-1)
+    powerline = power[..., powerline_mask].sum(axis=-1)
+    ecg = power[..., ecg_mask].sum(axis=-1)
+    
+    safe_total = np.where(total > 0, total, 1.0)
+    rest = total - baseline - powerline
+    return {
+        'linea_base': baseline / safe_total,
+        'red_electrica': powerline / safe_total,
+        # Ventanas sin potencia (planas) quedan con SQI 0
+        'sqi': np.where(rest > 1e-12 * safe_total, ecg / np.where(rest > 0, rest, 1.0), 0.0)
+    }
+
+
+def signal_quality_indices(signal: np.ndarray, fs: float) -> Dict[str, Any]:
+    """
+    Índices de calidad por canal: fracción de valores inválidos (NaN/Inf), señal plana,
+    saturación (muestras en el mínimo o el máximo del canal), potencia relativa de la
+    línea de base y de la red eléctrica, y SQI por ventana de 10 s. También retorna las
+    estadísticas de channel_statistics ('estadisticas'), calculadas en la misma pasada.
+    """
+    # Canales en filas: las reducciones por canal recorren memoria contigua
+    channels = np.ascontiguousarray(signal.T)
+    num_samples = channels.shape[1]
+    mask = valid_mask(channels)
+    all_valid = bool(mask.all())
+    
+    counts = mask.sum(axis=1)
+    means = (channels if all_valid else np.where(mask, channels, 0.0)).sum(axis=1) / np.maximum(counts, 1)
+    # Centrada (en el dtype de la señal) y con los inválidos en 0 (la media del canal)
+    centered = channels - means[:, np.newaxis].astype(channels.dtype)
+    if not all_valid:
+        centered = np.where(mask, centered, 0.0)
+    m2 = (centered ** 2).sum(axis=1)
+    
+    flat_fraction, longest_flat = flatline_runs(channels, max(2, int(SQI_FLATLINE_MIN_S * fs)))
+    
+    # Saturación: el conversor recorta en valores exactamente iguales al extremo
+    min_val = (channels if all_valid else np.where(mask, channels, np.inf)).min(axis=1)
+    max_val = (channels if all_valid else np.where(mask, channels, -np.inf)).max(axis=1)
+    at_limits = ((channels == min_val[:, np.newaxis]) | (channels == max_val[:, np.newaxis])).sum(axis=1)
+    clipping = np.where(counts > 1, at_limits / np.maximum(counts, 1), 0.0)
+    
+    # Ventanas de 10 s (la última alineada al final) de todos los canales: [canales, ventanas, muestras]
+    window_length = min(num_samples, int(round(SQI_WINDOW_S * fs)))
+    starts = list(range(0, num_samples - window_length + 1, window_length))
+    if starts[-1] + window_length < num_samples:
+        starts.append(num_samples - window_length)
+    windows = sliding_window_view(centered, window_length, axis=1)[:, starts]
+    # Por grupos de ventanas: el espectro de un registro largo no se arma entero en memoria
+    groups = [band_power_ratios(windows[:, i:i + SQI_WINDOW_GROUP], fs)
+              for i in range(0, len(starts), SQI_WINDOW_GROUP)]
+    ratios = {key: np.concatenate([group[key] for group in groups], axis=1) for key in groups[0]}
+    window_sqi = ratios['sqi'].min(axis=0)
+    
+    return {
+        'estadisticas': (counts, means, m2),
+        'invalidos': 1 - counts / num_samples,
+        'plano_fraccion': flat_fraction,
+        'plano_max_s': longest_flat / fs,
+        'saturacion': clipping,
+        'linea_base': ratios['linea_base'].mean(axis=1),
+        'red_electrica': ratios['red_electrica'].mean(axis=1),
+        'sqi_ventanas': window_sqi,
+        'ventanas_buenas': int((window_sqi >= SQI_MIN_WINDOW_SQI).sum())
+    }
+
+
+def quality_from_sqi(quality_check: Dict[str, Any], sqi: Dict[str, Any]) -> Dict[str, Any]:
+    """Agrega los SQI al chequeo de calidad y rechaza si algún índice supera su umbral"""
+    report = {key: np.round(value, 4).tolist() if isinstance(value, np.ndarray) else value
+              for key, value in sqi.items() if key != 'estadisticas'}
+    checks = (
+        ('invalidos', SQI_MAX_INVALID_FRACTION, 'valores inválidos (NaN/Inf)', 'Demasiados valores inválidos'),
+        ('plano_fraccion', SQI_MAX_FLATLINE_FRACTION, 'señal plana', 'Señal demasiado plana'),
+        ('saturacion', SQI_MAX_CLIPPING_FRACTION, 'muestras saturadas', 'Señal saturada'),
+    )
+    for key, limit, description, reason in checks:
+        channels = np.flatnonzero(sqi[key] > limit)
+        if channels.size:
+            channel = int(channels[0])
+            return {
+                'status': 'RECHAZADA',
+                'mensaje': f'Canal {channel} con {sqi[key][channel]:.1%} de {description} (máximo: {limit:.0%})',
+                'razon_rechazo': reason,
+                'sqi': report
+            }
+    
+    num_windows = len(sqi['sqi_ventanas'])
+    if sqi['ventanas_buenas'] < SQI_MIN_GOOD_WINDOWS * num_windows:
+        return {
+            'status': 'RECHAZADA',
+            'mensaje': f"Solo {sqi['ventanas_buenas']} de {num_windows} ventanas con calidad suficiente",
+            'razon_rechazo': 'Ruido excesivo',
+            'sqi': report
+        }
+    return {**quality_check, 'sqi': report}
+
+
+def check_quality(signal: np.ndarray, fs: float, expected_channels: int = len(ECG_LEADS)) -> Dict[str, Any]:
+    """Etapa 1: Chequeo de calidad (forma, duración, desvío por canal e índices SQI)"""
+    num_samples = signal.shape[0]
+    num_channels = signal.shape[1] if signal.ndim > 1 else 0
+    
+    # Los índices solo se calculan si pasan los chequeos de forma y duración
+    stats = sqi = None
+    if num_samples > 0 and num_channels == expected_channels and num_samples / fs >= 5:
+        sqi = signal_quality_indices(signal, fs)
+        stats = sqi['estadisticas']
+    quality_check = quality_from_statistics(num_samples, num_channels, fs, stats, expected_channels)
+    if quality_check['status'] != 'OK':
+        return quality_check
+    return quality_from_sqi(quality_check, sqi)
+
+
+# ----------------------------------------------------------------------------
+# Motor de recurrencias lineales (filtros IIR sin bucles por muestra)
+# ----------------------------------------------------------------------------
+
+# Tamaño de bloque del scan: dentro de cada bloque la recurrencia se resuelve
+# con una multiplicación de matrices y entre bloques se aplica recursivamente
+_SCAN_BLOCK = 32
+_scan_matrices_cache: Dict[bytes, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+
+def _scan_matrices(M: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Precalcula (y cachea) las matrices de bloque para la transición M"""
+    key = M.tobytes()
+    cached = _scan_matrices_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    d = M.shape[0]
+    B = _SCAN_BLOCK
+    powers = np.empty((B + 1, d, d))
+    powers[0] = np.eye(d)
+    for k in range(1, B + 1):
+        powers[k] = M @ powers[k - 1]
+    
+    # W[(j, a), (i, b)] = M^(j-i) para i <= j: respuesta de estado nulo del bloque
+    W = np.zeros((B, d, B, d))
+    for j in range(B):
+        for i in range(j + 1):
+            W[j, :, i, :] = powers[j - i]
+    W = W.reshape(B * d, B * d)
+    # P[(j, a), b] = M^(j+1): propagación del estado inicial del bloque
+    P = powers[1:].reshape(B * d, d)
+    
+    cached = (W, P, powers[B])
+    _scan_matrices_cache[key] = cached
+    return cached
+
+
+def _linear_scan(M: np.ndarray, z: np.ndarray, s0: np.ndarray) -> np.ndarray:
+    """
+    Resuelve s[n] = M @ s[n-1] + z[n] para todas las muestras sin bucles en Python.
+    
+    z tiene forma [n, d, canales] y s0 [d, canales]. Retorna s con forma [n, d, canales].
+    """
+    n, d, num_channels = z.shape
+    B = _SCAN_BLOCK
+    W, P, M_B = _scan_matrices(M)
+    
+    num_blocks = -(-n // B)
+    if num_blocks * B != n:
+        z = np.concatenate([z, np.zeros((num_blocks * B - n, d, num_channels))])
+    
+    # Estado de cada bloque suponiendo condición inicial nula
+    s = W @ z.reshape(num_blocks, B * d, num_channels)
+    
+    if num_blocks == 1:
+        s_prev = s0[np.newaxis]
+    else:
+        # Los estados al final de cada bloque siguen la misma recurrencia con M^B
+        block_ends = s.reshape(num_blocks, B, d, num_channels)[:, -1]
+        S = _linear_scan(M_B, block_ends, s0)
+        s_prev = np.concatenate([s0[np.newaxis], S[:-1]])
+    
+    s += P @ s_prev
+    return s.reshape(num_blocks * B, d, num_channels)[:n]
+
+
+def _iir_filter(b: List[float], a: List[float], x: np.ndarray,
+                zi: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Filtro IIR de orden <= 2 (forma directa II transpuesta) sobre cada columna de x.
+    
+    Retorna (y, zf) donde zf es el estado final, para poder continuar el filtrado.
+    """
+    b = [c / a[0] for c in b] + [0.0] * (3 - len(b))
+    a = [c / a[0] for c in a] + [0.0] * (3 - len(a))
+    b0, b1, b2 = b
+    _, a1, a2 = a
+    
+    squeeze = x.ndim == 1
+    x2d = x[:, np.newaxis] if squeeze else x
+    num_channels = x2d.shape[1]
+    if zi is None:
+        zi = np.zeros((2, num_channels))
+    
+    if x2d.shape[0] == 0:
+        return x.astype(np.float64, copy=True), zi
     
+    # s[n] = A s[n-1] + Bv x[n];  y[n] = b0 x[n] + s[n-1][0]
+    A = np.array([[-a1, 1.0], [-a2, 0.0]])
+    Bv = np.array([b1 - a1 * b0, b2 - a2 * b0])
+    s = _linear_scan(A, Bv[np.newaxis, :, np.newaxis] * x2d[:, np.newaxis, :], zi)
+    
+    y = b0 * x2d
+    y[0] += zi[0]
+    y[1:] += s[:-1, 0]
+    return (y[:, 0] if squeeze else y), s[-1]
+
+
+# Secciones de segundo orden (SOS): una fila [b0, b1, b2, a0, a1, a2] por sección.
+# Los coeficientes se diseñan una vez por (fs, parámetros) y quedan en caché
+
+
+def notch_sos(fs: float, notch_freq: float = 50, Q: float = 30) -> np.ndarray:
+    """Coeficientes del filtro notch (biquad) para eliminar ruido de red"""
     w0 = (2 * math.pi * notch_freq) / fs
     alpha = math.sin(w0) / (2 * Q)
     cosw0 = math.cos(w0)
@@ -199,70 +798,213 @@ def apply_notch_filter(signal: List[float], fs: float, notch_freq: float = 50, Q
     b0, b1, b2 = 1, -2 * cosw0, 1
     a0, a1, a2 = 1 + alpha, -2 * cosw0, 1 - alpha
     
-    b = [b0 / a0, b1 / a0, b2 / a0]
-    a = [1, a1 / a0, a2 / a0]
+    return np.array([[b0 / a0, b1 / a0, b2 / a0, 1.0, a1 / a0, a2 / a0]])
+
+
+def butter_bandpass_sos(fs: float, low_freq: float = 0.5, high_freq: float = 40,
+                        order: int = 2) -> np.ndarray:
+    """
+    Pasa banda Butterworth de orden 2 * order en secciones de segundo orden
+    
+    Diseño analógico (prototipo pasa bajos -> pasa banda) y transformación bilineal
+    con las frecuencias de corte predistorsionadas.
+    """
+    if not 0 < low_freq < high_freq < fs / 2:
+        raise ValueError(f'Banda de paso inválida: {low_freq}-{high_freq} Hz con fs={fs} Hz')
+    
+    fs2 = 2.0 * fs
+    low = fs2 * math.tan(math.pi * low_freq / fs)
+    high = fs2 * math.tan(math.pi * high_freq / fs)
+    bandwidth = high - low
+    center = math.sqrt(low * high)
     
-    filtered = [0.0] * len(signal)
-    x1, x2, y1, y2 = 0.0, 0.0, 0.0, 0.0
+    # Polos del prototipo en el semicírculo izquierdo; cada uno se desdobla en dos
+    # y quedan order ceros en s = 0 (y order en el infinito)
+    prototype = np.exp(1j * np.pi * (2 * np.arange(order) + order + 1) / (2 * order))
+    half = prototype * bandwidth / 2
+    root = np.sqrt(half ** 2 - center ** 2)
+    poles = np.concatenate([half + root, half - root])
     
-    for i in range(len(signal)):
-        x = signal[i]
-        y = b[0] * x + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
-        filtered[i] = y
-        x2, x1 = x1, x
-        y2, y1 = y1, y
+    # Bilineal: los ceros en s = 0 van a z = 1 y los del infinito a z = -1
+    z_poles = (fs2 + poles) / (fs2 - poles)
+    gain = (bandwidth * fs2) ** order / np.prod(fs2 - poles).real
     
-    return filtered
+    # Agrupar polos complejos conjugados (y los reales de a dos) en secciones
+    is_real = np.abs(z_poles.imag) <= 1e-10 * np.abs(z_poles)
+    pairs = [(p, np.conj(p)) for p in z_poles[~is_real & (z_poles.imag > 0)]]
+    real_poles = np.sort(z_poles[is_real].real)
+    pairs += list(zip(real_poles[0::2], real_poles[1::2]))
+    
+    sos = np.zeros((order, 6))
+    for k, (p1, p2) in enumerate(pairs):
+        sos[k] = [1.0, 0.0, -1.0, 1.0, -(p1 + p2).real, (p1 * p2).real]
+    sos[0, :3] *= gain
+    return sos
+
+
+def numeric_option(request_data: Dict[str, Any], name: str, default: Any = None, cast: type = float) -> Any:
+    """
+    Opción numérica del request (default si no está). ValueError con un mensaje para el
+    usuario si no es un número finito (o entero, con cast=int)
+    """
+    value = request_data.get(name)
+    if value is None:
+        return default
+    try:
+        if isinstance(value, bool):
+            raise ValueError(name)
+        # int('2.0') falla: un texto sólo vale como entero si int() lo acepta (como en window_signal)
+        number = float(int(value) if cast is int and isinstance(value, str) else value)
+        if not math.isfinite(number) or (cast is int and not number.is_integer()):
+            raise ValueError(name)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} debe ser un número{' entero' if cast is int else ''}") from None
+    return cast(number)
+
+
+def filter_parameters(request_data: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Parámetros del banco de filtros: opciones del request o valores por defecto (ValueError si no son números)"""
+    request_data = request_data or {}
+    return {
+        # None: 60 Hz si fs > 300, si no 50 Hz; 0 desactiva el notch
+        'notch_freq': numeric_option(request_data, 'notchFreq'),
+        'notch_q': numeric_option(request_data, 'notchQ', NOTCH_Q),
+        'low_freq': numeric_option(request_data, 'lowFreq', BANDPASS_LOW_HZ),
+        'high_freq': numeric_option(request_data, 'highFreq', BANDPASS_HIGH_HZ),
+        'order': numeric_option(request_data, 'filterOrder', BANDPASS_ORDER, int),
+        'zero_phase': bool(request_data.get('zeroPhase', False))
+    }
 
 
-def apply_bandpass_filter(signal: List[float], fs: float, low_freq: float = 0.5, high_freq: float = 40) -> List[float]:
-    """Aplica filtro pasa banda"""
-    import math
-    # High-pass
-    rc = 1 / (2 * math.pi * low_freq)
-    dt = 1 / fs
-    alpha = rc / (rc + dt)
+@functools.lru_cache(maxsize=32)
+def _design_filter_bank(fs: float, notch_freq: float, notch_q: float, low_freq: float,
+                        high_freq: float, order: int) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """Diseño cacheado del banco de filtros (sos de solo lectura)"""
+    sections = []
+    applied = []
+    # El notch solo tiene sentido por debajo de la frecuencia de Nyquist
+    if 0 < notch_freq < fs / 2:
+        sections.append(notch_sos(fs, notch_freq, notch_q))
+        applied.append('notch')
+    sections.append(butter_bandpass_sos(fs, low_freq, high_freq, order))
+    applied.append('banda_pasante')
     
-    high_passed = [signal[0]]
-    for i in range(1, len(signal)):
-        high_passed.append(alpha * (high_passed[i-1] + signal[i] - signal[i-1]))
+    sos = np.concatenate(sections)
+    sos.setflags(write=False)
+    return sos, tuple(applied)
+
+
+def design_filter_bank(fs: float, params: Dict[str, Any] = None) -> Tuple[np.ndarray, List[str]]:
+    """Banco de filtros de la etapa de filtrado: (sos, filtros_aplicados)"""
+    params = params or filter_parameters()
+    notch_freq = params['notch_freq']
+    if notch_freq is None:
+        notch_freq = 60 if fs > 300 else 50
+    sos, applied = _design_filter_bank(float(fs), float(notch_freq), params['notch_q'],
+                                       params['low_freq'], params['high_freq'], params['order'])
+    return sos, list(applied)
+
+
+def sos_steady_state(sos: np.ndarray) -> np.ndarray:
+    """
+    Estado de cada sección en régimen permanente ante un escalón unitario, con forma
+    [secciones, 2]. Escalado por la primera muestra evita el transitorio inicial.
+    """
+    zi = np.zeros((sos.shape[0], 2))
+    scale = 1.0
+    for k, (b0, b1, b2, _, a1, a2) in enumerate(sos):
+        A = np.array([[-a1, 1.0], [-a2, 0.0]])
+        Bv = np.array([b1 - a1 * b0, b2 - a2 * b0])
+        zi[k] = scale * np.linalg.solve(np.eye(2) - A, Bv)
+        scale *= (b0 + b1 + b2) / (1 + a1 + a2)
+    return zi
+
+
+def apply_sos(sos: np.ndarray, signal: np.ndarray,
+              states: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Aplica las secciones en cascada a todas las columnas de la señal a la vez.
     
-    # Low-pass
-    rc = 1 / (2 * math.pi * high_freq)
-    alpha = dt / (rc + dt)
+    Retorna (filtrada, estados) con estados de forma [secciones, 2, canales]. Sin
+    estados se arranca en régimen permanente para la primera muestra; pasando los
+    devueltos en la siguiente llamada se puede filtrar por bloques con el mismo resultado.
+    """
+    squeeze = signal.ndim == 1
+    # Los filtros recursivos calculan siempre en float64 (en float32 acumulan error)
+    filtered = (signal[:, np.newaxis] if squeeze else signal).astype(np.float64, copy=False)
+    if states is None:
+        first = filtered[0] if filtered.shape[0] > 0 else np.zeros(filtered.shape[1])
+        states = sos_steady_state(sos)[:, :, np.newaxis] * first
     
-    low_passed = [high_passed[0]]
-    for i in range(1, len(high_passed)):
-        low_passed.append(low_passed[i-1] + alpha * (high_passed[i] - low_passed[i-1]))
+    new_states = np.empty_like(states)
+    for k, section in enumerate(sos):
+        filtered, new_states[k] = _iir_filter(section[:3], section[3:], filtered, states[k])
+    return (filtered[:, 0] if squeeze else filtered), new_states
+
+
+def apply_sos_zero_phase(sos: np.ndarray, signal: np.ndarray) -> np.ndarray:
+    """
+    Filtrado ida y vuelta (fase cero): la señal filtrada no queda desplazada respecto
+    de la original. Extiende los bordes con reflexión impar para reducir transitorios.
+    """
+    squeeze = signal.ndim == 1
+    x = signal[:, np.newaxis] if squeeze else signal
+    num_samples = x.shape[0]
+    if num_samples < 2:
+        filtered, _ = apply_sos(sos, x)
+        return filtered[:, 0] if squeeze else filtered
     
-    return low_passed
+    pad = min(3 * (2 * sos.shape[0] + 1), num_samples - 1)
+    extended = np.concatenate([2 * x[0] - x[pad:0:-1], x,
+                               2 * x[-1] - x[-2:-pad - 2:-1]])
+    forward, _ = apply_sos(sos, extended)
+    backward, _ = apply_sos(sos, forward[::-1])
+    filtered = backward[::-1][pad:pad + num_samples]
+    return filtered[:, 0] if squeeze else filtered
+
+
+def apply_notch_filter(signal: np.ndarray, fs: float, notch_freq: float = 50, Q: float = 30) -> np.ndarray:
+    """Aplica filtro notch para eliminar ruido de red (sobre cada columna de la señal)"""
+    filtered, _ = apply_sos(notch_sos(fs, notch_freq, Q), signal)
+    return filtered
+
+
+def apply_bandpass_filter(signal: np.ndarray, fs: float, low_freq: float = 0.5, high_freq: float = 40,
+                          order: int = BANDPASS_ORDER) -> np.ndarray:
+    """Aplica filtro pasa banda Butterworth (sobre cada columna de la señal)"""
+    filtered, _ = apply_sos(butter_bandpass_sos(fs, low_freq, high_freq, order), signal)
+    return filtered
 
 
-def filter_signal(signal: List[List[float]], fs: float) -> Tuple[List[List[float]], Dict[str, Any]]:
-    """Etapa 2: Filtrado"""
+def filter_signal(signal: np.ndarray, fs: float, params: Dict[str, Any] = None,
+                  out: np.ndarray = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Etapa 2: Filtrado
+    
+    Con out (que puede ser la propia señal) o con una señal que no es float64, el
+    resultado se escribe en out por bloques: los temporales en float64 son de un bloque.
+    """
+    params = params or filter_parameters()
     try:
-        num_samples = len(signal)
-        num_channels = len(signal[0]) if signal else 3
-        
-        filtered = [[0.0] * num_channels for _ in range(num_samples)]
-        
-        for channel in range(num_channels):
-            channel_signal = [s[channel] for s in signal]
-            
-            # Notch filter
-            notch_freq = 60 if fs > 300 else 50
-            notch_filtered = apply_notch_filter(channel_signal, fs, notch_freq)
-            
-            # Bandpass filter
-            bandpass_filtered = apply_bandpass_filter(notch_filtered, fs, 0.5, 40)
-            
-            for i in range(num_samples):
-                filtered[i][channel] = bandpass_filtered[i] if i < len(bandpass_filtered) else 0
+        # Notch + pasa banda sobre todos los canales a la vez
+        sos, applied = design_filter_bank(fs, params)
+        if out is None and signal.dtype == np.float64:
+            filtered = apply_sos_zero_phase(sos, signal) if params['zero_phase'] else apply_sos(sos, signal)[0]
+        else:
+            filtered = out if out is not None else np.empty_like(signal)
+            if params['zero_phase']:
+                filtered[...] = apply_sos_zero_phase(sos, signal)
+            else:
+                states = None
+                for start in range(0, signal.shape[0], STAGE_BLOCK_SAMPLES):
+                    block = slice(start, start + STAGE_BLOCK_SAMPLES)
+                    filtered[block], states = apply_sos(sos, signal[block], states)
         
         return filtered, {
             'status': 'OK',
             'mensaje': 'Filtrado completado exitosamente',
-            'filtros_aplicados': ['notch', 'banda_pasante']
+            'filtros_aplicados': applied,
+            'fase_cero': params['zero_phase']
         }
     except Exception as e:
         logger.error(f"Error en filtrado: {str(e)}")
@@ -273,102 +1015,401 @@ def filter_signal(signal: List[List[float]], fs: float) -> Tuple[List[List[float
         }
 
 
-def normalize_signal(signal: List[List[float]]) -> Tuple[List[List[float]], Dict[str, Any]]:
-    """Etapa 3: Normalización Min-Max"""
-    try:
-        num_samples = len(signal)
-        num_channels = len(signal[0]) if signal else 3
-        
-        normalized = [[0.0] * num_channels for _ in range(num_samples)]
-        
-        for channel in range(num_channels):
-            channel_values = [s[channel] for s in signal 
-                             if len(s) > channel and 
-                             not (s[channel] != s[channel] or not (-1e10 < s[channel] < 1e10))]
-            
-            if len(channel_values) == 0:
-                for i in range(num_samples):
-                    normalized[i][channel] = signal[i][channel] if i < len(signal) and len(signal[i]) > channel else 0
-                continue
-            
-            # Min-Max normalization: (x - min) / (max - min)
-            min_val = min(channel_values)
-            max_val = max(channel_values)
-            range_val = max_val - min_val
-            
-            # Evitar división por cero si el canal es completamente plano
-            if range_val < 1e-10:
-                range_val = 1.0
-            
-            for i in range(num_samples):
-                value = signal[i][channel] if i < len(signal) and len(signal[i]) > channel else 0
-                if -1e10 < value < 1e10 and value == value:  # Check for NaN and Inf
-                    normalized[i][channel] = (value - min_val) / range_val
-                else:
-                    normalized[i][channel] = 0
-        
-        return normalized, {
-            'status': 'OK',
-            'mensaje': 'Normalización completada exitosamente',
-            'metodo': 'min-max (por canal)'
-        }
-    except Exception as e:
-        logger.error(f"Error en normalización: {str(e)}")
-        return signal, {
-            'status': 'ERROR',
-            'mensaje': f'Error en normalización: {str(e)}',
-            'metodo': 'ninguno'
-        }
+# Detección de picos R (estilo Pan-Tompkins, sin bucles por muestra): pasa banda
+# 5-15 Hz, derivada, cuadrado, integración en ventana móvil y máximos locales con
+# período refractario y umbral adaptativo relativo a los picos vecinos
+BEAT_LEAD = 'II'  # Si el request no la incluye se usa la primera derivación
+BEAT_BAND_HZ = (5, 15)
+BEAT_INTEGRATION_S = 0.15
+BEAT_REFRACTORY_S = 0.2
+BEAT_THRESHOLD = 0.3  # Fracción del nivel de los picos vecinos
+BEAT_NEIGHBORS = 8  # Candidatos a cada lado para estimar ese nivel
+BEAT_WINDOW_S = (0.25, 0.4)  # Segmentos por latido: antes y después del pico R
+
+
+def beat_parameters(request_data: Dict[str, Any] = None, leads: Sequence[str] = ECG_LEADS) -> Dict[str, Any]:
+    """Opciones de la etapa de latidos: derivación (y su canal), segmentos por latido y su ventana en segundos"""
+    request_data = request_data or {}
+    window = request_data.get('beatWindow') or BEAT_WINDOW_S
+    if not isinstance(window, (list, tuple)) or len(window) != 2:
+        raise ValueError('beatWindow debe ser [segundos antes, segundos después] del pico R')
+    lead = BEAT_LEAD if BEAT_LEAD in leads else leads[0]
+    return {
+        'derivacion': lead,
+        'canal': list(leads).index(lead),
+        'segments': bool(request_data.get('beatSegments', False)),
+        'window_s': [numeric_option({'beatWindow': window[0]}, 'beatWindow'),
+                     numeric_option({'beatWindow': window[1]}, 'beatWindow')]
+    }
+
+
+@functools.lru_cache(maxsize=16)
+def _qrs_band_sos(fs: float) -> np.ndarray:
+    sos = butter_bandpass_sos(fs, BEAT_BAND_HZ[0], BEAT_BAND_HZ[1], 1)
+    sos.setflags(write=False)
+    return sos
+
 
+def sliding_max(x: np.ndarray, half_width: int) -> np.ndarray:
+    """Máximo en la ventana centrada [i - h, i + h] en O(n) (van Herk / Gil-Werman por bloques)"""
+    width = 2 * half_width + 1
+    num_samples = x.shape[0]
+    num_blocks = -(-(num_samples + width - 1) // width)
+    padded = np.full(num_blocks * width, -np.inf)
+    padded[half_width:half_width + num_samples] = x
+    blocks = padded.reshape(num_blocks, width)
+    # Cada ventana cruza a lo sumo dos bloques: sufijo del primero y prefijo del segundo
+    prefix = np.maximum.accumulate(blocks, axis=1).ravel()
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.maximum(suffix[:num_samples], prefix[width - 1:width - 1 + num_samples])
 
-def resample_to_200hz(signal: List[List[float]], original_fs: float) -> Tuple[List[List[float]], Dict[str, Any]]:
-    """Etapa 4: Resampling a 200 Hz"""
-    target_fs = 200
-    num_channels = len(signal[0]) if signal else 3
-    original_samples = len(signal)
+
+def detect_r_peaks(lead: np.ndarray, fs: float) -> np.ndarray:
+    """Índices de los picos R de una derivación filtrada"""
+    refractory = max(1, int(BEAT_REFRACTORY_S * fs))
+    integration = max(1, int(BEAT_INTEGRATION_S * fs))
     
-    try:
-        if abs(original_fs - target_fs) < 0.1:
-            return signal, {
-                'status': 'OK',
-                'mensaje': 'Señal ya está a 200 Hz',
-                'fs_final': target_fs,
-                'muestras_originales': original_samples,
-                'muestras_finales': original_samples
-            }
-        
-        duration = original_samples / original_fs
-        target_samples = int(round(duration * target_fs))
-        
-        resampled = [[0.0] * num_channels for _ in range(target_samples)]
-        
-        for channel in range(num_channels):
-            channel_signal = [s[channel] for s in signal]
-            resampled_channel = [0.0] * target_samples
-            
-            for i in range(target_samples):
-                t = (i / target_fs) * original_fs
-                index = int(t)
-                fraction = t - index
-                
-                if index >= original_samples - 1:
-                    resampled_channel[i] = channel_signal[original_samples - 1]
-                else:
-                    resampled_channel[i] = (channel_signal[index] * (1 - fraction) + 
-                                          channel_signal[index + 1] * fraction)
-            
-            for i in range(target_samples):
-                resampled[i][channel] = resampled_channel[i]
-        
-        return resampled, {
-            'status': 'OK',
-            'mensaje': f'Resampling completado: {original_fs} Hz → {target_fs} Hz',
-            'fs_final': target_fs,
-            'muestras_originales': original_samples,
-            'muestras_finales': target_samples
-        }
-    except Exception as e:
-        logger.error(f"Error en resampling: {str(e)}")
+    # Realce del QRS: pasa banda (fase cero), derivada de 5 puntos, cuadrado e integración
+    band = apply_sos_zero_phase(_qrs_band_sos(fs), np.where(valid_mask(lead), lead, 0.0))
+    derivative = np.convolve(band, np.array([2, 1, 0, -1, -2]) * fs / 8, mode='same')
+    cumulative = np.concatenate([[0.0], np.cumsum(derivative ** 2)])
+    energy = np.empty_like(band)
+    energy[:integration] = cumulative[1:integration + 1] / integration
+    energy[integration:] = (cumulative[integration + 1:] - cumulative[1:-integration]) / integration
+    
+    # Candidatos: máximos de la energía en ±período refractario
+    candidates = np.flatnonzero((energy == sliding_max(energy, refractory)) & (energy > 0))
+    if candidates.size == 0:
+        return candidates
+    candidates = candidates[np.concatenate([[True], np.diff(candidates) > 1])]
+    
+    # Umbral adaptativo: fracción del percentil 75 de los candidatos vecinos (en los
+    # bordes, reflejados)
+    heights = energy[candidates]
+    neighbors = sliding_window_view(np.pad(heights, BEAT_NEIGHBORS, mode='symmetric'), 2 * BEAT_NEIGHBORS + 1)
+    rank = 3 * BEAT_NEIGHBORS // 2
+    reference = np.partition(neighbors, rank, axis=1)[:, rank]
+    candidates = candidates[heights >= BEAT_THRESHOLD * reference]
+    
+    # El pico R es el máximo de |pasa banda| en la ventana de integración que termina en el candidato
+    starts = np.maximum(candidates - integration + 1, 0)
+    offsets = np.arange(integration)
+    window = np.minimum(starts[:, np.newaxis] + offsets, lead.shape[0] - 1)
+    peaks = window[np.arange(window.shape[0]), np.abs(band[window]).argmax(axis=1)]
+    return peaks[np.concatenate([[True], np.diff(peaks) >= refractory])] if peaks.size else peaks
+
+
+def rr_statistics(peaks: np.ndarray, fs: float) -> Optional[Dict[str, float]]:
+    """Frecuencia cardíaca y estadísticas de los intervalos RR (None con menos de dos latidos)"""
+    if peaks.size < 2:
+        return None
+    rr = np.diff(peaks) * 1000 / fs
+    return {
+        'frecuencia_cardiaca_lpm': round(float(60000 / rr.mean()), 2),
+        'rr_media_ms': round(float(rr.mean()), 2),
+        'rr_mediana_ms': round(float(np.median(rr)), 2),
+        'rr_min_ms': round(float(rr.min()), 2),
+        'rr_max_ms': round(float(rr.max()), 2),
+        'sdnn_ms': round(float(rr.std()), 2),
+        'rmssd_ms': round(float(np.sqrt(np.mean(np.diff(rr) ** 2))), 2) if rr.size > 1 else 0.0
+    }
+
+
+def beat_segments(signal: np.ndarray, peaks: np.ndarray, fs: float,
+                  window_s: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """Segmentos alineados al pico R [latidos, muestras, canales] de los latidos que entran completos"""
+    before, after = int(round(window_s[0] * fs)), int(round(window_s[1] * fs))
+    inside = peaks[(peaks >= before) & (peaks + after <= signal.shape[0])]
+    return signal[inside[:, np.newaxis] + np.arange(-before, after)], inside
+
+
+def beat_status(peaks: np.ndarray, fs: float, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Estado de la etapa de latidos a partir de los picos R: cantidad, índices y estadísticas RR"""
+    stats = rr_statistics(peaks, fs)
+    return {
+        'status': 'OK' if stats is not None else 'ERROR',
+        'mensaje': f'{peaks.size} latidos detectados' if stats is not None else 'Latidos insuficientes para estimar la frecuencia cardíaca',
+        'derivacion': params['derivacion'],
+        'num_latidos': int(peaks.size),
+        'indices_r': peaks.tolist(),
+        **(stats or {})
+    }
+
+
+def detect_beats(signal: np.ndarray, fs: float,
+                 params: Dict[str, Any] = None) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+    """
+    Etapa de latidos: picos R en la derivación de params (II por defecto) de la señal
+    filtrada (o en la derivación sola, si signal es 1D), frecuencia cardíaca y
+    estadísticas RR. Retorna
+    (segmentos o None, estado); si se piden segmentos, son ventanas alineadas al pico R
+    de todos los canales.
+    """
+    params = params or beat_parameters()
+    try:
+        if fs < 2 * BEAT_BAND_HZ[1] + 1:
+            raise ValueError(f'fs insuficiente para detectar latidos: {fs} Hz')
+        peaks = detect_r_peaks(signal if signal.ndim == 1 else signal[:, params['canal']], fs)
+        result = beat_status(peaks, fs, params)
+        segments = None
+        if params['segments']:
+            segments, inside = beat_segments(signal, peaks, fs, params['window_s'])
+            result['segmentos'] = {'shape': list(segments.shape), 'indices_r': inside.tolist(),
+                                   'ventana_s': params['window_s']}
+        return segments, result
+    except Exception as e:
+        logger.error(f"Error detectando latidos: {str(e)}")
+        return None, {
+            'status': 'ERROR',
+            'mensaje': f'Error detectando latidos: {str(e)}',
+            'num_latidos': 0
+        }
+
+
+def min_max_range(signal: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Mínimo y máximo por canal de los valores válidos: (min, max, canal_con_valores)"""
+    mask = valid_mask(signal)
+    if signal.shape[0] and mask.all():
+        return signal.min(axis=0), signal.max(axis=0), np.ones(signal.shape[1], dtype=bool)
+    min_val = np.where(mask, signal, np.inf).min(axis=0, initial=np.inf)
+    max_val = np.where(mask, signal, -np.inf).max(axis=0, initial=-np.inf)
+    return min_val, max_val, mask.any(axis=0)
+
+
+def apply_min_max(signal: np.ndarray, min_val: np.ndarray, max_val: np.ndarray,
+                  has_valid: np.ndarray) -> np.ndarray:
+    """Aplica (x - min) / (max - min) por canal; los valores inválidos quedan en 0"""
+    range_val = max_val - min_val
+    
+    # Evitar división por cero si el canal es completamente plano
+    range_val = np.where(has_valid & (range_val >= 1e-10), range_val, 1.0)
+    min_val = np.where(has_valid, min_val, 0.0)
+    
+    with np.errstate(invalid='ignore', over='ignore'):
+        normalized = np.where(valid_mask(signal), (signal - min_val) / range_val, 0.0)
+    
+    # Canales sin valores válidos se devuelven sin modificar
+    if not has_valid.all():
+        normalized[:, ~has_valid] = signal[:, ~has_valid]
+    return normalized
+
+
+def z_score_parameters(signal: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Media y desvío por canal de los valores válidos (desvío 1 en canales planos)"""
+    mask = valid_mask(signal)
+    count = np.maximum(mask.sum(axis=0), 1)
+    values = np.where(mask, signal, 0.0)
+    mean = values.sum(axis=0) / count
+    std = np.sqrt((np.where(mask, values - mean, 0.0) ** 2).sum(axis=0) / count)
+    
+    # Canales planos: solo se centran
+    return mean, np.where(std >= 1e-10, std, 1.0)
+
+
+def apply_z_score(signal: np.ndarray, mean: np.ndarray = None, std: np.ndarray = None) -> np.ndarray:
+    """Aplica (x - media) / desvío por canal sobre los valores válidos; los inválidos quedan en 0"""
+    if mean is None:
+        mean, std = z_score_parameters(signal)
+    with np.errstate(invalid='ignore', over='ignore'):
+        return np.where(valid_mask(signal), (signal - mean) / std, 0.0)
+
+
+def normalize_signal(signal: np.ndarray, method: str = 'min-max',
+                     out: np.ndarray = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Etapa 3: Normalización Min-Max (o z-score, según el modelo)
+    
+    Como en filter_signal, con out (puede ser la propia señal) o una señal que no es
+    float64 los parámetros se calculan sobre toda la señal y se aplican por bloques en out.
+    """
+    try:
+        if method == 'z-score':
+            parameters = z_score_parameters(signal)
+            apply = apply_z_score
+        else:
+            # Min-Max normalization: (x - min) / (max - min)
+            method = 'min-max'
+            parameters = min_max_range(signal)
+            apply = apply_min_max
+        
+        if out is None and signal.dtype == np.float64:
+            normalized = apply(signal, *parameters)
+        else:
+            normalized = out if out is not None else np.empty_like(signal)
+            for start in range(0, signal.shape[0], STAGE_BLOCK_SAMPLES):
+                block = slice(start, start + STAGE_BLOCK_SAMPLES)
+                normalized[block] = apply(signal[block], *parameters)
+        
+        return normalized, {
+            'status': 'OK',
+            'mensaje': 'Normalización completada exitosamente',
+            'metodo': f'{method} (por canal)'
+        }
+    except Exception as e:
+        logger.error(f"Error en normalización: {str(e)}")
+        return signal, {
+            'status': 'ERROR',
+            'mensaje': f'Error en normalización: {str(e)}',
+            'metodo': 'ninguno'
+        }
+
+
+# Remuestreo polifásico: la razón target_fs / original_fs se expresa como up / down y el
+# filtro antialiasing (sinc con ventana de Kaiser) se diseña una sola vez por razón
+RESAMPLE_MAX_FACTOR = 1000
+RESAMPLE_HALF_TAPS = 10  # Coeficientes por lado del filtro, por unidad de max(up, down)
+RESAMPLE_KAISER_BETA = 5.0
+
+# Plan de remuestreo: (up, down, fases del filtro [up, taps], retardo del filtro)
+ResamplePlan = Tuple[int, int, np.ndarray, int]
+
+
+def resampling_status(original_fs: float, target_fs: float,
+                      original_samples: int, target_samples: int, method: str = None) -> Dict[str, Any]:
+    """Estado de la etapa de resampling"""
+    if abs(original_fs - target_fs) < 0.1:
+        return {
+            'status': 'OK',
+            'mensaje': f'Señal ya está a {target_fs} Hz',
+            'fs_final': target_fs,
+            'muestras_originales': original_samples,
+            'muestras_finales': original_samples
+        }
+    status = {
+        'status': 'OK',
+        'mensaje': f'Resampling completado: {original_fs} Hz → {target_fs} Hz',
+        'fs_final': target_fs,
+        'muestras_originales': original_samples,
+        'muestras_finales': target_samples
+    }
+    if method:
+        status['metodo'] = method
+    return status
+
+
+@functools.lru_cache(maxsize=16)
+def polyphase_kernel(up: int, down: int) -> Tuple[np.ndarray, int]:
+    """Filtro antialiasing descompuesto en fases: (fases [up, taps], retardo)"""
+    max_rate = max(up, down)
+    half_len = RESAMPLE_HALF_TAPS * max_rate
+    n = np.arange(-half_len, half_len + 1)
+    # Pasa bajos con corte en la menor de las dos frecuencias de Nyquist
+    h = np.sinc(n / max_rate) * np.kaiser(n.size, RESAMPLE_KAISER_BETA)
+    
+    # phases[p, j] = h[p + j * up]
+    taps = -(-h.size // up)
+    padded = np.zeros(taps * up)
+    padded[:h.size] = h
+    phases = padded.reshape(taps, up).T.copy()
+    # Ganancia unitaria en continua por fase: una señal constante sigue constante y el
+    # remuestreo conmuta con transformaciones afines (p. ej. la normalización min-max)
+    phases /= phases.sum(axis=1, keepdims=True)
+    phases.setflags(write=False)
+    return phases, half_len
+
+
+def resample_plan(original_fs: float, target_fs: float) -> Optional[ResamplePlan]:
+    """Plan polifásico para original_fs → target_fs, o None si la razón no es racional simple"""
+    ratio = Fraction(target_fs / original_fs).limit_denominator(RESAMPLE_MAX_FACTOR)
+    if ratio.numerator == 0 or ratio.numerator > RESAMPLE_MAX_FACTOR:
+        return None
+    if abs(float(ratio) * original_fs / target_fs - 1) > 1e-9:
+        return None
+    up, down = ratio.numerator, ratio.denominator
+    phases, half_len = polyphase_kernel(up, down)
+    return up, down, phases, half_len
+
+
+def polyphase_first_input(plan: ResamplePlan, m: int) -> int:
+    """Primera muestra de entrada que necesita la salida m"""
+    up, down, phases, half_len = plan
+    return (m * down + half_len) // up - phases.shape[1] + 1
+
+
+def polyphase_ready(plan: ResamplePlan, num_inputs: int) -> int:
+    """Cantidad de salidas que se pueden calcular con las primeras num_inputs muestras"""
+    up, down, _, half_len = plan
+    return max((num_inputs * up - 1 - half_len) // down + 1, 0)
+
+
+def polyphase_block(plan: ResamplePlan, x: np.ndarray, start: int,
+                    m_start: int, m_stop: int) -> np.ndarray:
+    """
+    Salidas m_start..m_stop-1 del remuestreo, todos los canales a la vez.
+    
+    x contiene las muestras de entrada a partir del índice start (puede ser negativo
+    si incluye relleno); debe cubrir todas las muestras que necesitan esas salidas.
+    """
+    up, down, phases, half_len = plan
+    taps = phases.shape[1]
+    resampled = np.empty((max(m_stop - m_start, 0),) + x.shape[1:], dtype=x.dtype)
+    if resampled.shape[0] == 0:
+        return resampled
+    # windows[i] = x[i:i + taps] por canal, sin copiar
+    windows = sliding_window_view(x, taps, axis=0)
+    
+    # Las salidas m, m + up, m + 2 * up, ... usan la misma fase del filtro y ventanas
+    # de entrada separadas por down muestras: y[m] = sum_j h[fase + j * up] * x[q - j].
+    # Los coeficientes van en el dtype de x: si no, matmul copia las ventanas convertidas
+    phases = phases.astype(x.dtype, copy=False)
+    for offset in range(min(up, resampled.shape[0])):
+        r = (m_start + offset) * down + half_len
+        phase = r % up
+        first = r // up - start - taps + 1
+        count = len(range(offset, resampled.shape[0], up))
+        selected = windows[first:first + (count - 1) * down + 1:down]
+        resampled[offset::up] = selected @ phases[phase, ::-1]
+    return resampled
+
+
+def resample_polyphase(signal: np.ndarray, plan: ResamplePlan, target_samples: int) -> np.ndarray:
+    """Remuestreo polifásico de la señal completa, extendiendo los bordes con la primera y última muestra"""
+    pad = plan[2].shape[1] + 1
+    padded = np.concatenate([np.repeat(signal[:1], pad, axis=0), signal,
+                             np.repeat(signal[-1:], pad, axis=0)])
+    return polyphase_block(plan, padded, -pad, 0, target_samples)
+
+
+def resample_linear(signal: np.ndarray, original_fs: float, target_fs: float,
+                    target_samples: int) -> np.ndarray:
+    """Interpolación lineal de todos los canales a la vez (sin filtro antialiasing)"""
+    original_samples = signal.shape[0]
+    t = (np.arange(target_samples) / target_fs) * original_fs
+    index = t.astype(np.int64)
+    fraction = (t - index)[:, np.newaxis]
+    
+    beyond_end = index >= original_samples - 1
+    index = np.minimum(index, original_samples - 2)
+    resampled = (signal[index] * (1 - fraction) + signal[index + 1] * fraction).astype(signal.dtype, copy=False)
+    resampled[beyond_end] = signal[original_samples - 1]
+    return resampled
+
+
+def resample_to_200hz(signal: np.ndarray, original_fs: float,
+                      target_fs: float = TARGET_FS) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Etapa 4: Resampling a 200 Hz (o a la fs de entrada del modelo)"""
+    original_samples = signal.shape[0]
+    
+    try:
+        if abs(original_fs - target_fs) < 0.1:
+            return signal, resampling_status(original_fs, target_fs, original_samples, original_samples)
+        
+        duration = original_samples / original_fs
+        target_samples = int(round(duration * target_fs))
+        
+        # Polifásico con antialiasing; si la razón de frecuencias no es una fracción
+        # exacta (p. ej. fs estimada con ruido), interpolación lineal
+        plan = resample_plan(original_fs, target_fs)
+        if plan is not None:
+            resampled = resample_polyphase(signal, plan, target_samples)
+            method = f'polifásico {plan[0]}/{plan[1]}'
+        else:
+            resampled = resample_linear(signal, original_fs, target_fs, target_samples)
+            method = 'interpolación lineal'
+        
+        return resampled, resampling_status(original_fs, target_fs, original_samples, target_samples, method)
+    except Exception as e:
+        logger.error(f"Error en resampling: {str(e)}")
         return signal, {
             'status': 'ERROR',
             'mensaje': f'Error en resampling: {str(e)}',
@@ -378,22 +1419,919 @@ def resample_to_200hz(signal: List[List[float]], original_fs: float) -> Tuple[Li
         }
 
 
-def convert_to_model_input(signal: List[List[float]], target_length: int = 2000) -> List[List[List[float]]]:
+def convert_to_model_input(signal: np.ndarray, target_length: int = 2000) -> np.ndarray:
     """Convierte señal a formato del modelo [1, 2000, 3]"""
-    num_channels = len(signal[0]) if signal else 3
-    current_length = len(signal)
+    num_channels = signal.shape[1] if signal.ndim > 1 else 3
+    current_length = min(signal.shape[0], target_length)
+    
+    # Trunca o rellena con ceros hasta target_length
+    model_input = np.zeros((1, target_length, num_channels), dtype=signal.dtype)
+    model_input[0, :current_length] = signal[:current_length]
+    
+    return model_input
+
+
+def window_signal(signal: np.ndarray, window_length: int = 2000, hop: int = None) -> np.ndarray:
+    """
+    Divide la señal en ventanas del modelo [N, 2000, 3]
+    
+    Las ventanas avanzan de a hop muestras (solapadas si hop < window_length). Si
+    queda una cola sin cubrir se agrega una última ventana alineada al final de la
+    señal; una señal más corta que una ventana se rellena con ceros.
+    """
+    hop = int(hop) if hop and int(hop) > 0 else window_length
+    num_samples = signal.shape[0]
+    if num_samples <= window_length:
+        return convert_to_model_input(signal, window_length)
+    
+    starts = list(range(0, num_samples - window_length + 1, hop))
+    if starts[-1] + window_length < num_samples:
+        starts.append(num_samples - window_length)
+    
+    indices = np.array(starts)[:, np.newaxis] + np.arange(window_length)
+    return signal[indices]
+
+
+# Registro de modelos: endpoint y entrada que espera cada uno. Los modelos adicionales se
+# configuran con ECG_MODEL_REGISTRY (JSON o ruta a un archivo JSON) con el formato
+# {"id": {"nombre": ..., "endpoint": ..., "input_length": ..., "target_fs": ...,
+# "normalizacion": "min-max" | "z-score", "peso": ..., "derivaciones": [...]}}; los campos
+# omitidos toman los valores del modelo por defecto
+DEFAULT_MODEL_ID = 'default'
+NORMALIZATION_METHODS = ('min-max', 'z-score')
+
+
+def parse_leads(leads: Any, field: str = 'leads') -> Tuple[str, ...]:
+    """Lista de derivaciones (o nombres separados por comas) sin repetidos; ValueError si no es válida"""
+    if isinstance(leads, str):
+        leads = [lead.strip() for lead in leads.split(',') if lead.strip()]
+    if not isinstance(leads, (list, tuple)) or not leads or not all(isinstance(lead, str) and lead for lead in leads):
+        raise ValueError(f'{field} debe ser una lista no vacía de derivaciones')
+    repeated = sorted({lead for lead in leads if leads.count(lead) > 1})
+    if repeated:
+        raise ValueError(f"{field} tiene derivaciones repetidas: {', '.join(repeated)}")
+    return tuple(leads)
+
+
+def load_model_registry() -> Dict[str, Dict[str, Any]]:
+    """Modelo por defecto (SAGEMAKER_ENDPOINT) más los de ECG_MODEL_REGISTRY"""
+    default = {
+        'nombre': 'CNN1D-LSTM ECG v1',
+        'endpoint': get_endpoint_name(),
+        'input_length': MODEL_INPUT_LENGTH,
+        'target_fs': TARGET_FS,
+        'normalizacion': 'min-max',
+        'peso': 1.0,
+        'derivaciones': ECG_LEADS
+    }
+    registry = {DEFAULT_MODEL_ID: default}
+    
+    config = os.environ.get('ECG_MODEL_REGISTRY', '').strip()
+    if config and not config.startswith('{'):
+        with open(config, encoding='utf-8') as f:
+            config = f.read()
+    for model_id, spec in (json.loads(config) if config else {}).items():
+        model = {**default, 'nombre': model_id, **spec}
+        if model['normalizacion'] not in NORMALIZATION_METHODS:
+            raise ValueError(f"Normalización desconocida para el modelo {model_id}: {model['normalizacion']}")
+        model['input_length'] = int(model['input_length'])
+        model['peso'] = float(model['peso'])
+        model['derivaciones'] = parse_leads(model['derivaciones'], f'derivaciones del modelo {model_id}')
+        registry[model_id] = model
+    return registry
+
+
+model_registry = load_model_registry()
+
+
+def resolve_models(model_ids: Any = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Modelos pedidos en el request ("modelId": un id, una lista de ids o ids separados
+    por comas) como [(id, especificación)]; sin modelId, el modelo por defecto
+    """
+    if not model_ids:
+        model_ids = [DEFAULT_MODEL_ID]
+    elif isinstance(model_ids, str):
+        model_ids = [model_id.strip() for model_id in model_ids.split(',') if model_id.strip()]
+    
+    unknown = [model_id for model_id in model_ids if model_id not in model_registry]
+    if unknown:
+        raise ValueError(f"Modelo desconocido: {', '.join(unknown)} (disponibles: {', '.join(model_registry)})")
+    return [(model_id, model_registry[model_id]) for model_id in dict.fromkeys(model_ids)]
+
+
+def request_leads(request_data: Dict[str, Any], models: List[Tuple[str, Dict[str, Any]]]) -> Tuple[str, ...]:
+    """
+    Derivaciones a procesar: las de "leads" en el request o, por defecto, las que usan los
+    modelos pedidos. ValueError si algún modelo necesita una derivación que no está.
+    """
+    required = tuple(dict.fromkeys(lead for _, model in models for lead in model['derivaciones']))
+    if request_data.get('leads') is None:
+        return required
+    leads = parse_leads(request_data['leads'])
+    missing = [lead for lead in required if lead not in leads]
+    if missing:
+        raise ValueError(f"Los modelos pedidos usan derivaciones que no están en leads: {', '.join(missing)}")
+    return leads
+
+
+def signal_precision(request_data: Dict[str, Any]) -> str:
+    """Precisión de las señales del request ("precision", por defecto ECG_PRECISION); ValueError si no es válida"""
+    precision = request_data.get('precision') or DEFAULT_PRECISION
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision no soportada: {precision} (disponibles: {', '.join(PRECISIONS)})")
+    return precision
+
+
+def in_place_stages(request_data: Dict[str, Any], models: List[Tuple[str, Dict[str, Any]]]) -> Set[str]:
+    """
+    Etapas que escriben su salida sobre su entrada (solo con precision float32): el
+    filtrado sobre la señal original y la normalización sobre la filtrada, si la respuesta
+    no incluye esa señal. Esas entradas no se guardan en la caché de etapas.
+    """
+    if signal_precision(request_data) != 'float32':
+        return set()
+    outputs = parse_output_options(request_data)['outputs']
+    stages = set()
+    if 'original' not in outputs:
+        stages.add('filtrado')
+    # Un ensemble con otra normalización la calcula desde la señal filtrada
+    if 'filtrada' not in outputs and len({model['normalizacion'] for _, model in models}) == 1:
+        stages.add('normalizacion')
+    return stages
+
+
+def windows_per_batch(window_shape: Sequence[int], max_payload_bytes: int = SAGEMAKER_MAX_PAYLOAD_BYTES) -> int:
+    """Ventanas de forma window_shape que entran seguro en un payload JSON de max_payload_bytes"""
+    # Cota del tamaño JSON de una ventana: cada valor ocupa a lo sumo JSON_FLOAT_MAX_CHARS
+    # más el separador, y cada fila y la ventana agregan corchetes y separador
+    rows = int(np.prod(window_shape[:-1])) if len(window_shape) > 1 else 1
+    values = int(np.prod(window_shape))
+    window_bytes = values * (JSON_FLOAT_MAX_CHARS + 2) + rows * 4 + 4
+    return max(1, (max_payload_bytes - 64) // window_bytes)
+
+
+def split_batches(windows: np.ndarray, max_payload_bytes: int = SAGEMAKER_MAX_PAYLOAD_BYTES) -> List[np.ndarray]:
+    """Agrupa las ventanas en lotes cuyo payload JSON no supere el límite del endpoint"""
+    per_batch = windows_per_batch(windows.shape[1:], max_payload_bytes)
+    return [windows[i:i + per_batch] for i in range(0, windows.shape[0], per_batch)]
+
+
+def _parse_probabilities(model_response: Dict[str, Any], num_windows: int) -> np.ndarray:
+    """Extrae una probabilidad por ventana de la respuesta del endpoint"""
+    probability = model_response.get('probability') or model_response.get('prediction') or 0
+    probabilities = np.asarray(probability, dtype=np.float64).ravel()
+    if probabilities.size != num_windows:
+        raise ValueError(f'El endpoint devolvió {probabilities.size} probabilidades para {num_windows} ventanas')
+    return probabilities
+
+
+def aggregate_predictions(probabilities: np.ndarray, aggregation: str = 'mean') -> Dict[str, Any]:
+    """Combina las probabilidades por ventana en una predicción del registro completo"""
+    if probabilities.size == 1:
+        probability = float(probabilities[0])
+        return {
+            'clase': 'anomalo' if probability > 0.5 else 'normal',
+            'score': probability
+        }
+    
+    if aggregation == 'max':
+        probability = float(probabilities.max())
+    else:
+        aggregation = 'mean'
+        probability = float(probabilities.mean())
     
-    model_input = [[[0.0] * num_channels for _ in range(target_length)]]
+    return {
+        'clase': 'anomalo' if probability > 0.5 else 'normal',
+        'score': probability,
+        'agregacion': aggregation,
+        'ventanas': int(probabilities.size),
+        'ventanas_anomalas': int((probabilities > 0.5).sum()),
+        'scores_ventanas': probabilities.tolist()
+    }
+
+
+def model_requests(model_input: np.ndarray, endpoint_name: str) -> Tuple[List[int], List[Tuple[str, bytes]]]:
+    """Lotes del tensor que respetan el límite de payload: (ventanas por lote, (endpoint, body) por lote)"""
+    batches = split_batches(model_input)
+    requests = [
+        (endpoint_name, json.dumps({'signals': batch.tolist()}, ensure_ascii=False).encode('utf-8'))
+        for batch in batches
+    ]
+    return [batch.shape[0] for batch in batches], requests
+
+
+def batch_probabilities(batch_sizes: List[int], responses: List[Any]) -> List[Any]:
+    """Probabilidades de cada lote, o la excepción si la llamada o su respuesta fallaron"""
+    probabilities = []
+    for model_response, size in zip(responses, batch_sizes):
+        if isinstance(model_response, Exception):
+            probabilities.append(model_response)
+            continue
+        try:
+            probabilities.append(_parse_probabilities(model_response, size))
+        except Exception as e:
+            probabilities.append(e)
+    return probabilities
+
+
+def model_prediction(model: Dict[str, Any], probabilities: List[Any],
+                     aggregation: str = 'mean') -> Tuple[Any, Dict[str, Any]]:
+    """(prediccion, modelo_info) de un modelo a partir de las probabilidades de sus lotes"""
+    try:
+        for batch in probabilities:
+            if isinstance(batch, Exception):
+                raise batch
+        prediccion = aggregate_predictions(np.concatenate(probabilities), aggregation)
+    except Exception as sagemaker_error:
+        logger.error(f"Error llamando a SageMaker ({model['endpoint']}): {str(sagemaker_error)}")
+        # Continuar sin predicción
+        return None, {'nombre': 'N/A', 'endpoint': 'N/A', 'metadata': {}, 'error': str(sagemaker_error)}
     
-    for i in range(target_length):
-        if i < current_length:
-            for channel in range(num_channels):
-                model_input[0][i][channel] = signal[i][channel] if len(signal[i]) > channel else 0
+    metadata = {'llamadas_endpoint': len(probabilities)} if len(probabilities) > 1 else {}
+    return prediccion, {'nombre': model['nombre'], 'endpoint': model['endpoint'], 'metadata': metadata}
+
+
+def model_result(model: Dict[str, Any], batch_sizes: List[int], responses: List[Any],
+                 aggregation: str = 'mean') -> Tuple[Any, Dict[str, Any]]:
+    """(prediccion, modelo_info) de un modelo a partir de las respuestas de sus lotes"""
+    return model_prediction(model, batch_probabilities(batch_sizes, responses), aggregation)
+
+
+def record_probabilities(batch_sizes: List[int], probabilities: List[Any],
+                         record_sizes: List[int]) -> List[List[Any]]:
+    """
+    Reparte las probabilidades de lotes que apilan las ventanas de varios registros:
+    por registro, el tramo de cada lote que contiene ventanas suyas (o la excepción del lote)
+    """
+    batch_ends = np.cumsum(batch_sizes)
+    per_record = []
+    start = 0
+    for size in record_sizes:
+        end = start + size
+        tramos = []
+        for index, (batch_end, batch) in enumerate(zip(batch_ends, probabilities)):
+            batch_start = batch_end - batch_sizes[index]
+            if batch_end <= start or batch_start >= end:
+                continue
+            if isinstance(batch, Exception):
+                tramos.append(batch)
+            else:
+                tramos.append(batch[max(start, batch_start) - batch_start:min(end, batch_end) - batch_start])
+        per_record.append(tramos)
+        start = end
+    return per_record
+
+
+def ensemble_predictions(models: List[Tuple[str, Dict[str, Any]]],
+                         results: Dict[str, Tuple[Any, Dict[str, Any]]]) -> Tuple[Any, Dict[str, Any]]:
+    """Combina las predicciones de varios modelos con un promedio ponderado de los scores"""
+    scores = {model_id: (results[model_id][0]['score'], model['peso'])
+              for model_id, model in models if results[model_id][0] is not None}
+    modelo_info = {
+        'nombre': 'Ensemble: ' + ' + '.join(model['nombre'] for _, model in models),
+        'endpoint': ', '.join(model['endpoint'] for _, model in models),
+        'metadata': {'modelos': {model_id: results[model_id][1] for model_id, _ in models}}
+    }
+    if not scores:
+        modelo_info['error'] = 'Ningún modelo del ensemble respondió'
+        return None, modelo_info
+    failed = [model_id for model_id, _ in models if model_id not in scores]
+    if failed:
+        modelo_info['error'] = f"Sin respuesta de: {', '.join(failed)}"
+    
+    total_weight = sum(weight for _, weight in scores.values())
+    score = float(sum(score * weight for score, weight in scores.values()) / total_weight)
+    prediccion = {
+        'clase': 'anomalo' if score > 0.5 else 'normal',
+        'score': score,
+        'ensemble': {
+            'modelos': {model_id: results[model_id][0] for model_id, _ in models},
+            'pesos': {model_id: weight for model_id, (_, weight) in scores.items()}
+        }
+    }
+    return prediccion, modelo_info
+
+
+def invoke_records(models: List[Tuple[str, Dict[str, Any]]], records_inputs: List[Dict[str, np.ndarray]],
+                   aggregation: str = 'mean') -> Tuple[List[Tuple[Any, Dict[str, Any]]], Dict[str, int]]:
+    """
+    Inferencia de varios registros: las ventanas de todos se apilan en un solo tensor por
+    modelo (lotes con el límite de payload, todas las llamadas en paralelo) y las
+    probabilidades se reparten de vuelta. Retorna (prediccion, modelo_info) por registro y
+    las estadísticas de las llamadas ({'llamadas', 'intentos', 'hedges'}).
+    
+    Un lote fallido deja sin predicción solo a los registros con ventanas en ese lote.
+    """
+    record_sizes = {model_id: [inputs[model_id].shape[0] for inputs in records_inputs] for model_id, _ in models}
+    batch_sizes = {}
+    requests = []
+    for model_id, model in models:
+        stacked = np.concatenate([inputs[model_id] for inputs in records_inputs]) \
+            if len(records_inputs) > 1 else records_inputs[0][model_id]
+        batch_sizes[model_id], model_batches = model_requests(stacked, model['endpoint'])
+        requests.extend(model_batches)
+    
+    try:
+        responses, stats = get_inference_client().invoke_many(requests, return_exceptions=True)
+    except Exception as e:
+        responses, stats = [e] * len(requests), {'intentos': 0, 'hedges': 0}
+    
+    per_model = {}
+    offset = 0
+    for model_id, _ in models:
+        count = len(batch_sizes[model_id])
+        probabilities = batch_probabilities(batch_sizes[model_id], responses[offset:offset + count])
+        per_model[model_id] = record_probabilities(batch_sizes[model_id], probabilities, record_sizes[model_id])
+        offset += count
+    
+    results = []
+    for index in range(len(records_inputs)):
+        record_results = {model_id: model_prediction(model, per_model[model_id][index], aggregation)
+                          for model_id, model in models}
+        if len(models) == 1:
+            results.append(record_results[models[0][0]])
         else:
-            for channel in range(num_channels):
-                model_input[0][i][channel] = 0.0
+            results.append(ensemble_predictions(models, record_results))
+    return results, {'llamadas': len(requests), **stats}
+
+
+def invoke_models(models: List[Tuple[str, Dict[str, Any]]], model_inputs: Dict[str, np.ndarray],
+                  aggregation: str = 'mean') -> Tuple[Any, Dict[str, Any]]:
+    """
+    Envía a cada modelo su tensor (todas las llamadas en paralelo) y retorna (prediccion, modelo_info)
     
-    return model_input
+    Con un solo modelo la respuesta es la de ese modelo; con varios, la predicción es el
+    ensemble y el detalle por modelo queda en prediccion['ensemble'] y modelo_info['metadata'].
+    Un modelo que falla tras los reintentos se excluye del ensemble.
+    """
+    results, stats = invoke_records(models, [model_inputs], aggregation)
+    prediccion, modelo_info = results[0]
+    if prediccion is not None:
+        add_call_stats(modelo_info, stats)
+    return prediccion, modelo_info
+
+
+def add_call_stats(modelo_info: Dict[str, Any], stats: Dict[str, int]) -> None:
+    """Agrega a la metadata del modelo los reintentos y hedges de sus llamadas, si hubo"""
+    if stats['intentos'] > stats['llamadas']:
+        modelo_info['metadata']['reintentos'] = stats['intentos'] - stats['llamadas']
+    if stats['hedges']:
+        modelo_info['metadata']['hedges'] = stats['hedges']
+
+
+def invoke_model(model_input: np.ndarray, aggregation: str = 'mean',
+                 model_id: str = DEFAULT_MODEL_ID) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Envía el tensor [N, 2000, 3] al endpoint de SageMaker y retorna (prediccion, modelo_info)
+    
+    Las ventanas se mandan en la menor cantidad de llamadas que permite el límite de
+    payload del endpoint (en paralelo si son varias) y las probabilidades se agregan a
+    nivel de registro. Si el endpoint falla tras los reintentos, prediccion es None y
+    modelo_info['error'] describe el motivo.
+    """
+    return invoke_models(resolve_models(model_id), {model_id: model_input}, aggregation)
+
+
+def pipeline_parameters(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Parámetros que determinan el resultado del pipeline (para la clave de la caché)"""
+    models = resolve_models(request_data.get('modelId'))
+    leads = request_leads(request_data, models)
+    return {
+        'version': PIPELINE_VERSION,
+        'derivaciones': list(leads),
+        'precision': signal_precision(request_data),
+        # Las señales sobrescritas en el lugar no quedan en el resultado guardado
+        'en_el_lugar': sorted(in_place_stages(request_data, models)),
+        'filtros': filter_parameters(request_data),
+        'reloj_uniforme': bool(request_data.get('regridTimestamps', False)),
+        'latidos': beat_parameters(request_data, leads),
+        'modelos': dict(models),
+        'multi_window': bool(request_data.get('multiWindow', True)),
+        'window_hop': request_data.get('windowHop'),
+        'window_aggregation': request_data.get('windowAggregation', 'mean')
+    }
+
+
+def validate_pipeline_options(request_data: Dict[str, Any], leads: Sequence[str]) -> None:
+    """Valida las opciones numéricas del pipeline antes de procesar (ValueError con un mensaje para el usuario)"""
+    filter_parameters(request_data)
+    beat_parameters(request_data, leads)
+    numeric_option(request_data, 'windowHop', cast=int)
+
+
+def build_model_input(signal: np.ndarray, request_data: Dict[str, Any], input_length: int) -> np.ndarray:
+    """Ventanas del modelo sobre toda la señal (multiWindow=false conserva solo la primera)"""
+    if request_data.get('multiWindow', True):
+        return window_signal(signal, input_length, request_data.get('windowHop'))
+    return convert_to_model_input(signal, input_length)
+
+
+def ensemble_model_inputs(response_data: Dict[str, Any], models: List[Tuple[str, Dict[str, Any]]],
+                          request_data: Dict[str, Any], model_input: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Tensor de cada modelo reutilizando las etapas de preprocess_ecg (hechas para el primero):
+    el filtrado se comparte siempre y la normalización, el resampling y las ventanas se
+    recalculan solo para los modelos cuyos parámetros difieren. Cada modelo toma sus
+    derivaciones de la señal procesada (con todas las del request) antes de armar las ventanas.
+    """
+    primary = models[0][1]
+    leads = request_leads(request_data, models)
+    original_fs = response_data['estados']['calidad']['fs_original']
+    normalized = {primary['normalizacion']: response_data['signal_normalizada']}
+    resampled = {(primary['normalizacion'], primary['target_fs']): response_data['signal_resampleada']}
+    tensors = {(primary['normalizacion'], primary['target_fs'], primary['input_length'], primary['derivaciones']): model_input}
+    
+    inputs = {}
+    for model_id, model in models:
+        method, target_fs, input_length, model_leads = key = (model['normalizacion'], model['target_fs'],
+                                                               model['input_length'], model['derivaciones'])
+        if key not in tensors:
+            if method not in normalized:
+                with stage('normalizacion'):
+                    normalized[method], result = normalize_signal(response_data['signal_filtrada'], method)
+                if result['status'] == 'ERROR':
+                    raise ValueError(f"Modelo {model_id}: {result['mensaje']}")
+            if (method, target_fs) not in resampled:
+                with stage('resampling'):
+                    resampled[method, target_fs], result = resample_to_200hz(normalized[method], original_fs, target_fs)
+                if result['status'] == 'ERROR':
+                    raise ValueError(f"Modelo {model_id}: {result['mensaje']}")
+            with stage('tensor'):
+                channels = lead_channels(leads, model_leads)
+                tensors[key] = build_model_input(resampled[method, target_fs][:, channels], request_data, input_length)
+        inputs[model_id] = tensors[key]
+    return inputs
+
+
+# Modo fusionado por defecto (cada request puede pedirlo o desactivarlo con "fused")
+FUSED_PREPROCESSING = os.environ.get('ECG_FUSED_PREPROCESSING', 'false').lower() in ('1', 'true', 'yes')
+
+
+def use_fused_preprocessing(request_data: Dict[str, Any], models: List[Tuple[str, Dict[str, Any]]],
+                            filter_params: Dict[str, Any], beat_params: Dict[str, Any]) -> bool:
+    """El modo fusionado aplica si se pide y la respuesta no incluye señales intermedias"""
+    if not request_data.get('fused', FUSED_PREPROCESSING):
+        return False
+    outputs = parse_output_options(request_data)['outputs']
+    # Un ensemble con entradas distintas recalcula desde la señal filtrada
+    inputs = {(model['normalizacion'], model['target_fs'], model['input_length'], model['derivaciones'])
+              for _, model in models}
+    return (not filter_params['zero_phase'] and not beat_params['segments']
+            and not outputs & set(RESPONSE_SIGNALS) and len(inputs) == 1)
+
+
+# False dentro de without_stage_cache (el contexto de cada hilo es independiente)
+_memoize_stages: contextvars.ContextVar = contextvars.ContextVar('memoize_stages', default=True)
+
+
+@contextlib.contextmanager
+def without_stage_cache() -> Iterator[None]:
+    """Las etapas ejecutadas dentro del bloque no leen ni ocupan la caché de etapas (p. ej. warm-up)"""
+    token = _memoize_stages.set(False)
+    try:
+        yield
+    finally:
+        _memoize_stages.reset(token)
+
+
+def cached_stage(name: str, key: str, compute: Callable[[], Any], memoize: bool = True) -> Any:
+    """
+    Ejecuta una etapa (medida con stage) o reutiliza su salida memorizada con la misma
+    clave; memoize=False para salidas que la etapa siguiente sobrescribe en el lugar
+    """
+    if not (memoize and _memoize_stages.get()):
+        with stage(name):
+            return compute()
+    with stage(name):
+        value = stage_cache.get(key) if stage_cache is not None else None
+        if value is not None:
+            mark_reused(name)
+            return value
+        value = compute()
+        if stage_cache is not None:
+            stage_cache.put(key, read_only(value))
+        return value
+
+
+def memoize_stage(key: str, value: Any) -> None:
+    """Memoriza un valor ya calculado (p. ej. el estado de una etapa cuya señal no se memoriza)"""
+    if stage_cache is not None and _memoize_stages.get():
+        stage_cache.put(key, read_only(value))
+
+
+def reuse_stages(keys: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """
+    Salidas memorizadas de varias etapas (nombre → clave) sin ejecutarlas; None si falta
+    alguna, y entonces ninguna se marca como reutilizada
+    """
+    if stage_cache is None or not _memoize_stages.get():
+        return None
+    values = {}
+    for name, key in keys.items():
+        with stage(name):
+            values[name] = stage_cache.get(key)
+        if values[name] is None:
+            return None
+    for name in values:
+        mark_reused(name)
+    return values
+
+
+def _preprocessed_response(signals: Sequence[Optional[np.ndarray]], model_input: np.ndarray, estados: Dict[str, Any],
+                           beat_segments: Optional[np.ndarray], metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Respuesta de preprocess_ecg con el tensor listo (la predicción se agrega en process_ecg)"""
+    signal_original, signal_filtrada, signal_normalizada, signal_resampleada = signals
+    return {
+        'signal_original': signal_original,
+        'signal_filtrada': signal_filtrada,
+        'signal_normalizada': signal_normalizada,
+        'signal_resampleada': signal_resampleada,
+        'tensor_final': {
+            'shape': list(model_input.shape),
+            'muestra_preview': model_input[:1]
+        },
+        'estados': estados,
+        'segmentos_latidos': beat_segments,
+        'prediccion': None,
+        'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
+        'etiqueta_real': metadata if metadata else None  # Incluir etiqueta real del CSV si está disponible
+    }
+
+
+def preprocess_ecg(ecg_content: Union[str, Dict[str, Any]],
+                   request_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    """
+    Ejecuta las etapas de procesamiento (sin inferencia) sobre un CSV o un ECG binario (ecgData).
+    
+    Retorna (respuesta, model_input) con las señales como arrays; model_input es None
+    si alguna etapa falló. La normalización, la fs, el largo de las ventanas y las
+    derivaciones del tensor son los del primer modelo pedido en "modelId"; las etapas
+    procesan todas las derivaciones del request ("leads") como un solo array, en la
+    precisión del request. Las señales sobrescritas por etapas en el lugar quedan en None.
+    """
+    models = resolve_models(request_data.get('modelId'))
+    model = models[0][1]
+    leads = request_leads(request_data, models)
+    precision = signal_precision(request_data)
+    in_place = in_place_stages(request_data, models)
+    
+    regrid = bool(request_data.get('regridTimestamps', False))
+    
+    def parse() -> Tuple[np.ndarray, float, Dict[str, Any], Optional[Dict[str, Any]]]:
+        if isinstance(ecg_content, dict):
+            return (*parse_ecg_payload(ecg_content, leads, PRECISIONS[precision]), None)
+        signal, tiempo_s, original_fs, metadata = parse_csv_content(ecg_content, leads, PRECISIONS[precision])
+        # Con timestamps irregulares (huecos, duplicados) se puede pasar a un reloj uniforme
+        sampling = timestamp_analysis(tiempo_s)
+        if sampling is not None and sampling['irregular'] and regrid:
+            signal = regrid_signal(signal, tiempo_s, original_fs)
+            sampling['reloj_uniforme'] = True
+        return signal, original_fs, metadata, sampling
+    
+    # Cada etapa se memoriza con la clave de su entrada más sus propios parámetros:
+    # si cambia un parámetro, solo se recalculan esa etapa y las siguientes
+    parse_key = cache_key(ecg_content_key(ecg_content), {'etapa': 'parseo', 'version': PIPELINE_VERSION,
+                                                         'reloj_uniforme': regrid, 'derivaciones': list(leads),
+                                                         'precision': precision})
+    filter_params = filter_parameters(request_data)
+    filter_key = stage_key(parse_key, 'filtrado', filter_params)
+    beat_params = beat_parameters(request_data, leads)
+    beat_key = stage_key(filter_key, 'latidos', beat_params)
+    normalization_key = stage_key(filter_key, 'normalizacion', model['normalizacion'])
+    resampling_key = stage_key(normalization_key, 'resampling', model['target_fs'])
+    tensor_key = stage_key(resampling_key, 'tensor', [model['input_length'], request_data.get('multiWindow', True),
+                                                      request_data.get('windowHop'), list(model['derivaciones'])])
+    quality_key = stage_key(parse_key, 'calidad')
+    fused = use_fused_preprocessing(request_data, models, filter_params, beat_params)
+    # Solo se filtran las derivaciones del modelo y la de latidos
+    fused_leads = [lead for lead in leads if lead in model['derivaciones'] or lead == beat_params['derivacion']]
+    fused_key = stage_key(filter_key, 'fusionado', [model['normalizacion'], model['target_fs'], model['input_length'],
+                                                    request_data.get('multiWindow', True), request_data.get('windowHop'),
+                                                    fused_leads])
+    # Sin la señal (que se sobrescribe en el lugar), el encabezado del parseo y el estado
+    # del filtrado se memorizan aparte
+    header_key = stage_key(parse_key, 'encabezado')
+    filter_state_key = stage_key(filter_key, 'estado')
+    
+    def quality_status(quality_check: Dict[str, Any], sampling: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        quality_check = {**quality_check, 'derivaciones': list(leads)}
+        if sampling is not None:
+            quality_check['muestreo'] = sampling
+        return quality_check
+    
+    # Con etapas en el lugar la señal parseada (o la filtrada) no se memoriza: si las etapas
+    # siguientes ya están en la caché se responde sin parsear ni filtrar
+    if in_place:
+        downstream = {'parseo': header_key if 'filtrado' in in_place else parse_key,
+                      'calidad': quality_key, 'latidos': beat_key}
+        if fused:
+            downstream['fusionado'] = fused_key
+        else:
+            downstream.update({'filtrado': filter_state_key if 'normalizacion' in in_place else filter_key,
+                               'normalizacion': normalization_key, 'resampling': resampling_key, 'tensor': tensor_key})
+        reused = reuse_stages(downstream)
+        if reused is not None:
+            signal_original, _, metadata, sampling = reused['parseo']
+            quality_check = quality_status(reused['calidad'], sampling)
+            beat_segments_array, beat_result = reused['latidos']
+            if fused:
+                model_input, fused_states, _ = reused['fusionado']
+                model_input = model_input[..., lead_channels(fused_leads, model['derivaciones'])]
+                response_data = _preprocessed_response(
+                    (signal_original, None, None, None), model_input,
+                    {'calidad': quality_check, 'filtrado': fused_states['filtrado'], 'latidos': beat_result,
+                     'normalizacion': fused_states['normalizacion'], 'resampling': fused_states['resampling']},
+                    None, metadata)
+                return {**response_data, 'fusionado': True}, model_input
+            signal_filtrada, filter_result = reused['filtrado']
+            signal_normalizada, normalization_result = reused['normalizacion']
+            signal_resampleada, resampling_result = reused['resampling']
+            model_input = reused['tensor']
+            return _preprocessed_response(
+                (signal_original, signal_filtrada, signal_normalizada, signal_resampleada), model_input,
+                {'calidad': quality_check, 'filtrado': filter_result, 'latidos': beat_result,
+                 'normalizacion': normalization_result, 'resampling': resampling_result},
+                beat_segments_array, metadata), model_input
+    
+    # 1. Parsear CSV
+    signal_original, original_fs, metadata, sampling = cached_stage('parseo', parse_key, parse,
+                                                                    memoize='filtrado' not in in_place)
+    num_samples = len(signal_original)
+    if 'filtrado' in in_place:
+        memoize_stage(header_key, (None, original_fs, metadata, sampling))
+    
+    # 2. Etapa 1: Chequeo de calidad
+    quality_check = cached_stage('calidad', quality_key,
+                                 lambda: check_quality(signal_original, original_fs, len(leads)))
+    quality_check = quality_status(quality_check, sampling)
+    if quality_check['status'] == 'RECHAZADA':
+        return {
+            'signal_original': signal_original,
+            'signal_filtrada': None,
+            'signal_normalizada': None,
+            'signal_resampleada': None,
+            'tensor_final': None,
+            'estados': {
+                'calidad': quality_check,
+                'filtrado': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en calidad', 'filtros_aplicados': []},
+                'normalizacion': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en calidad', 'metodo': 'ninguno'},
+                'resampling': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en calidad', 
+                              'fs_final': original_fs, 'muestras_originales': len(signal_original), 
+                              'muestras_finales': len(signal_original)}
+            },
+            'prediccion': None,
+            'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
+            'etiqueta_real': metadata if metadata else None
+        }, None
+    
+    # Modo fusionado: sin señales intermedias en la respuesta, filtrado, normalización,
+    # resampling y ventanas se hacen en una sola pasada por bloques
+    if fused:
+        from ecg_stream import fused_model_input
+        try:
+            fused = cached_stage('fusionado', fused_key, lambda: fused_model_input(
+                signal_original[:, lead_channels(leads, fused_leads)], original_fs, filter_params, model, request_data,
+                beat_channel=fused_leads.index(beat_params['derivacion'])))
+        except Exception as e:
+            logger.warning(f"Modo fusionado no disponible, se procesa por etapas: {str(e)}")
+            fused = None
+        # None: la señal filtrada tiene valores inválidos y se procesa por etapas
+        if fused is not None:
+            model_input, fused_states, beat_lead = fused
+            model_input = model_input[..., lead_channels(fused_leads, model['derivaciones'])]
+            _, beat_result = cached_stage('latidos', beat_key,
+                                          lambda: detect_beats(beat_lead, original_fs, beat_params))
+            response_data = _preprocessed_response(
+                (signal_original, None, None, None), model_input,
+                {'calidad': quality_check, 'filtrado': fused_states['filtrado'], 'latidos': beat_result,
+                 'normalizacion': fused_states['normalizacion'], 'resampling': fused_states['resampling']},
+                None, metadata)
+            return {**response_data, 'fusionado': True}, model_input
+    
+    # 3. Etapa 2: Filtrado (en el lugar: sobre la señal original, que ya no se devuelve)
+    signal_filtrada, filter_result = cached_stage(
+        'filtrado', filter_key,
+        lambda: filter_signal(signal_original, original_fs, filter_params,
+                              out=signal_original if 'filtrado' in in_place else None),
+        memoize='normalizacion' not in in_place)
+    if 'filtrado' in in_place:
+        signal_original = None
+    if 'normalizacion' in in_place:
+        memoize_stage(filter_state_key, (None, filter_result))
+    if filter_result['status'] == 'ERROR':
+        return {
+            'signal_original': signal_original,
+            'signal_filtrada': signal_filtrada,
+            'signal_normalizada': None,
+            'signal_resampleada': None,
+            'tensor_final': None,
+            'estados': {
+                'calidad': quality_check,
+                'filtrado': filter_result,
+                'normalizacion': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en filtrado', 'metodo': 'ninguno'},
+                'resampling': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en filtrado',
+                              'fs_final': original_fs, 'muestras_originales': num_samples,
+                              'muestras_finales': num_samples}
+            },
+            'prediccion': None,
+            'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
+            'etiqueta_real': metadata if metadata else None
+        }, None
+    
+    # Latidos (picos R, frecuencia cardíaca y RR) sobre la señal filtrada; no detiene el pipeline
+    beat_segments_array, beat_result = cached_stage(
+        'latidos', beat_key,
+        lambda: detect_beats(signal_filtrada, original_fs, beat_params))
+    
+    # 4. Etapa 3: Normalización (en el lugar: sobre la señal filtrada, que ya no se devuelve)
+    signal_normalizada, normalization_result = cached_stage(
+        'normalizacion', normalization_key,
+        lambda: normalize_signal(signal_filtrada, model['normalizacion'],
+                                 out=signal_filtrada if 'normalizacion' in in_place else None))
+    if 'normalizacion' in in_place:
+        signal_filtrada = None
+    if normalization_result['status'] == 'ERROR':
+        return {
+            'signal_original': signal_original,
+            'signal_filtrada': signal_filtrada,
+            'signal_normalizada': signal_normalizada,
+            'signal_resampleada': None,
+            'tensor_final': None,
+            'estados': {
+                'calidad': quality_check,
+                'filtrado': filter_result,
+                'latidos': beat_result,
+                'normalizacion': normalization_result,
+                'resampling': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en normalización',
+                              'fs_final': original_fs, 'muestras_originales': num_samples,
+                              'muestras_finales': num_samples}
+            },
+            'prediccion': None,
+            'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
+            'etiqueta_real': metadata if metadata else None
+        }, None
+    
+    # 5. Etapa 4: Resampling
+    signal_resampleada, resampling_result = cached_stage(
+        'resampling', resampling_key, lambda: resample_to_200hz(signal_normalizada, original_fs, model['target_fs']))
+    if resampling_result['status'] == 'ERROR':
+        return {
+            'signal_original': signal_original,
+            'signal_filtrada': signal_filtrada,
+            'signal_normalizada': signal_normalizada,
+            'signal_resampleada': signal_resampleada,
+            'tensor_final': None,
+            'estados': {
+                'calidad': quality_check,
+                'filtrado': filter_result,
+                'latidos': beat_result,
+                'normalizacion': normalization_result,
+                'resampling': resampling_result
+            },
+            'prediccion': None,
+            'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
+            'etiqueta_real': metadata if metadata else None
+        }, None
+    
+    # 6. Convertir a tensor: ventanas de 2000 muestras sobre toda la señal, con las derivaciones del modelo
+    channels = lead_channels(leads, model['derivaciones'])
+    model_input = cached_stage(
+        'tensor', tensor_key,
+        lambda: build_model_input(signal_resampleada[:, channels], request_data, model['input_length']))
+    
+    # 7. Construir respuesta (la predicción se agrega en process_ecg)
+    response_data = _preprocessed_response(
+        (signal_original, signal_filtrada, signal_normalizada, signal_resampleada), model_input,
+        {'calidad': quality_check, 'filtrado': filter_result, 'latidos': beat_result,
+         'normalizacion': normalization_result, 'resampling': resampling_result},
+        beat_segments_array, metadata)
+    
+    return response_data, model_input
+
+
+def process_ecg(ecg_content: Union[str, Dict[str, Any]], request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ejecuta el pipeline completo sobre un CSV (o un ECG binario) y retorna la respuesta
+    con las señales como arrays (se serializan después con format_response)
+    """
+    models = resolve_models(request_data.get('modelId'))
+    response_data, model_input = preprocess_ecg(ecg_content, request_data)
+    
+    # Llamar a SageMaker (en lotes de ventanas; con varios modelos, todos en paralelo)
+    if model_input is not None:
+        model_inputs = ensemble_model_inputs(response_data, models, request_data, model_input)
+        with stage('inferencia'):
+            response_data['prediccion'], response_data['modelo'] = invoke_models(
+                models, model_inputs, request_data.get('windowAggregation', 'mean'))
+    
+    return response_data
+
+
+# ============================================================================
+# FORMATO DE LA RESPUESTA
+# ============================================================================
+
+# Salidas seleccionables → clave de la señal en la respuesta
+RESPONSE_SIGNALS = {
+    'original': 'signal_original',
+    'filtrada': 'signal_filtrada',
+    'normalizada': 'signal_normalizada',
+    'resampleada': 'signal_resampleada',
+}
+RESPONSE_OUTPUTS = tuple(RESPONSE_SIGNALS) + ('tensor',)
+ENCODINGS = ('json', 'base64-float32')
+
+
+def parse_output_options(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Opciones de salida del request: etapas a devolver, puntos de preview, codificación y timings (ValueError si no son válidas)"""
+    outputs = request_data.get('outputs')
+    if outputs is not None and (not isinstance(outputs, list) or not all(output in RESPONSE_OUTPUTS for output in outputs)):
+        raise ValueError(f"outputs debe ser una lista de etapas (disponibles: {', '.join(RESPONSE_OUTPUTS)})")
+    preview_points = numeric_option(request_data, 'previewPoints', cast=int)
+    encoding = request_data.get('encoding', 'json')
+    return {
+        'outputs': set(outputs) if outputs is not None else set(RESPONSE_OUTPUTS),
+        'preview_points': max(preview_points, 2) if preview_points else None,
+        'encoding': encoding if encoding in ENCODINGS else 'json',
+        'timings': bool(request_data.get('timings', False))
+    }
+
+
+def downsample_min_max(signal: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Submuestreo min-max para visualización: divide la señal en max_points / 2 tramos y
+    conserva el mínimo y el máximo de cada canal en su orden temporal, de modo que
+    los picos (complejos QRS) no se pierden al dibujar.
+    """
+    num_samples = signal.shape[0]
+    if num_samples <= max_points:
+        return signal
+    
+    num_buckets = max_points // 2
+    bucket_size = -(-num_samples // num_buckets)
+    values = np.where(np.isfinite(signal), signal, 0.0)
+    padding = num_buckets * bucket_size - num_samples
+    if padding:
+        values = np.concatenate([values, np.repeat(values[-1:], padding, axis=0)])
+    buckets = values.reshape(num_buckets, bucket_size, -1)
+    
+    argmin = buckets.argmin(axis=1)
+    argmax = buckets.argmax(axis=1)
+    first = np.take_along_axis(buckets, np.minimum(argmin, argmax)[:, np.newaxis], axis=1)
+    second = np.take_along_axis(buckets, np.maximum(argmin, argmax)[:, np.newaxis], axis=1)
+    return np.concatenate([first, second], axis=1).reshape(num_buckets * 2, -1)
+
+
+def encode_signal(signal: np.ndarray, encoding: str = 'json') -> Any:
+    """Serializa una señal como lista anidada o como base64 float32 little-endian con su forma"""
+    if encoding == 'base64-float32':
+        data = np.ascontiguousarray(signal, dtype='<f4')
+        return {
+            'encoding': encoding,
+            'dtype': 'float32',
+            'shape': list(data.shape),
+            'data': base64.b64encode(data.tobytes()).decode('ascii')
+        }
+    return signal.tolist()
+
+
+def format_response(response_data: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplica las opciones de salida a las señales (arrays) de la respuesta antes de serializar"""
+    formatted = dict(response_data)
+    previews = {}
+    
+    for output, key in RESPONSE_SIGNALS.items():
+        signal = response_data.get(key)
+        if signal is None:
+            continue
+        if output not in options['outputs']:
+            formatted[key] = None
+            continue
+        if options['preview_points']:
+            preview = downsample_min_max(signal, options['preview_points'])
+            if preview.shape[0] < signal.shape[0]:
+                previews[key] = {'puntos': preview.shape[0], 'muestras_originales': signal.shape[0]}
+            signal = preview
+        formatted[key] = encode_signal(signal, options['encoding'])
+    
+    tensor_info = response_data.get('tensor_final')
+    if tensor_info is not None:
+        tensor_info = dict(tensor_info)
+        if 'tensor' in options['outputs']:
+            tensor_info['muestra_preview'] = encode_signal(tensor_info['muestra_preview'], options['encoding'])
+        else:
+            tensor_info.pop('muestra_preview', None)
+        formatted['tensor_final'] = tensor_info
+    
+    # Segmentos por latido [latidos, muestras, canales] (solo si el request pidió beatSegments)
+    segments = response_data.get('segmentos_latidos')
+    if segments is not None:
+        formatted['segmentos_latidos'] = encode_signal(segments, options['encoding'])
+    
+    if previews:
+        formatted['previews'] = previews
+    return formatted
 
 
 # ============================================================================
@@ -406,9 +2344,36 @@ def lambda_handler(event, context):
     
     Espera:
     - event["body"]: JSON string con {"csvContent": "..."}
+      (o un evento de warm-up: {"warmup": true} o un evento programado de EventBridge)
+      o, para registros largos en modo streaming, {"s3Bucket": "...", "s3Key": "..."}
+      (también {"csvContent": "...", "streaming": true}), o un ECG binario en lugar del
+      CSV: {"ecgData": {"encoding": "base64-float32" | "base64-int16", "shape": [muestras,
+      derivaciones], "fs": 500, "leads": ["II", "V1", "V5"], "gain": 1, "data": "..."}}
+      (opcionales: "leads", "gain", "label", "is_anomalo")
+    - Opcionales: "modelId" (id del registro de modelos, o varios para un ensemble),
+      "windowHop" (muestras entre ventanas, por defecto 2000),
+      "windowAggregation" ("mean" o "max"), "multiWindow" (false = solo los primeros 10 s)
+    - "regridTimestamps": con timestamps irregulares (huecos, duplicados), interpola
+      la señal a un reloj uniforme a la fs estimada
+    - "leads": derivaciones a leer y procesar (p. ej. las 12 del CSV); por defecto las que
+      usan los modelos pedidos (II, V1, V5 en el modelo por defecto)
+    - "precision": "float64" (por defecto, ECG_PRECISION) o "float32": señales en float32
+      y filtrado/normalización en el lugar para las señales que no se devuelven
+    - Opcionales de filtrado: "notchFreq" (Hz, 0 = sin notch), "notchQ", "lowFreq",
+      "highFreq", "filterOrder" (orden del Butterworth) y "zeroPhase" (ida y vuelta)
+    - Opcionales de salida: "outputs" (etapas a devolver: original, filtrada, normalizada,
+      resampleada, tensor), "previewPoints" (máximo de puntos por señal, submuestreo
+      min-max), "encoding" ("json" o "base64-float32") y "timings" (true agrega a los
+      estados el tiempo y la memoria de cada etapa)
+    - Opcionales de latidos: "beatSegments" (true devuelve segmentos alineados a cada pico R)
+      y "beatWindow" ([segundos antes, segundos después] del pico R)
+    - Varios registros en un request: {"records": [{"id": "...", "csvContent" | "ecgData": ...}]}
+      con las opciones comunes en el nivel superior (cada registro puede redefinir las
+      del pipeline); por defecto outputs = ["tensor"]
     
     Retorna:
-    - Respuesta completa con todas las etapas procesadas
+    - Respuesta completa con todas las etapas procesadas (con records: un resultado por
+      registro en "registros", más "resumen" e "inferencia")
     """
     
     cors_headers = {
@@ -418,6 +2383,10 @@ def lambda_handler(event, context):
         'Access-Control-Allow-Headers': 'Content-Type, Authorization'
     }
     
+    # Evento de warm-up (programado o manual): ejercita el pipeline sin llamar al endpoint
+    if is_warmup_event(event):
+        return handle_warmup(event, cors_headers)
+    
     # Manejar preflight OPTIONS
     if event.get('httpMethod') == 'OPTIONS' or event.get('requestContext', {}).get('http', {}).get('method') == 'OPTIONS':
         return {
@@ -426,204 +2395,160 @@ def lambda_handler(event, context):
             'body': json.dumps({'message': 'OK'})
         }
     
-    try:
-        # Parsear body
-        body = event.get('body', '{}')
-        if isinstance(body, str):
-            request_data = json.loads(body)
-        else:
-            request_data = body
-        
-        csv_content = request_data.get('csvContent')
-        if not csv_content:
-            return {
-                'statusCode': 400,
-                'headers': cors_headers,
-                'body': json.dumps({'error': 'csvContent es requerido'})
-            }
-        
-        # 1. Parsear CSV
-        II, V1, V5, tiempo_s, original_fs, metadata = parse_csv_content(csv_content)
-        signal_original = raw_to_signal(II, V1, V5)
-        
-        # 2. Etapa 1: Chequeo de calidad
-        quality_check = check_quality(signal_original, original_fs)
-        if quality_check['status'] == 'RECHAZADA':
-            return {
-                'statusCode': 200,
-                'headers': cors_headers,
-                'body': json.dumps({
-                    'signal_original': signal_original,
-                    'signal_filtrada': None,
-                    'signal_normalizada': None,
-                    'signal_resampleada': None,
-                    'tensor_final': None,
-                    'estados': {
-                        'calidad': quality_check,
-                        'filtrado': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en calidad', 'filtros_aplicados': []},
-                        'normalizacion': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en calidad', 'metodo': 'ninguno'},
-                        'resampling': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en calidad', 
-                                      'fs_final': original_fs, 'muestras_originales': len(signal_original), 
-                                      'muestras_finales': len(signal_original)}
-                    },
-                    'prediccion': None,
-                    'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
-                    'etiqueta_real': metadata if metadata else None
-                })
-            }
-        
-        # 3. Etapa 2: Filtrado
-        signal_filtrada, filter_result = filter_signal(signal_original, original_fs)
-        if filter_result['status'] == 'ERROR':
-            return {
-                'statusCode': 200,
-                'headers': cors_headers,
-                'body': json.dumps({
-                    'signal_original': signal_original,
-                    'signal_filtrada': signal_filtrada,
-                    'signal_normalizada': None,
-                    'signal_resampleada': None,
-                    'tensor_final': None,
-                    'estados': {
-                        'calidad': quality_check,
-                        'filtrado': filter_result,
-                        'normalizacion': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en filtrado', 'metodo': 'ninguno'},
-                        'resampling': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en filtrado',
-                                      'fs_final': original_fs, 'muestras_originales': len(signal_original),
-                                      'muestras_finales': len(signal_original)}
-                    },
-                    'prediccion': None,
-                    'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
-                    'etiqueta_real': metadata if metadata else None
-                })
-            }
-        
-        # 4. Etapa 3: Normalización
-        signal_normalizada, normalization_result = normalize_signal(signal_filtrada)
-        if normalization_result['status'] == 'ERROR':
-            return {
-                'statusCode': 200,
-                'headers': cors_headers,
-                'body': json.dumps({
-                    'signal_original': signal_original,
-                    'signal_filtrada': signal_filtrada,
-                    'signal_normalizada': signal_normalizada,
-                    'signal_resampleada': None,
-                    'tensor_final': None,
-                    'estados': {
-                        'calidad': quality_check,
-                        'filtrado': filter_result,
-                        'normalizacion': normalization_result,
-                        'resampling': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en normalización',
-                                      'fs_final': original_fs, 'muestras_originales': len(signal_original),
-                                      'muestras_finales': len(signal_original)}
-                    },
-                    'prediccion': None,
-                    'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
-                    'etiqueta_real': metadata if metadata else None
-                })
-            }
-        
-        # 5. Etapa 4: Resampling
-        signal_resampleada, resampling_result = resample_to_200hz(signal_normalizada, original_fs)
-        if resampling_result['status'] == 'ERROR':
+    # Mediciones por etapa y pico de memoria del request: se emiten como métricas EMF al final de cada request
+    with recording(request_memory=True) as recorder:
+        metrics_properties = {'requestId': getattr(context, 'aws_request_id', None)}
+        metrics_dimensions = {'Modo': 'completo'}
+        try:
+            return _handle_request(event, cors_headers, recorder, metrics_dimensions, metrics_properties)
+        except Exception as e:
+            logger.error(f"Error procesando ECG: {str(e)}", exc_info=True)
+            metrics_properties['error'] = str(e)
             return {
-                'statusCode': 200,
+                'statusCode': 500,
                 'headers': cors_headers,
                 'body': json.dumps({
-                    'signal_original': signal_original,
-                    'signal_filtrada': signal_filtrada,
-                    'signal_normalizada': signal_normalizada,
-                    'signal_resampleada': signal_resampleada,
-                    'tensor_final': None,
-                    'estados': {
-                        'calidad': quality_check,
-                        'filtrado': filter_result,
-                        'normalizacion': normalization_result,
-                        'resampling': resampling_result
-                    },
-                    'prediccion': None,
-                    'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
-                    'etiqueta_real': metadata if metadata else None
+                    'error': 'Error procesando ECG',
+                    'message': str(e)
                 })
             }
+        finally:
+            recorder.emit(metrics_dimensions, metrics_properties)
+
+
+def serialize_response(response_data: Dict[str, Any], options: Dict[str, Any], recorder: StageRecorder) -> str:
+    """Formatea y serializa la respuesta; con la opción timings agrega las mediciones a los estados"""
+    with stage('formato'):
+        formatted = format_response(response_data, options)
+    if options['timings']:
+        formatted['estados'] = {**formatted['estados'], 'timings': recorder.summary()}
+    with stage('serializacion'):
+        return json.dumps(formatted)
+
+
+def _handle_request(event, cors_headers: Dict[str, str], recorder: StageRecorder,
+                    metrics_dimensions: Dict[str, str], metrics_properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Procesa un request (POST) del handler"""
+    # Parsear body
+    body = event.get('body', '{}')
+    if isinstance(body, str):
+        request_data = json.loads(body)
+    else:
+        request_data = body
+    
+    # Varios registros: preprocesamiento en paralelo y una sola tanda de llamadas al endpoint
+    if 'records' in request_data:
+        from ecg_records import handle_records
         
-        # 6. Convertir a tensor
-        model_input = convert_to_model_input(signal_resampleada, 2000)
-        tensor_info = {
-            'shape': [1, len(model_input[0]), len(model_input[0][0]) if model_input[0] else 3],
-            'muestra_preview': model_input
+        metrics_dimensions['Modo'] = 'registros'
+        return handle_records(request_data, cors_headers, result_cache)
+    
+    csv_content = request_data.get('csvContent')
+    try:
+        output_options = parse_output_options(request_data)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': cors_headers,
+            'body': json.dumps({'error': str(e)})
         }
+    
+    # Modo streaming: registros largos desde S3 (o csvContent con streaming=true)
+    # procesados por bloques con memoria acotada
+    s3_bucket = request_data.get('s3Bucket')
+    s3_key = request_data.get('s3Key')
+    if (s3_bucket and s3_key) or (csv_content and request_data.get('streaming')):
+        from ecg_stream import StreamInference, iter_s3_lines, process_stream
         
-        # 7. Llamar a SageMaker
-        prediccion = None
-        modelo_info = {'nombre': 'N/A', 'endpoint': 'N/A', 'metadata': {}}
-        
+        metrics_dimensions['Modo'] = 'streaming'
         try:
-            endpoint_name = os.environ.get('SAGEMAKER_ENDPOINT', 'cnn1d-lstm-ecg-v1-serverless')
-            client = get_sagemaker_client()
-            
-            payload = {'signals': model_input}
-            payload_json = json.dumps(payload, ensure_ascii=False)
-            
-            response = client.invoke_endpoint(
-                EndpointName=endpoint_name,
-                ContentType='application/json',
-                Body=payload_json.encode('utf-8')
-            )
-            
-            response_body = response['Body'].read().decode('utf-8')
-            model_response = json.loads(response_body)
-            
-            probability = model_response.get('probability') or model_response.get('prediction') or 0
-            clase = 'anomalo' if probability > 0.5 else 'normal'
-            
-            prediccion = {
-                'clase': clase,
-                'score': float(probability)
-            }
-            
-            modelo_info = {
-                'nombre': 'CNN1D-LSTM ECG v1',
-                'endpoint': endpoint_name,
-                'metadata': {}
+            models = resolve_models(request_data.get('modelId'))
+            leads = request_leads(request_data, models)
+            signal_precision(request_data)
+            validate_pipeline_options(request_data, leads)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': cors_headers,
+                'body': json.dumps({'error': str(e)})
             }
-        except Exception as sagemaker_error:
-            logger.error(f"Error llamando a SageMaker: {str(sagemaker_error)}")
-            # Continuar sin predicción
         
-        # 8. Construir respuesta completa
-        response_data = {
-            'signal_original': signal_original,
-            'signal_filtrada': signal_filtrada,
-            'signal_normalizada': signal_normalizada,
-            'signal_resampleada': signal_resampleada,
-            'tensor_final': tensor_info,
-            'estados': {
-                'calidad': quality_check,
-                'filtrado': filter_result,
-                'normalizacion': normalization_result,
-                'resampling': resampling_result
-            },
-            'prediccion': prediccion,
-            'modelo': modelo_info,
-            'etiqueta_real': metadata if metadata else None  # Incluir etiqueta real del CSV si está disponible
-        }
+        def open_lines() -> Iterator[str]:
+            """El CSV desde el comienzo (process_stream lo recorre dos veces)"""
+            if s3_bucket and s3_key:
+                return iter_s3_lines(s3_bucket, s3_key)
+            return io.StringIO(csv_content)
         
+        # Las ventanas se envían al endpoint en lotes a medida que se producen, con la
+        # misma agregación que el camino batch
+        inference = StreamInference(models, request_data.get('windowAggregation', 'mean'))
+        with stage('streaming'):
+            response_data = process_stream(open_lines, filter_params=filter_parameters(request_data), leads=leads,
+                                           models=models, request_data=request_data, on_windows=inference.add)
+        if response_data['tensor_final'] is not None:
+            with stage('inferencia'):
+                response_data['prediccion'], response_data['modelo'] = inference.result()
         return {
             'statusCode': 200,
             'headers': cors_headers,
-            'body': json.dumps(response_data)
+            'body': serialize_response(response_data, output_options, recorder)
         }
-        
-    except Exception as e:
-        logger.error(f"Error procesando ECG: {str(e)}", exc_info=True)
+    
+    # ECG binario (ecgData) como alternativa compacta al CSV
+    ecg_data = request_data.get('ecgData')
+    ecg_content = ecg_data if ecg_data is not None else csv_content
+    if not ecg_content:
+        return {
+            'statusCode': 400,
+            'headers': cors_headers,
+            'body': json.dumps({'error': 'csvContent (o ecgData) es requerido'})
+        }
+    
+    try:
+        leads = request_leads(request_data, resolve_models(request_data.get('modelId')))
+        signal_precision(request_data)
+        validate_pipeline_options(request_data, leads)
+        if ecg_data is not None:
+            ecg_payload_header(ecg_data, leads)
+    except ValueError as e:
         return {
-            'statusCode': 500,
+            'statusCode': 400,
             'headers': cors_headers,
-            'body': json.dumps({
-                'error': 'Error procesando ECG',
-                'message': str(e)
-            })
+            'body': json.dumps({'error': str(e)})
         }
+    
+    # Caché de resultados: el mismo CSV con los mismos parámetros no se reprocesa
+    with stage('cache'):
+        key = cache_key(ecg_content_key(ecg_content), pipeline_parameters(request_data)) if result_cache else None
+        response_data = result_cache.get(key) if result_cache else None
+    cache_status = 'HIT' if response_data is not None else 'MISS'
+    metrics_properties['cache'] = cache_status
+    
+    if response_data is None:
+        try:
+            response_data = process_ecg(ecg_content, request_data)
+        except ValueError as e:
+            # Datos del request que el pipeline no puede procesar (p. ej. regridTimestamps con huecos enormes)
+            return {
+                'statusCode': 400,
+                'headers': cors_headers,
+                'body': json.dumps({'error': str(e)})
+            }
+        # No se guardan resultados en los que falló la llamada al endpoint (o a algún modelo del ensemble)
+        if result_cache and ('error' not in response_data['modelo'] or response_data['tensor_final'] is None):
+            with stage('cache'):
+                result_cache.put(key, response_data)
+    
+    return {
+        'statusCode': 200,
+        'headers': {**cors_headers, 'X-Cache': cache_status},
+        'body': serialize_response(response_data, output_options, recorder)
+    }
+
+
+# ============================================================================
+# ARRANQUE
+# ============================================================================
 
+# Al final del módulo: el precalentamiento usa las funciones definidas arriba
+initialize(STARTUP_MODE, _MODULE_LOAD_START)
@@ -0,0 +1,208 @@
+"""
+Requests con varios registros (campo records)
+Cada registro trae su id y su ECG (csvContent o ecgData). El preprocesamiento de los
+registros corre en paralelo en un pool de hilos (numpy libera el GIL en las operaciones
+pesadas; en Lambda no hay /dev/shm para un pool de procesos), las ventanas de todos se
+mandan al endpoint apiladas en los mismos lotes y la respuesta trae un resultado por
+registro: un registro que falla no hace fallar al resto.
+"""
+
+import contextvars
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from ecg_cache import ResultCache, cache_key
+from ecg_instrumentation import recording, stage
+from ecg_processor import (
+    ecg_content_key,
+    ecg_payload_header,
+    ensemble_model_inputs,
+    format_response,
+    invoke_records,
+    parse_output_options,
+    pipeline_parameters,
+    preprocess_ecg,
+    request_leads,
+    resolve_models,
+    signal_precision,
+)
+
+logger = logging.getLogger()
+
+MAX_RECORDS = int(os.environ.get('ECG_RECORDS_MAX', 64))
+# 0 = un hilo por CPU disponible
+RECORDS_WORKERS = int(os.environ.get('ECG_RECORDS_WORKERS', 0))
+
+# Opciones que valen para todo el request (los modelos y el formato de la respuesta son comunes)
+SHARED_OPTIONS = ('modelId', 'windowAggregation', 'outputs', 'previewPoints', 'encoding', 'timings')
+
+
+def record_requests(request_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Request de cada registro: las opciones del nivel superior más las propias del registro
+    (salvo las de SHARED_OPTIONS). Lanza ValueError si la lista de registros no es válida.
+    """
+    records = request_data.get('records')
+    if not isinstance(records, list) or not records:
+        raise ValueError('records debe ser una lista no vacía')
+    if len(records) > MAX_RECORDS:
+        raise ValueError(f'Demasiados registros: {len(records)} (máximo {MAX_RECORDS})')
+    
+    shared = {key: value for key, value in request_data.items() if key != 'records'}
+    # Sin outputs explícitos solo se devuelve el tensor (y el preprocesamiento puede ser fusionado)
+    shared.setdefault('outputs', ['tensor'])
+    shared.setdefault('fused', True)
+    
+    requests = []
+    ids = set()
+    for index, record in enumerate(records):
+        if not isinstance(record, dict) or record.get('id') is None:
+            raise ValueError(f'El registro {index} no tiene id')
+        if record['id'] in ids:
+            raise ValueError(f"id repetido: {record['id']}")
+        ids.add(record['id'])
+        own = {key: value for key, value in record.items() if key not in SHARED_OPTIONS}
+        requests.append({**shared, **own})
+    return requests
+
+
+def record_content(record_request: Dict[str, Any], models: List[Tuple[str, Dict[str, Any]]]) -> Any:
+    """
+    ECG del registro (ecgData o csvContent); lanza ValueError si falta, si sus leads o su
+    precision no son válidos o si el encabezado binario no es válido
+    """
+    leads = request_leads(record_request, models)
+    signal_precision(record_request)
+    ecg_data = record_request.get('ecgData')
+    if ecg_data is not None:
+        ecg_payload_header(ecg_data, leads)
+        return ecg_data
+    if not record_request.get('csvContent'):
+        raise ValueError('csvContent (o ecgData) es requerido')
+    return record_request['csvContent']
+
+
+def preprocess_record(record_request: Dict[str, Any], models: List[Tuple[str, Dict[str, Any]]],
+                      result_cache: Optional[ResultCache], timings: bool) -> Dict[str, Any]:
+    """
+    Preprocesa un registro (en un hilo del pool) con sus propias mediciones por etapa.
+    Retorna {'id', 'response_data', 'model_inputs', 'cache', 'timings'} o {'id', 'error'}.
+    """
+    record = {'id': record_request['id']}
+    with recording() as recorder:
+        try:
+            ecg_content = record_content(record_request, models)
+            with stage('cache'):
+                key = cache_key(ecg_content_key(ecg_content), pipeline_parameters(record_request)) if result_cache else None
+                response_data = result_cache.get(key) if result_cache else None
+            record['cache_key'] = key
+            record['cache'] = 'HIT' if response_data is not None else 'MISS'
+            
+            model_inputs = None
+            if response_data is None:
+                response_data, model_input = preprocess_ecg(ecg_content, record_request)
+                if model_input is not None:
+                    model_inputs = ensemble_model_inputs(response_data, models, record_request, model_input)
+            record['response_data'] = response_data
+            record['model_inputs'] = model_inputs
+        except Exception as e:
+            logger.warning(f"Registro {record['id']}: {str(e)}")
+            record['error'] = str(e)
+    if timings:
+        record['timings'] = recorder.summary()
+    return record
+
+
+def record_result(record: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Resultado de un registro en la respuesta: la respuesta formateada o el error"""
+    if 'error' in record:
+        result = {'id': record['id'], 'status': 'ERROR', 'mensaje': record['error']}
+    else:
+        result = {'id': record['id'], 'status': 'OK', 'cache': record['cache'],
+                  **format_response(record['response_data'], options)}
+    if 'timings' in record:
+        result['estados'] = {**result.get('estados', {}), 'timings': record['timings']}
+    return result
+
+
+def process_records(request_data: Dict[str, Any], result_cache: Optional[ResultCache] = None) -> Dict[str, Any]:
+    """
+    Procesa todos los registros del request y retorna la respuesta con un resultado por
+    registro ('registros'), el resumen y las llamadas al endpoint. Lanza ValueError si el
+    request no es válido (lista de registros o modelos).
+    """
+    models = resolve_models(request_data.get('modelId'))
+    requests = record_requests(request_data)
+    options = parse_output_options(requests[0])
+    aggregation = request_data.get('windowAggregation', 'mean')
+    
+    # Preprocesamiento en paralelo: cada hilo corre en una copia del contexto (sus etapas no se mezclan)
+    workers = min(len(requests), RECORDS_WORKERS or os.cpu_count() or 1)
+    with stage('registros'):
+        if workers == 1:
+            records = [preprocess_record(record_request, models, result_cache, options['timings'])
+                       for record_request in requests]
+        else:
+            with ThreadPoolExecutor(workers, thread_name_prefix='ecg-records') as pool:
+                futures = [pool.submit(contextvars.copy_context().run, preprocess_record,
+                                       record_request, models, result_cache, options['timings'])
+                           for record_request in requests]
+                records = [future.result() for future in futures]
+    
+    # Inferencia: las ventanas de todos los registros en los mismos lotes
+    pending = [record for record in records if record.get('model_inputs') is not None]
+    stats = {'llamadas': 0, 'intentos': 0, 'hedges': 0}
+    if pending:
+        with stage('inferencia'):
+            results, stats = invoke_records(models, [record['model_inputs'] for record in pending], aggregation)
+        for record, (prediccion, modelo_info) in zip(pending, results):
+            record['response_data']['prediccion'], record['response_data']['modelo'] = prediccion, modelo_info
+    
+    # Igual que en un request individual: no se guardan resultados con el endpoint fallido
+    if result_cache:
+        with stage('cache'):
+            for record in records:
+                if record.get('cache') == 'MISS' and (record['model_inputs'] is None
+                                                      or 'error' not in record['response_data']['modelo']):
+                    result_cache.put(record['cache_key'], record['response_data'])
+    
+    with stage('formato'):
+        registros = [record_result(record, options) for record in records]
+    resumen = {
+        'registros': len(registros),
+        'errores': sum(record['status'] == 'ERROR' for record in registros),
+        'rechazados': sum(record['status'] == 'OK' and record['estados']['calidad']['status'] == 'RECHAZADA'
+                          for record in registros),
+        'con_prediccion': sum(record.get('prediccion') is not None for record in registros),
+        'desde_cache': sum(record.get('cache') == 'HIT' for record in registros)
+    }
+    inferencia = {'llamadas_endpoint': stats['llamadas'], 'ventanas': sum(
+        next(iter(record['model_inputs'].values())).shape[0] for record in pending)}
+    if stats['intentos'] > stats['llamadas']:
+        inferencia['reintentos'] = stats['intentos'] - stats['llamadas']
+    if stats['hedges']:
+        inferencia['hedges'] = stats['hedges']
+    return {'registros': registros, 'resumen': resumen, 'inferencia': inferencia}
+
+
+def handle_records(request_data: Dict[str, Any], cors_headers: Dict[str, str],
+                   result_cache: Optional[ResultCache] = None) -> Dict[str, Any]:
+    """Respuesta del handler para un request con records (400 si el request no es válido)"""
+    try:
+        response = process_records(request_data, result_cache)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': cors_headers,
+            'body': json.dumps({'error': str(e)})
+        }
+    with stage('serializacion'):
+        body = json.dumps(response)
+    return {
+        'statusCode': 200,
+        'headers': cors_headers,
+        'body': body
+    }
@@ -0,0 +1,108 @@
+"""
+Arranque en frío de la Lambda de ECG
+Mide la fase de inicialización y, en modo prewarm, la aprovecha para importar boto3,
+crear los clientes y precalcular los coeficientes de filtros y resampler de las
+frecuencias de muestreo habituales. También atiende los eventos de warm-up, que
+ejercitan el pipeline con una señal sintética sin llamar al endpoint.
+"""
+
+import io
+import json
+import logging
+import time
+from typing import Any, Dict, Iterable
+
+import numpy as np
+
+from ecg_instrumentation import recording
+
+logger = logging.getLogger()
+
+# Frecuencias de muestreo habituales (PTB-XL / MIMIC / MIT-BIH)
+PREWARM_RATES = (250, 360, 500, 1000)
+
+# Resultado de la inicialización del contenedor (se devuelve en los warm-up)
+startup_info: Dict[str, Any] = {}
+
+
+def warmup_csv(fs: float, duration_s: float = 10) -> str:
+    """CSV sintético corto (latidos gaussianos sobre una senoide) que pasa el chequeo de calidad"""
+    t = np.arange(int(duration_s * fs)) / fs
+    beats = np.exp(-0.5 * (((t % 0.8) - 0.3) / 0.01) ** 2)
+    signal = np.column_stack([beats, -0.5 * beats, 1.2 * beats]) + 0.1 * np.sin(2 * np.pi * 0.3 * t)[:, np.newaxis]
+    buffer = io.StringIO()
+    np.savetxt(buffer, np.column_stack([t, signal]), fmt=('%.12f', '%.5f', '%.5f', '%.5f'), delimiter=',')
+    return 'tiempo_s,II,V1,V5\n' + buffer.getvalue()
+
+
+def prewarm(rates: Iterable[float] = PREWARM_RATES, create_clients: bool = True) -> Dict[str, float]:
+    """Importa boto3, crea el cliente de SageMaker y precalcula coeficientes; retorna los tiempos en ms"""
+    # ecg_processor importa este módulo: se importa recién al usarlo (ya cargado por el handler)
+    from ecg_processor import (
+        TARGET_FS,
+        design_filter_bank,
+        get_sagemaker_client,
+        preprocess_ecg,
+        resample_plan,
+        without_stage_cache,
+    )
+    timings = {}
+    
+    if create_clients:
+        start = time.perf_counter()
+        get_sagemaker_client()
+        timings['clientes_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    
+    # Diseño de filtros y kernels polifásicos (quedan en las cachés LRU) y una corrida
+    # del pipeline por frecuencia, que además arma las matrices del scan de los filtros
+    start = time.perf_counter()
+    for fs in rates:
+        design_filter_bank(fs)
+        resample_plan(fs, TARGET_FS)
+        # Las señales sintéticas no ocupan la caché de etapas de los requests reales
+        with without_stage_cache():
+            preprocess_ecg(warmup_csv(fs), {})
+    import ecg_stream  # Modo streaming (se importa perezosamente en el handler)
+    timings['coeficientes_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return timings
+
+
+def initialize(mode: str, module_load_start: float) -> None:
+    """Fase de inicialización del contenedor: registra el tiempo de carga y, si corresponde, precalienta"""
+    startup_info['modo'] = mode
+    startup_info['carga_modulo_ms'] = round((time.perf_counter() - module_load_start) * 1000, 3)
+    if mode == 'prewarm':
+        try:
+            startup_info['prewarm'] = prewarm()
+        except Exception as e:
+            # El precalentamiento es una optimización: si falla, el handler funciona igual
+            logger.warning(f"No se pudo precalentar: {str(e)}")
+    startup_info['inicializacion_ms'] = round((time.perf_counter() - module_load_start) * 1000, 3)
+    logger.info(json.dumps({'arranque': startup_info}))
+
+
+def is_warmup_event(event: Dict[str, Any]) -> bool:
+    """Evento de warm-up: {"warmup": true} o un evento programado de EventBridge"""
+    return bool(event.get('warmup')) or event.get('source') == 'aws.events'
+
+
+def handle_warmup(event: Dict[str, Any], cors_headers: Dict[str, str]) -> Dict[str, Any]:
+    """Ejecuta el pipeline (sin inferencia) con señales sintéticas y reporta los tiempos"""
+    from ecg_processor import preprocess_ecg, without_stage_cache
+    rates = event.get('rates') or [500]
+    with recording() as recorder, without_stage_cache():
+        states = {}
+        for fs in rates:
+            response_data, _ = preprocess_ecg(warmup_csv(fs), {})
+            states[str(fs)] = response_data['estados']['calidad']['status']
+    
+    return {
+        'statusCode': 200,
+        'headers': cors_headers,
+        'body': json.dumps({
+            'warmup': 'OK',
+            'calidad': states,
+            'arranque': startup_info,
+            'timings': recorder.summary()
+        })
+    }
@@ -0,0 +1,965 @@
+"""
+Modo streaming del pipeline de ECG
+Procesa registros largos (p. ej. Holter de 24 h) por bloques con memoria acotada:
+el parseo del CSV, el filtrado y el resampling corren como generadores encadenados
+que arrastran el estado de los filtros entre bloques, con el mismo resultado que el
+modo batch de ecg_processor. Los mismos generadores dan el modo fusionado, que procesa
+por bloques una señal ya parseada y escribe directamente en el tensor del modelo.
+"""
+
+import csv
+import itertools
+import logging
+import math
+import os
+import warnings
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ecg_inference import CONCURRENCY as INFERENCE_CONCURRENCY
+from ecg_processor import (
+    BEAT_BAND_HZ,
+    BEAT_REFRACTORY_S,
+    ECG_LEADS,
+    FS_ESTIMATION_SAMPLES,
+    PRECISIONS,
+    SQI_FLATLINE_MIN_S,
+    SQI_MIN_WINDOW_SQI,
+    SQI_WINDOW_GROUP,
+    SQI_WINDOW_S,
+    add_call_stats,
+    apply_min_max,
+    apply_sos,
+    apply_z_score,
+    band_power_ratios,
+    batch_probabilities,
+    beat_parameters,
+    beat_status,
+    build_label_metadata,
+    channel_statistics,
+    design_filter_bank,
+    detect_r_peaks,
+    ensemble_predictions,
+    estimate_fs,
+    filter_parameters,
+    first_is_anomalo,
+    first_label,
+    get_inference_client,
+    get_s3_client,
+    lead_channels,
+    min_max_range,
+    model_prediction,
+    model_requests,
+    parse_numeric_columns,
+    polyphase_block,
+    polyphase_first_input,
+    polyphase_ready,
+    quality_from_sqi,
+    quality_from_statistics,
+    resample_plan,
+    resampling_status,
+    resolve_models,
+    signal_precision,
+    valid_mask,
+    window_signal,
+    windows_per_batch,
+)
+
+logger = logging.getLogger()
+
+# Filas de CSV por bloque (~1.2 MB de señal float64 con 3 canales)
+STREAM_CHUNK_ROWS = 50000
+
+# Ventanas del modelo que se evalúan como máximo por registro (8640 = 24 h de ventanas de 10 s)
+STREAM_MAX_WINDOWS = int(os.environ.get('ECG_STREAM_MAX_WINDOWS', 8640))
+
+# Detección de latidos por bloques (con contexto a cada lado para el umbral adaptativo)
+STREAM_BEAT_BLOCK_S = 300
+STREAM_BEAT_MARGIN_S = 20
+
+
+def _batched(iterable: Iterable[str], size: int) -> Iterator[List[str]]:
+    """Agrupa un iterable en listas de hasta size elementos"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_s3_lines(bucket: str, key: str) -> Iterator[str]:
+    """Lee un objeto de S3 línea a línea sin descargarlo completo"""
+    body = get_s3_client().get_object(Bucket=bucket, Key=key)['Body']
+    for line in body.iter_lines():
+        yield line.decode('utf-8')
+
+
+def iter_csv_chunks(lines: Iterable[str], chunk_rows: int = STREAM_CHUNK_ROWS,
+                    info: Dict[str, Any] = None, leads: Sequence[str] = ECG_LEADS) -> Iterator[np.ndarray]:
+    """
+    Parsea un CSV línea a línea y genera bloques [muestras, derivaciones] (solo las columnas de leads)
+    
+    En info se dejan 'fs' (disponible antes del primer bloque) y 'metadata' (etiqueta
+    real, disponible al agotar el generador). Igual que en parse_csv_content, las
+    celdas vacías se omiten por columna y la señal se trunca a la derivación más corta.
+    """
+    info = info if info is not None else {}
+    info['fs'] = 500
+    info['metadata'] = {}
+    
+    lines = (line.rstrip('\r\n') for line in lines)
+    header_line = next((line for line in lines if line), None)
+    if header_line is None:
+        return
+    header = next(csv.reader([header_line]))
+    # Como en DictReader, si una columna está repetida gana la última
+    column_index = {name: i for i, name in enumerate(header)}
+    # Sin columna tiempo_s se usa la frecuencia por defecto desde el inicio
+    fs_known = 'tiempo_s' not in column_index
+    label_index = column_index.get('label')
+    is_anomalo_index = column_index.get('is_anomalo')
+    
+    label_real = None
+    is_anomalo_real = None
+    first_times: List[float] = []
+    pending = {lead: np.empty(0) for lead in leads}
+    held: List[np.ndarray] = []  # Bloques retenidos hasta conocer fs
+    
+    for block in _batched(lines, chunk_rows):
+        text = '\n'.join(block)
+        columns = parse_numeric_columns(text, column_index, names=('tiempo_s', *leads))
+        
+        if not fs_known:
+            first_times.extend(columns['tiempo_s'][:FS_ESTIMATION_SAMPLES - len(first_times)].tolist())
+            if len(first_times) == FS_ESTIMATION_SAMPLES:
+                info['fs'] = estimate_fs(np.array(first_times))
+                fs_known = True
+        
+        # Etiquetas: solo hasta encontrar el primer valor válido
+        if label_index is not None and label_real is None:
+            label_real = first_label(row[label_index] if label_index < len(row) else None
+                                     for row in filter(None, csv.reader(block)))
+        if is_anomalo_index is not None and is_anomalo_real is None:
+            is_anomalo_real = first_is_anomalo(row[is_anomalo_index] if is_anomalo_index < len(row) else None
+                                               for row in filter(None, csv.reader(block)))
+        
+        # Alinear derivaciones: se emiten las filas completas y el resto queda pendiente
+        for lead in leads:
+            pending[lead] = np.concatenate([pending[lead], columns[lead]])
+        num_samples = min(len(pending[lead]) for lead in leads)
+        if num_samples == 0:
+            continue
+        chunk = np.column_stack([pending[lead][:num_samples] for lead in leads])
+        for lead in leads:
+            pending[lead] = pending[lead][num_samples:]
+        
+        if not fs_known:
+            held.append(chunk)
+            continue
+        yield from held
+        held = []
+        yield chunk
+    
+    info['fs'] = estimate_fs(np.array(first_times))
+    yield from held
+    info['metadata'] = build_label_metadata(label_real, is_anomalo_real)
+
+
+def iter_filtered_chunks(chunks: Iterable[np.ndarray], fs: float,
+                         params: Dict[str, Any] = None) -> Iterator[np.ndarray]:
+    """Etapa 2 por bloques: notch + pasa banda arrastrando el estado de los filtros"""
+    sos, _ = design_filter_bank(fs, params)
+    states = None
+    for chunk in chunks:
+        filtered, states = apply_sos(sos, chunk, states)
+        yield filtered
+
+
+class StreamResampler:
+    """
+    Remuestreo incremental: push(bloque) retorna las muestras de salida que ya se pueden
+    calcular y finish() las del final de la señal. Concatenadas dan exactamente las
+    mismas muestras que resample_to_200hz sobre la señal completa; solo se retienen las
+    muestras de entrada que faltan usar.
+    """
+    
+    def __init__(self, original_fs: float, target_fs: float = 200):
+        self.original_fs = original_fs
+        self.target_fs = target_fs
+        self.seen = 0
+        self.next_output = 0
+        self.metodo = None
+        self.plan = None
+        self._buffer = None
+        self._start = 0  # Índice de entrada de _buffer[0]
+        self._empty = np.empty((0, 0))  # Salida vacía con los canales y el dtype de la entrada
+        if abs(original_fs - target_fs) < 0.1:
+            self.mode = 'identidad'
+            return
+        self.plan = resample_plan(original_fs, target_fs)
+        if self.plan is not None:
+            self.mode = 'polifasico'
+            self.metodo = f'polifásico {self.plan[0]}/{self.plan[1]}'
+            self._pad = self.plan[2].shape[1] + 1
+            self._start = -self._pad  # El relleno inicial tiene índices negativos
+        else:
+            self.mode = 'lineal'
+            self.metodo = 'interpolación lineal'
+            # Muestras previas que pueden necesitarse para interpolar al inicio del bloque
+            self._carry = int(math.ceil(original_fs / target_fs)) + 2
+    
+    @property
+    def target_samples(self) -> int:
+        """Muestras de salida de la señal recibida hasta ahora, si terminara acá"""
+        if self.mode == 'identidad':
+            return self.seen
+        return int(round((self.seen / self.original_fs) * self.target_fs))
+    
+    def push(self, chunk: np.ndarray) -> np.ndarray:
+        """Agrega un bloque de entrada [muestras, canales] y retorna las salidas nuevas"""
+        self._empty = np.empty((0,) + chunk.shape[1:], dtype=chunk.dtype)
+        if self.mode == 'identidad':
+            self.seen += chunk.shape[0]
+            self.next_output = self.seen
+            return chunk
+        if self.mode == 'polifasico':
+            return self._push_polyphase(chunk)
+        return self._push_linear(chunk)
+    
+    def finish(self) -> np.ndarray:
+        """Salidas restantes al terminar la señal (se extiende con la última muestra)"""
+        target_samples = self.target_samples
+        if self.mode == 'identidad' or target_samples <= self.next_output or self._buffer is None:
+            return self._empty
+        if self.mode == 'polifasico':
+            buffer = np.concatenate([self._buffer, np.repeat(self._buffer[-1:], self._pad, axis=0)])
+            resampled = polyphase_block(self.plan, buffer, self._start, self.next_output, target_samples)
+        else:
+            # Las muestras restantes caen más allá de la última muestra original
+            resampled = np.repeat(self._buffer[-1:], target_samples - self.next_output, axis=0)
+        self.next_output = target_samples
+        return resampled
+    
+    def _push_polyphase(self, chunk: np.ndarray) -> np.ndarray:
+        if chunk.shape[0] == 0:
+            return self._empty
+        if self._buffer is None:
+            self._buffer = np.concatenate([np.repeat(chunk[:1], self._pad, axis=0), chunk])
+        else:
+            self._buffer = np.concatenate([self._buffer, chunk])
+        self.seen += chunk.shape[0]
+        
+        # Solo se emiten muestras que seguro existen en el resultado final
+        # (i < round(duración * target_fs)) y cuyas entradas ya llegaron
+        stop = min(self.target_samples, polyphase_ready(self.plan, self.seen))
+        resampled = self._empty
+        if stop > self.next_output:
+            resampled = polyphase_block(self.plan, self._buffer, self._start, self.next_output, stop)
+            self.next_output = stop
+        
+        drop = polyphase_first_input(self.plan, self.next_output) - self._start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._start += drop
+        return resampled
+    
+    def _push_linear(self, chunk: np.ndarray) -> np.ndarray:
+        buffer = chunk if self._buffer is None else np.concatenate([self._buffer, chunk])
+        base = self.seen - (0 if self._buffer is None else self._buffer.shape[0])
+        self.seen += chunk.shape[0]
+        
+        # Solo se emiten muestras que seguro existen en el resultado final
+        # (i < round(duración * target_fs)) y cuyos dos vecinos ya llegaron
+        i = np.arange(self.next_output, self.target_samples)
+        t = (i / self.target_fs) * self.original_fs
+        index = t.astype(np.int64)
+        ready = index + 1 <= self.seen - 1
+        t, index = t[ready], index[ready]
+        
+        resampled = self._empty
+        if index.size:
+            fraction = (t - index)[:, np.newaxis]
+            resampled = buffer[index - base] * (1 - fraction) + buffer[index + 1 - base] * fraction
+            self.next_output += index.size
+        self._buffer = buffer[-self._carry:]
+        return resampled
+
+
+def iter_resampled_chunks(chunks: Iterable[np.ndarray], original_fs: float,
+                          target_fs: float = 200, info: Dict[str, Any] = None) -> Iterator[np.ndarray]:
+    """
+    Etapa 4 por bloques: remuestreo a target_fs
+    
+    Produce exactamente las mismas muestras que resample_to_200hz sobre la señal
+    completa. En info se dejan 'muestras_originales', 'muestras_finales' y 'metodo'.
+    """
+    info = info if info is not None else {}
+    resampler = StreamResampler(original_fs, target_fs)
+    if resampler.metodo:
+        info['metodo'] = resampler.metodo
+    
+    for chunk in chunks:
+        resampled = resampler.push(chunk)
+        if resampled.shape[0] or resampler.mode == 'identidad':
+            yield resampled
+    resampled = resampler.finish()
+    if resampled.shape[0]:
+        yield resampled
+    
+    info['muestras_originales'] = resampler.seen
+    info['muestras_finales'] = resampler.target_samples
+
+
+def _merge_statistics(a: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                      b: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Combina (conteos, medias, m2) de dos bloques (algoritmo paralelo de Chan)"""
+    count_a, mean_a, m2_a = a
+    count_b, mean_b, m2_b = b
+    count = count_a + count_b
+    safe = np.maximum(count, 1)
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / safe
+    m2 = m2_a + m2_b + delta ** 2 * count_a * count_b / safe
+    return count, mean, m2
+
+
+def _stream_normalize(chunk: np.ndarray, method: str, normalization: List[np.ndarray],
+                      stats: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+    """Normaliza un bloque resampleado con los parámetros de toda la señal filtrada"""
+    if method == 'z-score':
+        counts, mean, m2 = stats
+        std = np.sqrt(m2 / np.maximum(counts, 1))
+        return apply_z_score(chunk, mean, np.where(std >= 1e-10, std, 1.0))
+    return apply_min_max(chunk, *normalization)
+
+
+class _StreamQuality:
+    """
+    Índices de signal_quality_indices acumulados por bloques de la señal cruda (primera
+    pasada del modo streaming): inválidos, tramos planos y saturación dan lo mismo que
+    sobre la señal completa. Las ventanas de 10 s se analizan a medida que se completan
+    (la última, alineada al final, con las últimas muestras que se retienen); en ellas
+    los valores inválidos se reemplazan por la media válida de la ventana en lugar de la
+    del canal.
+    """
+    
+    def __init__(self, fs: float, num_channels: int):
+        self.fs = fs
+        self.window_length = int(round(SQI_WINDOW_S * fs))
+        self.min_flat = max(2, int(SQI_FLATLINE_MIN_S * fs))
+        self.samples = 0
+        zeros = np.zeros(num_channels)
+        self.stats = (zeros, zeros, zeros)
+        # Tramos planos: último valor, diferencias nulas del tramo abierto y totales
+        self._last = np.full(num_channels, np.nan)
+        self._run = np.zeros(num_channels, dtype=np.int64)
+        self._flat = np.zeros(num_channels, dtype=np.int64)
+        self._longest = np.zeros(num_channels, dtype=np.int64)
+        # Saturación: extremos válidos y cuántas muestras caen en cada uno
+        self._min = np.full(num_channels, np.inf)
+        self._max = np.full(num_channels, -np.inf)
+        self._at_min = np.zeros(num_channels, dtype=np.int64)
+        self._at_max = np.zeros(num_channels, dtype=np.int64)
+        # Muestras de la ventana de 10 s en curso y últimas window_length muestras
+        self._pending = np.empty((0, num_channels))
+        self._tail = np.empty((0, num_channels))
+        self._ratios: Dict[str, List[np.ndarray]] = {'linea_base': [], 'red_electrica': [], 'sqi': []}
+    
+    def push(self, chunk: np.ndarray) -> None:
+        self.samples += chunk.shape[0]
+        self.stats = _merge_statistics(self.stats, channel_statistics(chunk))
+        self._push_flatline(chunk)
+        self._push_extremes(chunk)
+        
+        self._pending = np.concatenate([self._pending, chunk])
+        self._tail = np.concatenate([self._tail, chunk])[-self.window_length:]
+        complete = self._pending.shape[0] // self.window_length
+        if complete:
+            self._add_windows(self._pending[:complete * self.window_length].reshape(
+                complete, self.window_length, -1))
+            self._pending = self._pending[complete * self.window_length:]
+    
+    def indices(self) -> Dict[str, Any]:
+        """Los índices de signal_quality_indices para la señal recibida"""
+        if self.samples < self.window_length:
+            self._add_windows(self._pending[np.newaxis])
+        elif self._pending.shape[0]:
+            self._add_windows(self._tail[np.newaxis])
+        ratios = {key: np.concatenate(values, axis=1) for key, values in self._ratios.items()}
+        window_sqi = ratios['sqi'].min(axis=0)
+        
+        counts = self.stats[0]
+        flat = self._flat + np.where(self._run + 1 >= self.min_flat, self._run + 1, 0) * (self._run > 0)
+        longest = np.maximum(self._longest, np.where(self._run > 0, self._run + 1, 0))
+        at_limits = np.where(self._min == self._max, self._at_min, self._at_min + self._at_max)
+        return {
+            'estadisticas': self.stats,
+            'invalidos': 1 - counts / self.samples,
+            'plano_fraccion': flat / self.samples,
+            'plano_max_s': longest / self.fs,
+            'saturacion': np.where(counts > 1, at_limits / np.maximum(counts, 1), 0.0),
+            'linea_base': ratios['linea_base'].mean(axis=1),
+            'red_electrica': ratios['red_electrica'].mean(axis=1),
+            'sqi_ventanas': window_sqi,
+            'ventanas_buenas': int((window_sqi >= SQI_MIN_WINDOW_SQI).sum())
+        }
+    
+    def _push_flatline(self, chunk: np.ndarray) -> None:
+        """Tramos de muestras iguales: los que cierran en el bloque se cuentan y el último queda abierto"""
+        equal = np.empty(chunk.shape, dtype=bool)
+        equal[0] = chunk[0] == self._last
+        equal[1:] = chunk[1:] == chunk[:-1]
+        self._last = chunk[-1].copy()
+        for channel in range(chunk.shape[1]):
+            edges = np.diff(np.concatenate([[False], equal[:, channel], [False]]).astype(np.int8))
+            starts = np.flatnonzero(edges == 1)
+            ends = np.flatnonzero(edges == -1)
+            lengths = ends - starts  # Diferencias nulas de cada tramo
+            if starts.size and starts[0] == 0:
+                lengths[0] += self._run[channel]
+            elif self._run[channel]:
+                lengths = np.concatenate([[self._run[channel]], lengths])
+                ends = np.concatenate([[0], ends])
+            open_run = ends.size and ends[-1] == chunk.shape[0]
+            self._run[channel] = lengths[-1] if open_run else 0
+            closed = lengths[:-1] if open_run else lengths
+            samples = closed + 1
+            self._flat[channel] += samples[samples >= self.min_flat].sum()
+            if samples.size:
+                self._longest[channel] = max(self._longest[channel], samples.max())
+    
+    def _push_extremes(self, chunk: np.ndarray) -> None:
+        """Mínimo y máximo válidos por canal y cuántas muestras valen exactamente eso"""
+        valid = np.where(valid_mask(chunk), chunk, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            chunk_min = np.nanmin(valid, axis=0)
+            chunk_max = np.nanmax(valid, axis=0)
+        at_min = (valid == chunk_min).sum(axis=0)
+        at_max = (valid == chunk_max).sum(axis=0)
+        has_valid = ~np.isnan(chunk_min)
+        lower = has_valid & (chunk_min < self._min)
+        self._at_min = np.where(lower, at_min, self._at_min + np.where(chunk_min == self._min, at_min, 0))
+        self._min = np.where(lower, chunk_min, self._min)
+        higher = has_valid & (chunk_max > self._max)
+        self._at_max = np.where(higher, at_max, self._at_max + np.where(chunk_max == self._max, at_max, 0))
+        self._max = np.where(higher, chunk_max, self._max)
+    
+    def _add_windows(self, windows: np.ndarray) -> None:
+        """Potencias relativas de ventanas [ventanas, muestras, canales] (de a SQI_WINDOW_GROUP)"""
+        windows = np.moveaxis(windows, 2, 0)
+        mask = valid_mask(windows)
+        if not mask.all():
+            counts = np.maximum(mask.sum(axis=-1, keepdims=True), 1)
+            means = np.where(mask, windows, 0.0).sum(axis=-1, keepdims=True) / counts
+            windows = np.where(mask, windows, means)
+        for start in range(0, windows.shape[1], SQI_WINDOW_GROUP):
+            group = band_power_ratios(windows[:, start:start + SQI_WINDOW_GROUP], self.fs)
+            for key, values in self._ratios.items():
+                values.append(group[key])
+
+
+class _StreamBeats:
+    """
+    Picos R de la derivación de latidos filtrada, por bloques de STREAM_BEAT_BLOCK_S con
+    STREAM_BEAT_MARGIN_S de contexto a cada lado: coincide con detect_beats sobre la señal
+    completa salvo, eventualmente, cerca de los bordes de los bloques.
+    """
+    
+    def __init__(self, fs: float, params: Dict[str, Any]):
+        self.fs = fs
+        self.params = params
+        self.block = int(STREAM_BEAT_BLOCK_S * fs)
+        self.margin = int(STREAM_BEAT_MARGIN_S * fs)
+        self._buffer = np.empty(0)
+        self._start = 0  # Índice de _buffer[0] en la señal
+        self._decided = 0  # Los picos anteriores a este índice ya están decididos
+        self._peaks: List[np.ndarray] = []
+        self._error = None if fs >= 2 * BEAT_BAND_HZ[1] + 1 else f'fs insuficiente para detectar latidos: {fs} Hz'
+    
+    def push(self, chunk: np.ndarray) -> None:
+        if self._error is not None:
+            return
+        self._buffer = np.concatenate([self._buffer, chunk[:, self.params['canal']]])
+        while self._start + self._buffer.shape[0] >= self._decided + self.block + self.margin:
+            self._detect(self._decided + self.block)
+    
+    def status(self) -> Dict[str, Any]:
+        """Estado de la etapa de latidos (como detect_beats, sin segmentos)"""
+        try:
+            if self._error is not None:
+                raise ValueError(self._error)
+            if self._start + self._buffer.shape[0] > self._decided:
+                self._detect(self._start + self._buffer.shape[0])
+            peaks = np.concatenate(self._peaks) if self._peaks else np.zeros(0, dtype=np.int64)
+            # Un mismo latido detectado a ambos lados de un borde de bloque cuenta una vez
+            refractory = max(1, int(BEAT_REFRACTORY_S * self.fs))
+            peaks = peaks[np.concatenate([[True], np.diff(peaks) >= refractory])] if peaks.size else peaks
+            return beat_status(peaks, self.fs, self.params)
+        except Exception as e:
+            logger.error(f"Error detectando latidos: {str(e)}")
+            return {
+                'status': 'ERROR',
+                'mensaje': f'Error detectando latidos: {str(e)}',
+                'num_latidos': 0
+            }
+    
+    def _detect(self, end: int) -> None:
+        """Decide los picos en [_decided, end) con el contexto disponible hasta end + margin"""
+        stop = end + self.margin - self._start
+        peaks = detect_r_peaks(self._buffer[:stop], self.fs) + self._start
+        self._peaks.append(peaks[(peaks >= self._decided) & (peaks < end)])
+        self._decided = end
+        drop = self._decided - self.margin - self._start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._start += drop
+
+
+def _target_samples(num_samples: int, original_fs: float, target_fs: float) -> int:
+    """Muestras de la señal remuestreada a target_fs (como resample_to_200hz)"""
+    if abs(original_fs - target_fs) < 0.1:
+        return num_samples
+    return int(round((num_samples / original_fs) * target_fs))
+
+
+def _window_starts(target_samples: int, window_length: int, hop: Any, multi_window: bool,
+                   max_windows: int) -> Tuple[List[int], bool]:
+    """
+    Inicio de cada ventana del modelo como en window_signal (solo la primera con
+    multiWindow=false), hasta max_windows: (inicios, truncado)
+    """
+    hop = int(hop) if hop and int(hop) > 0 else window_length
+    if not multi_window or target_samples <= window_length:
+        return [0], False
+    starts = range(0, target_samples - window_length + 1, hop)
+    tail = starts[-1] + window_length < target_samples
+    if len(starts) + tail > max_windows:
+        return list(starts[:max_windows]), True
+    return list(starts) + ([target_samples - window_length] if tail else []), False
+
+
+class _WindowStream:
+    """
+    Arma las ventanas del modelo a medida que llegan las muestras normalizadas: cada
+    ventana se emite apenas llegó su última muestra (igual que window_signal /
+    convert_to_model_input, con ceros si la señal es más corta) y solo se retienen las
+    muestras que todavía necesita alguna ventana pendiente.
+    """
+    
+    def __init__(self, starts: Sequence[int], target_samples: int, window_length: int,
+                 num_channels: int, dtype: Any):
+        self.starts = starts
+        self.target_samples = target_samples
+        self.window_length = window_length
+        self.emitted = 0
+        self._history = np.empty((0, num_channels), dtype=dtype)
+        self._history_start = 0
+    
+    @property
+    def done(self) -> bool:
+        return self.emitted >= len(self.starts)
+    
+    def push(self, chunk: np.ndarray, max_windows: int) -> Iterator[np.ndarray]:
+        """Ventanas [k, window_length, canales] que se completan con chunk, de a lo sumo max_windows"""
+        if self.done:
+            return
+        self._history = np.concatenate([self._history, chunk])
+        produced = self._history_start + self._history.shape[0]
+        while not self.done:
+            count = 0
+            while (count < max_windows and self.emitted + count < len(self.starts)
+                   and min(self.starts[self.emitted + count] + self.window_length, self.target_samples) <= produced):
+                count += 1
+            if count == 0:
+                break
+            windows = np.zeros((count, self.window_length, self._history.shape[1]), dtype=self._history.dtype)
+            for index in range(count):
+                start = self.starts[self.emitted + index] - self._history_start
+                window = self._history[start:start + self.window_length]
+                windows[index, :window.shape[0]] = window
+            self.emitted += count
+            yield windows
+        
+        # Solo hacen falta las muestras desde el inicio de la próxima ventana
+        keep_from = min(self.starts[self.emitted], produced) if not self.done else produced
+        drop = keep_from - self._history_start
+        if drop > 0:
+            self._history = self._history[drop:]
+            self._history_start += drop
+
+
+class StreamInference:
+    """
+    Inferencia a medida que el modo streaming produce las ventanas: se arman lotes con el
+    límite de payload, se envían de a INFERENCE_CONCURRENCY llamadas en paralelo y de
+    cada lote solo se guardan sus probabilidades, que al final se agregan como en
+    invoke_models.
+    """
+    
+    def __init__(self, models: List[Tuple[str, Dict[str, Any]]], aggregation: str = 'mean'):
+        self.models = models
+        self.aggregation = aggregation
+        self._pending: Dict[str, List[np.ndarray]] = {model_id: [] for model_id, _ in models}
+        self._requests: List[Tuple[str, int, Tuple[str, bytes]]] = []
+        self._probabilities: Dict[str, List[Any]] = {model_id: [] for model_id, _ in models}
+        self.stats = {'llamadas': 0, 'intentos': 0, 'hedges': 0}
+    
+    def add(self, model_id: str, windows: np.ndarray) -> None:
+        """Agrega ventanas de un modelo; envía los lotes que ya están completos"""
+        pending = self._pending[model_id]
+        pending.append(windows)
+        per_batch = windows_per_batch(windows.shape[1:])
+        if sum(batch.shape[0] for batch in pending) >= per_batch:
+            self._queue(model_id, final=False)
+    
+    def result(self) -> Tuple[Any, Dict[str, Any]]:
+        """(prediccion, modelo_info) con las ventanas recibidas"""
+        for model_id, _ in self.models:
+            self._queue(model_id, final=True)
+        self._send()
+        results = {model_id: model_prediction(model, self._probabilities[model_id], self.aggregation)
+                   for model_id, model in self.models}
+        if len(self.models) == 1:
+            prediccion, modelo_info = results[self.models[0][0]]
+        else:
+            prediccion, modelo_info = ensemble_predictions(self.models, results)
+        if prediccion is not None:
+            add_call_stats(modelo_info, self.stats)
+        return prediccion, modelo_info
+    
+    def _queue(self, model_id: str, final: bool) -> None:
+        """Pasa las ventanas pendientes a lotes (salvo el último lote incompleto, si no es el final)"""
+        pending = self._pending[model_id]
+        if not pending:
+            return
+        windows = np.concatenate(pending) if len(pending) > 1 else pending[0]
+        per_batch = windows_per_batch(windows.shape[1:])
+        ready = windows.shape[0] if final else windows.shape[0] // per_batch * per_batch
+        endpoint = dict(self.models)[model_id]['endpoint']
+        sizes, requests = model_requests(windows[:ready], endpoint) if ready else ([], [])
+        self._requests.extend((model_id, size, request) for size, request in zip(sizes, requests))
+        self._pending[model_id] = [windows[ready:]] if ready < windows.shape[0] else []
+        if len(self._requests) >= INFERENCE_CONCURRENCY:
+            self._send()
+    
+    def _send(self) -> None:
+        if not self._requests:
+            return
+        requests = [request for _, _, request in self._requests]
+        try:
+            responses, stats = get_inference_client().invoke_many(requests, return_exceptions=True)
+        except Exception as e:
+            responses, stats = [e] * len(requests), {'intentos': 0, 'hedges': 0}
+        for (model_id, size, _), probabilities in zip(self._requests, batch_probabilities(
+                [size for _, size, _ in self._requests], responses)):
+            self._probabilities[model_id].append(probabilities)
+        self.stats['llamadas'] += len(requests)
+        for key, value in stats.items():
+            self.stats[key] += value
+        self._requests = []
+
+
+def process_stream(open_lines: Callable[[], Iterable[str]], chunk_rows: int = STREAM_CHUNK_ROWS,
+                   filter_params: Dict[str, Any] = None, leads: Sequence[str] = ECG_LEADS,
+                   models: List[Tuple[str, Dict[str, Any]]] = None,
+                   request_data: Dict[str, Any] = None,
+                   on_windows: Callable[[str, np.ndarray], None] = None) -> Dict[str, Any]:
+    """
+    Ejecuta el pipeline completo en modo streaming con memoria acotada.
+    
+    open_lines() abre el CSV desde el comienzo y se recorre dos veces. La primera pasada
+    filtra la señal y solo acumula los índices de calidad (SQI), los picos R y las
+    estadísticas de normalización, que dependen de todo el registro. Si el chequeo de
+    calidad pasa, la segunda vuelve a filtrar, remuestrea a la fs de cada modelo,
+    normaliza y arma las ventanas como el camino batch (multiWindow, windowHop), que se
+    entregan a on_windows(modelo, ventanas) en grupos acotados a medida que se
+    completan. Nunca se retiene el tensor completo.
+    
+    Retorna la respuesta (sin predicción ni segmentos por latido). El filtrado es
+    siempre causal (el de fase cero necesita la señal completa). Se procesan las
+    derivaciones de leads y cada modelo toma las suyas. Las ventanas más allá de
+    STREAM_MAX_WINDOWS no se evalúan (streaming.truncado en la respuesta).
+    """
+    request_data = request_data or {}
+    models = models or resolve_models(None)
+    filter_params = dict(filter_params or filter_parameters(), zero_phase=False)
+    dtype = PRECISIONS[signal_precision(request_data)]
+    
+    # Primera pasada: calidad (señal cruda) y parámetros de normalización (señal filtrada)
+    csv_info: Dict[str, Any] = {}
+    raw_chunks = iter_csv_chunks(open_lines(), chunk_rows, csv_info, leads)
+    first = next(raw_chunks, None)
+    original_fs = csv_info['fs']
+    
+    num_channels = first.shape[1] if first is not None else len(leads)
+    quality = _StreamQuality(original_fs, num_channels)
+    beats = _StreamBeats(original_fs, beat_parameters(request_data, leads))
+    filtered_stats = (np.zeros(num_channels), np.zeros(num_channels), np.zeros(num_channels))
+    normalization = [np.full(num_channels, np.inf), np.full(num_channels, -np.inf),
+                     np.zeros(num_channels, dtype=bool)]
+    z_score = any(model['normalizacion'] == 'z-score' for _, model in models)
+    num_chunks = 0
+    
+    def tap_raw(chunks):
+        nonlocal num_chunks
+        for chunk in chunks:
+            quality.push(chunk)
+            num_chunks += 1
+            yield chunk
+    
+    if first is not None:
+        chunks = tap_raw(itertools.chain([first], raw_chunks))
+        for chunk in iter_filtered_chunks(chunks, original_fs, filter_params):
+            min_val, max_val, has_valid = min_max_range(chunk)
+            normalization[0] = np.minimum(normalization[0], min_val)
+            normalization[1] = np.maximum(normalization[1], max_val)
+            normalization[2] |= has_valid
+            if z_score:
+                filtered_stats = _merge_statistics(filtered_stats, channel_statistics(chunk))
+            beats.push(chunk)
+    
+    # Mismo chequeo que check_quality: los SQI solo si pasan los de forma y duración
+    num_samples = quality.samples
+    quality_check = quality_from_statistics(num_samples, num_channels, original_fs,
+                                            quality.stats if num_chunks else None, len(leads))
+    if quality_check['status'] == 'OK':
+        quality_check = quality_from_sqi(quality_check, quality.indices())
+    quality_check['derivaciones'] = list(leads)
+    metadata = csv_info['metadata']
+    
+    response_data = {
+        'signal_original': None,
+        'signal_filtrada': None,
+        'signal_normalizada': None,
+        'signal_resampleada': None,
+        'tensor_final': None,
+        'estados': {'calidad': quality_check},
+        'prediccion': None,
+        'modelo': {'nombre': 'N/A', 'endpoint': 'N/A'},
+        'etiqueta_real': metadata if metadata else None,
+        'streaming': {'bloques': num_chunks, 'muestras_totales': num_samples}
+    }
+    
+    if quality_check['status'] == 'RECHAZADA':
+        response_data['estados'].update({
+            'filtrado': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en calidad', 'filtros_aplicados': []},
+            'normalizacion': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en calidad', 'metodo': 'ninguno'},
+            'resampling': {'status': 'ERROR', 'mensaje': 'No se procesó debido a fallo en calidad',
+                           'fs_final': original_fs, 'muestras_originales': num_samples,
+                           'muestras_finales': num_samples}
+        })
+        return response_data
+    
+    # Segunda pasada: la normalización (afín por canal, con los parámetros de toda la
+    # señal filtrada) conmuta con el remuestreo, así que se aplica por bloques sobre la
+    # señal resampleada y las ventanas se arman y entregan a medida que se completan
+    resamplers = {model['target_fs']: StreamResampler(original_fs, model['target_fs']) for _, model in models}
+    windows: Dict[str, _WindowStream] = {}
+    truncated = False
+    for model_id, model in models:
+        target_samples = _target_samples(num_samples, original_fs, model['target_fs'])
+        starts, model_truncated = _window_starts(target_samples, model['input_length'], request_data.get('windowHop'),
+                                                 request_data.get('multiWindow', True), STREAM_MAX_WINDOWS)
+        truncated |= model_truncated
+        windows[model_id] = _WindowStream(starts, target_samples, model['input_length'],
+                                          len(model['derivaciones']), dtype)
+    primary_id, primary = models[0]
+    preview = []
+    
+    def deliver(target_fs: float, chunk: np.ndarray) -> None:
+        chunk = chunk.astype(dtype, copy=False)
+        normalized = {}
+        for model_id, model in models:
+            if model['target_fs'] != target_fs or windows[model_id].done:
+                continue
+            method = model['normalizacion']
+            if method not in normalized:
+                normalized[method] = _stream_normalize(chunk, method, normalization, filtered_stats)
+            block = normalized[method][:, lead_channels(leads, model['derivaciones'])].astype(dtype, copy=False)
+            max_windows = windows_per_batch((model['input_length'], len(model['derivaciones'])))
+            for group in windows[model_id].push(block, max_windows):
+                if not preview and model_id == primary_id:
+                    preview.append(group[:1].copy())
+                if on_windows is not None:
+                    on_windows(model_id, group)
+    
+    raw_chunks = iter_csv_chunks(open_lines(), chunk_rows, {}, leads)
+    for chunk in iter_filtered_chunks(raw_chunks, original_fs, filter_params):
+        for target_fs, resampler in resamplers.items():
+            deliver(target_fs, resampler.push(chunk))
+        if all(stream.done for stream in windows.values()):
+            break
+    else:
+        for target_fs, resampler in resamplers.items():
+            deliver(target_fs, resampler.finish())
+    
+    stream = windows[primary_id]
+    response_data['tensor_final'] = {
+        'shape': [len(stream.starts), primary['input_length'], len(primary['derivaciones'])],
+        'muestra_preview': preview[0] if preview else None
+    }
+    response_data['streaming']['ventanas'] = len(stream.starts)
+    if truncated:
+        response_data['streaming']['truncado'] = True
+        evaluated = min(stream.starts[-1] + primary['input_length'], stream.target_samples)
+        response_data['streaming']['segundos_evaluados'] = round(evaluated / primary['target_fs'], 3)
+    response_data['estados'].update({
+        'filtrado': {
+            'status': 'OK',
+            'mensaje': 'Filtrado completado exitosamente',
+            'filtros_aplicados': design_filter_bank(original_fs, filter_params)[1],
+            'fase_cero': False
+        },
+        'latidos': beats.status(),
+        'normalizacion': {
+            'status': 'OK',
+            'mensaje': 'Normalización completada exitosamente',
+            'metodo': f"{primary['normalizacion']} (por canal)"
+        },
+        'resampling': resampling_status(original_fs, primary['target_fs'], num_samples,
+                                        stream.target_samples, resamplers[primary['target_fs']].metodo)
+    })
+    return response_data
+
+
+# Muestras por bloque del modo fusionado (señal ya en memoria): cada bloque filtrado
+# de 3 canales ocupa ~400 KB y se recorre mientras sigue en caché
+FUSED_BLOCK_SAMPLES = 16384
+
+
+def _model_input_spans(target_samples: int, window_length: int, hop: int, multi_window: bool, num_channels: int,
+                       dtype: Any = np.float64) -> Tuple[List[Tuple[int, int, np.ndarray]], Callable[[], np.ndarray]]:
+    """
+    Reserva el tensor del modelo y retorna (tramos, completar): cada tramo (inicio, fin,
+    vista) indica en qué parte del tensor se escriben esas muestras resampleadas y
+    completar() arma las ventanas que repiten muestras ya escritas. Reproduce
+    build_model_input (window_signal / convert_to_model_input).
+    """
+    hop = int(hop) if hop and int(hop) > 0 else window_length
+    if not multi_window or target_samples <= window_length:
+        tensor = np.zeros((1, window_length, num_channels), dtype=dtype)
+        used = min(target_samples, window_length)
+        return [(0, used, tensor[0, :used])], lambda: tensor
+    
+    if hop == window_length:
+        # Ventanas contiguas: la señal resampleada es el propio tensor aplanado, salvo
+        # la última ventana, alineada al final, que empieza con el final de la anterior
+        full, tail = divmod(target_samples, window_length)
+        tensor = np.empty((full + (tail > 0), window_length, num_channels), dtype=dtype)
+        spans = [(0, full * window_length, tensor[:full].reshape(-1, num_channels))]
+        if tail:
+            spans.append((full * window_length, target_samples, tensor[full, window_length - tail:]))
+        
+        def complete() -> np.ndarray:
+            if tail:
+                tensor[full, :window_length - tail] = tensor[full - 1, tail:]
+            return tensor
+        return spans, complete
+    
+    # Ventanas solapadas: la señal resampleada se guarda entera y se divide al final
+    resampled = np.empty((target_samples, num_channels), dtype=dtype)
+    return [(0, target_samples, resampled)], lambda: window_signal(resampled, window_length, hop)
+
+
+def _write_spans(spans: List[Tuple[int, int, np.ndarray]], chunk: np.ndarray, written: int) -> None:
+    """Copia las muestras resampleadas [written, written + len(chunk)) a los tramos del tensor que las usan"""
+    end = written + chunk.shape[0]
+    for span_start, span_end, view in spans:
+        low, high = max(span_start, written), min(span_end, end)
+        if low < high:
+            view[low - span_start:high - span_start] = chunk[low - written:high - written]
+
+
+def fused_model_input(signal: np.ndarray, original_fs: float, filter_params: Dict[str, Any],
+                      model: Dict[str, Any], request_data: Dict[str, Any],
+                      block_samples: int = FUSED_BLOCK_SAMPLES,
+                      beat_channel: int = 0) -> Optional[Tuple[np.ndarray, Dict[str, Any], np.ndarray]]:
+    """
+    Filtrado, estadísticas de normalización y resampling en una sola pasada por bloques
+    sobre una señal en memoria, escribiendo las muestras resampleadas directamente en
+    el tensor del modelo. La normalización (afín por canal) se aplica al final sobre el
+    tensor: conmuta con el remuestreo, así que el resultado es el del camino por etapas.
+    
+    Retorna (model_input, estados, derivación beat_channel filtrada para la etapa de latidos), o
+    None si la señal filtrada tiene valores inválidos (el camino por etapas los trata
+    muestra a muestra). No admite filtrado de fase cero. El tensor y la derivación de
+    latidos quedan en el dtype de la señal; los bloques se filtran en float64.
+    """
+    num_samples, num_channels = signal.shape
+    target_fs = model['target_fs']
+    method = model['normalizacion']
+    target_samples = _target_samples(num_samples, original_fs, target_fs)
+    
+    spans, complete = _model_input_spans(target_samples, model['input_length'], request_data.get('windowHop'),
+                                         request_data.get('multiWindow', True), num_channels, signal.dtype)
+    needed = spans[-1][1]
+    
+    min_val = np.full(num_channels, np.inf)
+    max_val = np.full(num_channels, -np.inf)
+    stats = (np.zeros(num_channels), np.zeros(num_channels), np.zeros(num_channels))
+    beat_lead = np.empty(num_samples, dtype=signal.dtype)
+    position = 0
+    
+    def tap_filtered(chunks):
+        nonlocal min_val, max_val, stats, position
+        for chunk in chunks:
+            # min/max sin máscara: un NaN o Inf queda en el extremo y se detecta al final
+            min_val = np.minimum(min_val, chunk.min(axis=0))
+            max_val = np.maximum(max_val, chunk.max(axis=0))
+            if method == 'z-score':
+                mean = chunk.mean(axis=0)
+                stats = _merge_statistics(stats, (np.full(num_channels, chunk.shape[0]), mean,
+                                                  ((chunk - mean) ** 2).sum(axis=0)))
+            beat_lead[position:position + chunk.shape[0]] = chunk[:, beat_channel]
+            position += chunk.shape[0]
+            yield chunk
+    
+    blocks = (signal[start:start + block_samples] for start in range(0, num_samples, block_samples))
+    filtered = tap_filtered(iter_filtered_chunks(blocks, original_fs, filter_params))
+    resampling_info: Dict[str, Any] = {}
+    written = 0
+    for chunk in iter_resampled_chunks(filtered, original_fs, target_fs, resampling_info):
+        _write_spans(spans, chunk, written)
+        written += chunk.shape[0]
+        if written >= needed:
+            break
+    # Sin ventanas pendientes (p. ej. multiWindow=false) el resto solo se filtra para
+    # las estadísticas de normalización y la derivación de latidos
+    for _ in filtered:
+        pass
+    
+    if not (valid_mask(min_val).all() and valid_mask(max_val).all()):
+        return None
+    
+    if method == 'z-score':
+        counts, offset, m2 = stats
+        scale = np.sqrt(m2 / np.maximum(counts, 1))
+        scale = np.where(scale >= 1e-10, scale, 1.0)
+    else:
+        method = 'min-max'
+        offset = min_val
+        scale = max_val - min_val
+        scale = np.where(scale >= 1e-10, scale, 1.0)
+    for _, _, view in spans:
+        view -= offset
+        view /= scale
+    
+    states = {
+        'filtrado': {
+            'status': 'OK',
+            'mensaje': 'Filtrado completado exitosamente',
+            'filtros_aplicados': design_filter_bank(original_fs, filter_params)[1],
+            'fase_cero': False
+        },
+        'normalizacion': {
+            'status': 'OK',
+            'mensaje': 'Normalización completada exitosamente',
+            'metodo': f'{method} (por canal)'
+        },
+        'resampling': resampling_status(original_fs, target_fs, num_samples, target_samples,
+                                        resampling_info.get('metodo'))
+    }
+    return complete(), states, beat_lead
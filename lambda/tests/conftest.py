@@ -0,0 +1,14 @@
+"""
+Configuración común de los tests del pipeline: los módulos de la Lambda se importan
+desde lambda/ y la inferencia usa el endpoint local (sin AWS ni métricas)
+"""
+
+import os
+import sys
+
+os.environ.setdefault('AWS_EC2_METADATA_DISABLED', 'true')
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('ECG_METRICS_ENABLED', 'false')
+os.environ.setdefault('ECG_INFERENCE_BACKEND', 'local')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
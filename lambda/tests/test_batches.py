@@ -0,0 +1,50 @@
+"""Tests de los lotes al endpoint: ningún payload supera el límite"""
+
+import json
+
+import numpy as np
+import pytest
+
+from ecg_processor import split_batches
+
+
+def _payload_sizes(windows, limit):
+    """Ventanas por lote y bytes del body de cada lote, serializado como en model_requests"""
+    batches = split_batches(windows, max_payload_bytes=limit)
+    bodies = [json.dumps({'signals': batch.tolist()}, ensure_ascii=False).encode('utf-8') for batch in batches]
+    return [batch.shape[0] for batch in batches], [len(body) for body in bodies]
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_payloads_within_limit_when_first_window_is_short(dtype):
+    # La primera ventana serializa corta (ceros) y el resto con floats de largo máximo
+    rng = np.random.default_rng(0)
+    scale = 1e-300 if dtype == np.float64 else 1e-30
+    windows = (rng.standard_normal((400, 2000, 1)) * scale).astype(dtype)
+    windows[0] = 0
+    limit = 4 * 1000 * 1000
+    sizes, payloads = _payload_sizes(windows, limit)
+    assert sum(sizes) == windows.shape[0]
+    assert max(payloads) <= limit
+
+
+def test_payloads_within_limit_multichannel():
+    rng = np.random.default_rng(1)
+    windows = -rng.random((60, 2000, 12)) * 1e-5
+    limit = 1000 * 1000
+    sizes, payloads = _payload_sizes(windows, limit)
+    assert sum(sizes) == windows.shape[0]
+    assert max(payloads) <= limit
+    assert len(payloads) > 1
+
+
+def test_split_batches_keeps_order():
+    windows = np.arange(30 * 4 * 1, dtype=np.float64).reshape(30, 4, 1)
+    batches = split_batches(windows, max_payload_bytes=64 + 3 * (4 * 26 + 4 * 4 + 4))
+    assert [batch.shape[0] for batch in batches] == [3] * 10
+    np.testing.assert_array_equal(np.concatenate(batches), windows)
+
+
+def test_single_window_larger_than_limit_goes_alone():
+    windows = np.ones((3, 100, 1))
+    assert [batch.shape[0] for batch in split_batches(windows, max_payload_bytes=100)] == [1, 1, 1]
@@ -0,0 +1,95 @@
+"""Tests de la caché de resultados: TTL y desalojo en memoria y en disco"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+import ecg_cache
+from ecg_cache import FileSystemBackend, LRUCache, ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj controlado para ecg_cache (arranca en la hora real: los archivos usan mtime real)"""
+    now = [ecg_cache.time.time()]
+    monkeypatch.setattr(ecg_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_lru_expires_by_ttl(clock):
+    cache = LRUCache(ttl_seconds=10)
+    cache.put('a', {'x': 1})
+    clock[0] += 5
+    assert cache.get('a') == {'x': 1}
+    clock[0] += 6
+    assert cache.get('a') is None
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_lru_evicts_by_bytes():
+    block = np.zeros(1000)
+    cache = LRUCache(max_bytes=int(2.5 * block.nbytes))
+    for key in 'abc':
+        cache.put(key, {'signal': block.copy()})
+    assert cache.get('a') is None
+    assert len(cache) == 2
+
+
+def test_filesystem_roundtrip(tmp_path):
+    backend = FileSystemBackend(str(tmp_path))
+    value = {'signal': np.arange(6, dtype=np.float32).reshape(3, 2), 'meta': {'fs': 500, 'leads': ['II']}}
+    backend.put('k', value)
+    restored = backend.get('k')
+    assert restored['meta'] == value['meta']
+    np.testing.assert_array_equal(restored['signal'], value['signal'])
+    assert restored['signal'].dtype == np.float32
+
+
+def test_filesystem_entry_hit_repeatedly_still_expires(tmp_path):
+    # Reloj real: una lectura que tocara la fecha de modificación la movería a "ahora"
+    backend = FileSystemBackend(str(tmp_path), ttl_seconds=1.0)
+    backend.put('k', {'x': 1})
+    written = time.time()
+    for _ in range(3):
+        time.sleep(0.2)
+        assert backend.get('k') == {'x': 1}
+    time.sleep(max(0.0, written + 1.3 - time.time()))
+    assert backend.get('k') is None
+    assert not os.path.exists(backend._path('k'))
+
+
+def test_filesystem_evicts_least_recently_read(tmp_path, clock):
+    backend = FileSystemBackend(str(tmp_path), max_bytes=10 ** 9)
+    for key in ('a', 'b', 'c'):
+        backend.put(key, {'signal': np.zeros(1000)})
+        clock[0] += 1
+    size = os.path.getsize(backend._path('a'))
+    # 'a' es la más antigua pero se lee: la menos usada pasa a ser 'b'
+    assert backend.get('a') is not None
+    backend.max_bytes = 3 * size
+    clock[0] += 1
+    backend.put('d', {'signal': np.zeros(1000)})
+    assert not os.path.exists(backend._path('b'))
+    assert all(os.path.exists(backend._path(key)) for key in ('a', 'c', 'd'))
+
+
+def test_result_cache_keeps_backend_expiry(tmp_path, clock):
+    backend = FileSystemBackend(str(tmp_path), ttl_seconds=10)
+    backend.put('k', {'x': 1})
+    cache = ResultCache(LRUCache(ttl_seconds=3600), backend)
+    clock[0] += 8
+    assert cache.get('k') == {'x': 1}
+    # La copia en memoria vence junto con la entrada del backend, no una hora después
+    clock[0] += 3
+    assert cache.get('k') is None
@@ -0,0 +1,84 @@
+"""Tests del handler: requests inválidos responden 400 con un mensaje para el usuario"""
+
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from ecg_benchmark import synthetic_csv
+from ecg_processor import ECG_LEADS, lambda_handler
+
+
+def _invoke(body):
+    response = lambda_handler({'body': json.dumps(body)}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def _with_time_jump(csv_content, row, seconds):
+    """El CSV con los timestamps desplazados seconds a partir de la fila row"""
+    lines = csv_content.splitlines()
+    rows = [line.split(',') for line in lines[1:]]
+    for values in rows[row:]:
+        values[0] = f'{float(values[0]) + seconds:.6f}'
+    return '\n'.join([lines[0]] + [','.join(values) for values in rows]) + '\n'
+
+
+def test_regrid_with_huge_gap_is_rejected():
+    csv_content = _with_time_jump(synthetic_csv(20, 500), 5000, 1e6)
+    status, body = _invoke({'csvContent': csv_content, 'regridTimestamps': True})
+    assert status == 400
+    assert 'reloj uniforme' in body['error']
+
+
+def test_regrid_with_small_gap_is_processed():
+    csv_content = _with_time_jump(synthetic_csv(20, 500), 5000, 2)
+    status, body = _invoke({'csvContent': csv_content, 'regridTimestamps': True})
+    assert status == 200
+    assert body['estados']['calidad']['muestreo']['reloj_uniforme'] is True
+
+
+GAIN_ERROR = f'ecgData.gain debe ser un número o uno por derivación ({len(ECG_LEADS)})'
+
+
+def _ecg_data(**fields):
+    samples = np.zeros((10, len(ECG_LEADS)), dtype=np.float32)
+    payload = {'data': base64.b64encode(samples.tobytes()).decode('ascii'), 'shape': list(samples.shape), 'fs': 500}
+    payload.update(fields)
+    return payload
+
+
+@pytest.mark.parametrize('options, message', [
+    ({'previewPoints': 'abc'}, 'previewPoints debe ser un número entero'),
+    ({'previewPoints': 2.5}, 'previewPoints debe ser un número entero'),
+    ({'notchQ': 'alto'}, 'notchQ debe ser un número'),
+    ({'lowFreq': [0.5]}, 'lowFreq debe ser un número'),
+    ({'highFreq': 'NaN'}, 'highFreq debe ser un número'),
+    ({'filterOrder': '2.0'}, 'filterOrder debe ser un número entero'),
+    ({'windowHop': 'x'}, 'windowHop debe ser un número entero'),
+    ({'beatWindow': [0.25]}, 'beatWindow debe ser'),
+    ({'beatWindow': ['a', 0.4]}, 'beatWindow debe ser un número'),
+    ({'outputs': 'tensor'}, 'outputs debe ser una lista de etapas'),
+    ({'outputs': ['tensor', 'espectro']}, 'outputs debe ser una lista de etapas'),
+    ({'precision': 'float16'}, 'precision no soportada'),
+])
+@pytest.mark.parametrize('streaming', [False, True])
+def test_malformed_numeric_options_are_rejected(options, message, streaming):
+    body = {'csvContent': synthetic_csv(10, 500), 'streaming': streaming}
+    body.update(options)
+    status, response = _invoke(body)
+    assert status == 400
+    assert message in response['error']
+
+
+@pytest.mark.parametrize('fields, message', [
+    ({'fs': 'rápido'}, 'ecgData.fs debe ser la frecuencia de muestreo en Hz'),
+    ({'fs': None}, 'ecgData.fs debe ser la frecuencia de muestreo en Hz'),
+    ({'gain': 'x'}, GAIN_ERROR),
+    ({'gain': [1.0] * (len(ECG_LEADS) - 1) + [None]}, GAIN_ERROR),
+    ({'gain': [1.0] * (len(ECG_LEADS) + 1)}, GAIN_ERROR),
+])
+def test_malformed_ecg_data_header_is_rejected(fields, message):
+    status, response = _invoke({'ecgData': _ecg_data(**fields)})
+    assert status == 400
+    assert response['error'] == message
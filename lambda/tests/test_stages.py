@@ -0,0 +1,89 @@
+"""Tests de la caché de etapas del camino en memoria"""
+
+import numpy as np
+import pytest
+
+import ecg_processor
+import ecg_stream
+from ecg_benchmark import synthetic_csv
+from ecg_cache import LRUCache
+from ecg_processor import RESPONSE_SIGNALS, preprocess_ecg
+
+
+@pytest.fixture
+def stage_calls(monkeypatch):
+    """Caché de etapas vacía y conteo de parseos, filtrados y pasadas fusionadas"""
+    monkeypatch.setattr(ecg_processor, 'stage_cache', LRUCache(max_entries=64, max_bytes=256 * 1024 * 1024))
+    calls = {'parseo': 0, 'filtrado': 0, 'fusionado': 0}
+    
+    def counted(module, name, stage):
+        original = getattr(module, name)
+        
+        def wrapper(*args, **kwargs):
+            calls[stage] += 1
+            return original(*args, **kwargs)
+        monkeypatch.setattr(module, name, wrapper)
+    counted(ecg_processor, 'parse_csv_content', 'parseo')
+    counted(ecg_processor, 'filter_signal', 'filtrado')
+    counted(ecg_stream, 'fused_model_input', 'fusionado')
+    return calls
+
+
+@pytest.mark.parametrize('outputs, fused', [
+    (['tensor'], False),
+    (['resampleada', 'tensor'], False),
+    (['filtrada', 'tensor'], False),
+    (['tensor'], True),
+])
+def test_cached_in_place_request_skips_parse_and_filter(stage_calls, outputs, fused):
+    csv_content = synthetic_csv(30, 500)
+    request_data = {'precision': 'float32', 'outputs': outputs, 'fused': fused}
+    first, first_input = preprocess_ecg(csv_content, request_data)
+    calls = dict(stage_calls)
+    assert calls['parseo'] == 1
+    
+    second, second_input = preprocess_ecg(csv_content, request_data)
+    assert stage_calls == calls
+    np.testing.assert_array_equal(second_input, first_input)
+    assert second['estados'] == first['estados']
+    assert second.get('fusionado') == first.get('fusionado')
+    for output in outputs[:-1]:
+        name = RESPONSE_SIGNALS[output]
+        np.testing.assert_array_equal(second[name], first[name])
+
+
+def test_changed_filter_reprocesses_in_place_request(stage_calls):
+    csv_content = synthetic_csv(30, 500)
+    preprocess_ecg(csv_content, {'precision': 'float32', 'outputs': ['tensor']})
+    preprocess_ecg(csv_content, {'precision': 'float32', 'outputs': ['tensor'], 'highFreq': 35})
+    assert stage_calls['parseo'] == 2
+    assert stage_calls['filtrado'] == 2
+
+
+@pytest.mark.parametrize('fs', [360, 500])
+@pytest.mark.parametrize('request_data', [
+    {},
+    {'windowHop': 1000},
+    {'multiWindow': False},
+    {'notchFreq': 0, 'lowFreq': 1.0, 'highFreq': 35},
+])
+def test_fused_matches_staged(fs, request_data):
+    csv_content = synthetic_csv(45, fs)
+    options = dict(request_data, outputs=['tensor'])
+    with ecg_processor.without_stage_cache():
+        staged, staged_input = preprocess_ecg(csv_content, dict(options, fused=False))
+        fused, fused_input = preprocess_ecg(csv_content, dict(options, fused=True))
+    assert fused.get('fusionado') is True and 'fusionado' not in staged
+    assert fused_input.shape == staged_input.shape
+    np.testing.assert_allclose(fused_input, staged_input, rtol=0, atol=1e-9)
+    assert fused['estados']['latidos'] == staged['estados']['latidos']
+    for name in ('filtrado', 'normalizacion', 'resampling'):
+        assert fused['estados'][name]['status'] == staged['estados'][name]['status']
+    assert fused['estados']['resampling']['muestras_finales'] == staged['estados']['resampling']['muestras_finales']
+
+
+def test_fused_falls_back_to_staged_with_zero_phase():
+    csv_content = synthetic_csv(20, 500)
+    with ecg_processor.without_stage_cache():
+        response, _ = preprocess_ecg(csv_content, {'outputs': ['tensor'], 'fused': True, 'zeroPhase': True})
+    assert 'fusionado' not in response
@@ -0,0 +1,179 @@
+"""Tests del modo streaming: mismas ventanas y predicción que el camino batch"""
+
+import io
+import json
+
+import numpy as np
+import pytest
+
+import ecg_processor
+import ecg_stream
+from ecg_benchmark import synthetic_csv
+from ecg_processor import (
+    ensemble_model_inputs,
+    filter_parameters,
+    lambda_handler,
+    preprocess_ecg,
+    request_leads,
+    resolve_models,
+    windows_per_batch,
+)
+from ecg_stream import process_stream
+
+
+@pytest.fixture
+def extra_model(monkeypatch):
+    """Modelo adicional con otra fs, largo de ventana, normalización y derivaciones"""
+    model = {**ecg_processor.model_registry['default'], 'nombre': 'z', 'endpoint': 'z', 'target_fs': 125,
+             'input_length': 1250, 'normalizacion': 'z-score', 'derivaciones': ('II',), 'peso': 2.0}
+    monkeypatch.setitem(ecg_processor.model_registry, 'z', model)
+    return 'z'
+
+
+def _batch_inputs(csv_content, request_data):
+    """Tensores de cada modelo por el camino batch por etapas (filtrado causal, como streaming)"""
+    request_data = dict(request_data, zeroPhase=False, fused=False,
+                        outputs=['filtrada', 'normalizada', 'resampleada', 'tensor'])
+    response_data, model_input = preprocess_ecg(csv_content, request_data)
+    return ensemble_model_inputs(response_data, resolve_models(request_data.get('modelId')), request_data, model_input)
+
+
+def _stream_inputs(csv_content, request_data, chunk_rows=7000):
+    """Ventanas que entrega process_stream, concatenadas por modelo"""
+    models = resolve_models(request_data.get('modelId'))
+    groups = {}
+    response_data = process_stream(lambda: io.StringIO(csv_content), chunk_rows,
+                                   filter_parameters(dict(request_data, zeroPhase=False)),
+                                   request_leads(request_data, models), models, request_data,
+                                   on_windows=lambda model_id, windows: groups.setdefault(model_id, []).append(windows))
+    return response_data, {model_id: np.concatenate(windows) for model_id, windows in groups.items()}, groups
+
+
+@pytest.mark.parametrize('fs, request_data', [
+    (500, {}),
+    (360, {}),
+    (257.3, {}),
+    (500, {'windowHop': 700}),
+    (500, {'multiWindow': False}),
+    (500, {'precision': 'float32'}),
+    (360, {'windowHop': 3000}),
+])
+def test_stream_matches_batch(fs, request_data):
+    csv_content = synthetic_csv(65, fs)
+    batch = _batch_inputs(csv_content, request_data)
+    response_data, stream, _ = _stream_inputs(csv_content, request_data)
+    tolerance = 1e-5 if request_data.get('precision') == 'float32' else 1e-9
+    for model_id, model_input in batch.items():
+        assert stream[model_id].shape == model_input.shape
+        assert stream[model_id].dtype == model_input.dtype
+        np.testing.assert_allclose(stream[model_id], model_input, atol=tolerance)
+    assert response_data['streaming']['ventanas'] == batch['default'].shape[0]
+    assert response_data['tensor_final']['shape'] == list(batch['default'].shape)
+
+
+def test_stream_matches_batch_ensemble(extra_model):
+    csv_content = synthetic_csv(65, 500)
+    request_data = {'modelId': f'default,{extra_model}', 'windowHop': 500}
+    batch = _batch_inputs(csv_content, request_data)
+    _, stream, _ = _stream_inputs(csv_content, request_data)
+    assert set(stream) == set(batch)
+    for model_id, model_input in batch.items():
+        np.testing.assert_allclose(stream[model_id], model_input, atol=1e-9)
+
+
+def test_stream_short_signal_is_zero_padded():
+    csv_content = synthetic_csv(8, 500)
+    batch = _batch_inputs(csv_content, {})
+    _, stream, _ = _stream_inputs(csv_content, {})
+    np.testing.assert_allclose(stream['default'], batch['default'], atol=1e-9)
+
+
+def test_stream_window_groups_are_bounded():
+    csv_content = synthetic_csv(120, 500)
+    _, stream, groups = _stream_inputs(csv_content, {'windowHop': 10}, chunk_rows=60000)
+    limit = windows_per_batch(stream['default'].shape[1:])
+    assert len(groups['default']) > 1
+    assert max(group.shape[0] for group in groups['default']) <= limit
+
+
+def test_stream_truncates_after_max_windows(monkeypatch):
+    monkeypatch.setattr(ecg_stream, 'STREAM_MAX_WINDOWS', 3)
+    csv_content = synthetic_csv(65, 500)
+    batch = _batch_inputs(csv_content, {})
+    response_data, stream, _ = _stream_inputs(csv_content, {})
+    np.testing.assert_allclose(stream['default'], batch['default'][:3], atol=1e-9)
+    assert response_data['streaming']['truncado'] is True
+    assert response_data['streaming']['segundos_evaluados'] == 30
+
+
+@pytest.mark.parametrize('request_data', [{}, {'windowAggregation': 'max', 'modelId': 'default,z'}])
+def test_stream_handler_prediction_matches_batch(request_data, extra_model):
+    csv_content = synthetic_csv(65, 500)
+    request_data = dict(request_data, zeroPhase=False)
+    batch = json.loads(lambda_handler({'body': json.dumps({'csvContent': csv_content, **request_data})}, None)['body'])
+    response = lambda_handler({'body': json.dumps({'csvContent': csv_content, 'streaming': True, **request_data})}, None)
+    assert response['statusCode'] == 200
+    stream = json.loads(response['body'])
+    assert stream['prediccion']['score'] == pytest.approx(batch['prediccion']['score'], abs=1e-6)
+    assert stream['prediccion']['clase'] == batch['prediccion']['clase']
+
+
+def test_stream_handler_rejects_unknown_model():
+    body = {'csvContent': synthetic_csv(15, 500), 'streaming': True, 'modelId': 'nope'}
+    assert lambda_handler({'body': json.dumps(body)}, None)['statusCode'] == 400
+
+
+def _with_artifacts(csv_content):
+    """El CSV con un tramo plano en II, NaN en V1 y muestras saturadas en V5"""
+    lines = csv_content.splitlines()
+    rows = [line.split(',') for line in lines[1:]]
+    for row in rows[5000:9000]:
+        row[1] = '0.5'
+    for row in rows[30000:30100]:
+        row[2] = 'nan'
+    top = max(float(row[3]) for row in rows)
+    for row in rows[40000:47000:3]:
+        row[3] = str(top)
+    return '\n'.join([lines[0]] + [','.join(row) for row in rows]) + '\n'
+
+
+@pytest.mark.parametrize('artifacts', [False, True])
+@pytest.mark.parametrize('chunk_rows', [999, 7000, 100000])
+def test_stream_quality_indices_match_batch(artifacts, chunk_rows):
+    csv_content = synthetic_csv(95, 500)
+    if artifacts:
+        csv_content = _with_artifacts(csv_content)
+    signal, _, fs, _ = ecg_processor.parse_csv_content(csv_content)
+    batch = ecg_processor.check_quality(signal, fs)
+    response_data, _, _ = _stream_inputs(csv_content, {}, chunk_rows)
+    stream = response_data['estados']['calidad']
+    assert stream['status'] == batch['status']
+    for key, value in batch['sqi'].items():
+        # Las ventanas con valores inválidos se completan con la media de la ventana (no la del canal)
+        tolerance = 1e-3 if artifacts and key in ('linea_base', 'red_electrica', 'sqi_ventanas') else 1e-9
+        np.testing.assert_allclose(stream['sqi'][key], value, atol=tolerance, err_msg=key)
+
+
+def test_stream_rejects_by_sqi():
+    lines = synthetic_csv(95, 500).splitlines()
+    rows = [line.split(',') for line in lines[1:]]
+    for row in rows[:40000]:
+        row[1] = '0.5'
+    csv_content = '\n'.join([lines[0]] + [','.join(row) for row in rows]) + '\n'
+    response_data, stream, _ = _stream_inputs(csv_content, {})
+    assert response_data['estados']['calidad']['status'] == 'RECHAZADA'
+    assert response_data['estados']['calidad']['razon_rechazo'] == 'Señal demasiado plana'
+    assert stream == {}
+
+
+@pytest.mark.parametrize('block_s', [20, 300])
+def test_stream_beats_match_batch(block_s, monkeypatch):
+    monkeypatch.setattr(ecg_stream, 'STREAM_BEAT_BLOCK_S', block_s)
+    csv_content = synthetic_csv(95, 500)
+    signal, _, fs, _ = ecg_processor.parse_csv_content(csv_content)
+    filtered, _ = ecg_processor.filter_signal(signal, fs, dict(filter_parameters(), zero_phase=False))
+    _, batch = ecg_processor.detect_beats(filtered, fs)
+    response_data, _, _ = _stream_inputs(csv_content, {})
+    stream = response_data['estados']['latidos']
+    assert stream['indices_r'] == batch['indices_r']
+    assert stream['frecuencia_cardiaca_lpm'] == batch['frecuencia_cardiaca_lpm']
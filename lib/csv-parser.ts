@@ -3,7 +3,32 @@
  */
 
 import Papa from 'papaparse'
-import { RawECGData, ECGSignal } from '@/types/ecg'
+import { ECGBinaryPayload, RawECGData, ECGSignal } from '@/types/ecg'
+
+/**
+ * Frecuencia de muestreo robusta (como estimate_fs en la Lambda): promedio de los
+ * intervalos entre 0.5 y 1.5 veces la mediana, redondeada si está a menos de 0.05 %
+ * de un entero. Un timestamp redondeado o con jitter no cambia el resultado.
+ */
+export function estimateFs(tiempo_s: number[]): number {
+  const diffs: number[] = []
+  for (let i = 1; i < tiempo_s.length; i++) {
+    const diff = tiempo_s[i] - tiempo_s[i - 1]
+    if (diff > 0) {
+      diffs.push(diff)
+    }
+  }
+  if (diffs.length === 0) {
+    return 500 // Valor por defecto
+  }
+
+  const sorted = [...diffs].sort((a, b) => a - b)
+  const middle = Math.floor(sorted.length / 2)
+  const step = sorted.length % 2 ? sorted[middle] : (sorted[middle - 1] + sorted[middle]) / 2
+  const regular = diffs.filter(diff => diff >= 0.5 * step && diff <= 1.5 * step)
+  const fs = regular.length / regular.reduce((sum, diff) => sum + diff, 0)
+  return Math.abs(fs - Math.round(fs)) <= 5e-4 * fs ? Math.round(fs) : fs
+}
 
 /**
  * Parsea un archivo CSV de ECG y lo convierte al formato estándar
@@ -29,6 +54,8 @@ export function parseECGCSV(csvContent: string): { data: RawECGData; fs: number
   const II: number[] = []
   const V1: number[] = []
   const V5: number[] = []
+  const label: number[] = []
+  const is_anomalo: boolean[] = []
 
   for (const row of rows) {
     if (row.tiempo_s !== undefined && row.tiempo_s !== null) {
@@ -43,6 +70,12 @@ export function parseECGCSV(csvContent: string): { data: RawECGData; fs: number
     if (row.V5 !== undefined && row.V5 !== null) {
       V5.push(Number(row.V5))
     }
+    if (row.label !== undefined && row.label !== null && row.label !== '') {
+      label.push(Number(row.label))
+    }
+    if (row.is_anomalo !== undefined && row.is_anomalo !== null && row.is_anomalo !== '') {
+      is_anomalo.push(['true', '1', 'yes'].includes(String(row.is_anomalo).trim().toLowerCase()))
+    }
   }
 
   // Validar que tenemos datos
@@ -51,13 +84,7 @@ export function parseECGCSV(csvContent: string): { data: RawECGData; fs: number
   }
 
   // Calcular frecuencia de muestreo
-  let fs = 500 // Valor por defecto
-  if (tiempo_s.length > 1) {
-    const timeDiff = tiempo_s[1] - tiempo_s[0]
-    if (timeDiff > 0) {
-      fs = 1 / timeDiff
-    }
-  }
+  const fs = estimateFs(tiempo_s)
 
   return {
     data: {
@@ -65,6 +92,8 @@ export function parseECGCSV(csvContent: string): { data: RawECGData; fs: number
       II,
       V1,
       V5,
+      ...(label.length > 0 && { label }),
+      ...(is_anomalo.length > 0 && { is_anomalo }),
     },
     fs,
   }
@@ -96,3 +125,47 @@ export async function parseECGFile(file: File): Promise<{ data: RawECGData; fs:
   return parseECGCSV(text)
 }
 
+
+/**
+ * Codifica un ECG en el formato binario del request (ecgData): muestras intercaladas
+ * [II, V1, V5] en float32, o en int16 con una ganancia que cubre el rango de la señal
+ */
+export function encodeECGBinary(
+  rawData: RawECGData,
+  fs: number,
+  encoding: ECGBinaryPayload['encoding'] = 'base64-float32'
+): ECGBinaryPayload {
+  const signal = rawECGToSignal(rawData)
+  const values = signal.flat()
+
+  let gain = 1
+  let bytes: Uint8Array
+  if (encoding === 'base64-int16') {
+    const maxAbs = values.reduce((max, value) => Math.max(max, Math.abs(value)), 0)
+    gain = maxAbs > 0 ? maxAbs / 32767 : 1
+    const data = new DataView(new ArrayBuffer(values.length * 2))
+    values.forEach((value, i) => data.setInt16(i * 2, Math.round(value / gain), true))
+    bytes = new Uint8Array(data.buffer)
+  } else {
+    const data = new DataView(new ArrayBuffer(values.length * 4))
+    values.forEach((value, i) => data.setFloat32(i * 4, value, true))
+    bytes = new Uint8Array(data.buffer)
+  }
+
+  // btoa recibe un string binario; se arma por tramos para no exceder los argumentos de apply
+  let binary = ''
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode.apply(null, Array.from(bytes.subarray(i, i + 0x8000)))
+  }
+
+  return {
+    encoding,
+    shape: [signal.length, 3],
+    fs,
+    leads: ['II', 'V1', 'V5'],
+    gain,
+    ...(rawData.label && rawData.label.length > 0 ? { label: rawData.label[0] } : {}),
+    ...(rawData.is_anomalo && rawData.is_anomalo.length > 0 ? { is_anomalo: rawData.is_anomalo[0] } : {}),
+    data: btoa(binary),
+  }
+}
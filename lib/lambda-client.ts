@@ -3,7 +3,14 @@
  * El frontend solo muestra resultados, todo el procesamiento está en Lambda
  */
 
-import { ProcessingResponse } from '@/types/ecg'
+import {
+  ECGBinaryPayload,
+  ECGRecordInput,
+  EncodedSignal,
+  ProcessOptions,
+  ProcessingResponse,
+  RecordsResponse,
+} from '@/types/ecg'
 
 /**
  * Obtiene la URL de la API desde variables de entorno
@@ -22,17 +29,72 @@ const getApiUrl = (): string => {
   return apiUrl
 }
 
+/**
+ * Decodifica una señal base64 float32 a matriz [muestras, canales]
+ */
+const decodeSignal = (value: any): any => {
+  if (!value || Array.isArray(value) || value.encoding !== 'base64-float32') {
+    return value
+  }
+
+  const encoded = value as EncodedSignal
+  const binary = atob(encoded.data)
+  const bytes = new Uint8Array(binary.length)
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i)
+  }
+  const flat = new Float32Array(bytes.buffer)
+
+  // Reconstruir las dimensiones (2D para señales, 3D para el tensor)
+  const build = (offset: number, dims: number[]): any => {
+    if (dims.length === 1) {
+      return Array.from(flat.subarray(offset, offset + dims[0]))
+    }
+    const stride = dims.slice(1).reduce((a, b) => a * b, 1)
+    const result = []
+    for (let i = 0; i < dims[0]; i++) {
+      result.push(build(offset + i * stride, dims.slice(1)))
+    }
+    return result
+  }
+  return build(0, encoded.shape)
+}
+
+// Campos de la respuesta que la API puede codificar en base64-float32
+const ENCODED_FIELDS = [
+  'signal_original',
+  'signal_filtrada',
+  'signal_normalizada',
+  'signal_resampleada',
+  'segmentos_latidos',
+] as const
+
+/**
+ * Decodifica las señales de una respuesta (pueden venir en base64-float32)
+ */
+const decodeResponse = (data: ProcessingResponse): ProcessingResponse => {
+  for (const field of ENCODED_FIELDS) {
+    data[field] = decodeSignal(data[field])
+  }
+  if (data.tensor_final?.muestra_preview) {
+    data.tensor_final.muestra_preview = decodeSignal(data.tensor_final.muestra_preview)
+  }
+  return data
+}
+
 /**
  * Procesa un ECG completo llamando a Lambda
  * Lambda hace TODO el procesamiento: parsear CSV, procesar señal, llamar a SageMaker
  * 
- * @param csvContent - Contenido del archivo CSV
- * @param modelId - ID del modelo a usar (opcional)
+ * @param ecg - Contenido del archivo CSV o el ECG binario (encodeECGBinary)
+ * @param modelId - ID del modelo a usar, o varios para un ensemble (opcional)
+ * @param options - Etapas a devolver, puntos de preview y codificación (opcional)
  * @returns Respuesta completa con todas las etapas procesadas
  */
 export async function processECG(
-  csvContent: string,
-  modelId?: string
+  ecg: string | ECGBinaryPayload,
+  modelId?: string | string[],
+  options?: ProcessOptions
 ): Promise<ProcessingResponse> {
   const apiUrl = getApiUrl()
   
@@ -43,8 +105,9 @@ export async function processECG(
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({
-        csvContent,
+        ...(typeof ecg === 'string' ? { csvContent: ecg } : { ecgData: ecg }),
         modelId: modelId || 'default',
+        ...options,
       }),
     })
     
@@ -54,7 +117,7 @@ export async function processECG(
     }
     
     const data: ProcessingResponse = await response.json()
-    return data
+    return decodeResponse(data)
   } catch (error) {
     if (error instanceof TypeError && error.message.includes('fetch')) {
       throw new Error(
@@ -71,3 +134,43 @@ export async function processECG(
   }
 }
 
+
+/**
+ * Procesa varios ECG en una sola llamada a Lambda (preprocesamiento en paralelo y
+ * una sola tanda de llamadas a SageMaker). Un registro con error no hace fallar al resto.
+ * 
+ * @param records - Registros con id y CSV o ECG binario
+ * @param modelId - ID del modelo a usar, o varios para un ensemble (opcional)
+ * @param options - Opciones comunes (por defecto solo se devuelve el tensor)
+ * @returns Un resultado por registro, resumen y llamadas al endpoint
+ */
+export async function processECGRecords(
+  records: ECGRecordInput[],
+  modelId?: string | string[],
+  options?: ProcessOptions
+): Promise<RecordsResponse> {
+  const response = await fetch(getApiUrl(), {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      records,
+      modelId: modelId || 'default',
+      ...options,
+    }),
+  })
+
+  if (!response.ok) {
+    const errorData = await response.json()
+    throw new Error(errorData.error || errorData.message || `Error ${response.status}`)
+  }
+
+  const data: RecordsResponse = await response.json()
+  data.registros.forEach((registro) => {
+    if (registro.status === 'OK') {
+      decodeResponse(registro)
+    }
+  })
+  return data
+}
@@ -26,6 +26,36 @@ export interface QualityCheckResult {
   razon_rechazo?: string
   duracion_segundos?: number
   fs_original?: number
+  sqi?: SignalQualityIndices
+  muestreo?: SamplingAnalysis // Solo con CSV (columna tiempo_s)
+  derivaciones?: string[] // Derivaciones procesadas (orden de los canales de las señales)
+}
+
+// Análisis de la columna tiempo_s
+export interface SamplingAnalysis {
+  fs: number // Estimada con los intervalos regulares (no solo el primero)
+  intervalos: number
+  huecos: number // Intervalos de más de 1.5 períodos
+  muestras_faltantes: number
+  duplicados: number
+  retrocesos: number
+  intervalos_cortos: number // Menos de medio período
+  deriva_ppm: number // Diferencia de fs entre la segunda y la primera mitad
+  jitter_max_ms: number
+  irregular: boolean
+  reloj_uniforme?: boolean // La señal se interpoló a un reloj uniforme (regridTimestamps)
+}
+
+// Índices de calidad (un valor por canal salvo los de ventanas)
+export interface SignalQualityIndices {
+  invalidos: number[] // Fracción de NaN/Inf
+  plano_fraccion: number[] // Fracción de muestras en tramos constantes de al menos 0.5 s
+  plano_max_s: number[]
+  saturacion: number[] // Fracción de muestras en el mínimo o el máximo del canal
+  linea_base: number[] // Potencia relativa por debajo de 0.5 Hz
+  red_electrica: number[] // Potencia relativa en 50/60 Hz
+  sqi_ventanas: number[] // Por ventana de 10 s: potencia en 0.5-40 Hz sobre el total (peor canal)
+  ventanas_buenas: number
 }
 
 export interface FilterResult {
@@ -34,6 +64,28 @@ export interface FilterResult {
   filtros_aplicados: string[]
 }
 
+// Picos R en la derivación II, frecuencia cardíaca y estadísticas RR
+export interface BeatDetectionResult {
+  status: 'OK' | 'ERROR'
+  mensaje: string
+  derivacion?: string // II, o la primera derivación si el request no la incluye
+  num_latidos: number
+  indices_r?: number[]
+  frecuencia_cardiaca_lpm?: number
+  rr_media_ms?: number
+  rr_mediana_ms?: number
+  rr_min_ms?: number
+  rr_max_ms?: number
+  sdnn_ms?: number
+  rmssd_ms?: number
+  // Solo con beatSegments: latidos que entran completos en la ventana
+  segmentos?: {
+    shape: number[]
+    indices_r: number[]
+    ventana_s: [number, number]
+  }
+}
+
 export interface NormalizationResult {
   status: 'OK' | 'ERROR'
   mensaje: string
@@ -48,11 +100,29 @@ export interface ResamplingResult {
   muestras_finales: number
 }
 
+// Mediciones por etapa (solo si el request pide timings: true)
+export interface StageTiming {
+  wall_ms: number
+  cpu_ms: number
+  peak_bytes?: number // Solo con ECG_TRACE_MEMORY=true en la Lambda
+}
+
+export interface PipelineTimings {
+  etapas: Record<string, StageTiming>
+  total_ms: number
+  rss_max_bytes: number // Pico del proceso desde el arranque
+  rss_inicio_bytes?: number // RSS al empezar el request
+  rss_pico_bytes?: number // Pico del request (si se pudo medir)
+  etapas_reutilizadas?: string[] // Etapas tomadas de la caché de etapas
+}
+
 export interface ProcessingStates {
   calidad: QualityCheckResult
   filtrado: FilterResult
+  latidos?: BeatDetectionResult
   normalizacion: NormalizationResult
   resampling: ResamplingResult
+  timings?: PipelineTimings
 }
 
 // Respuesta del modelo SageMaker
@@ -63,30 +133,121 @@ export interface SageMakerResponse {
   [key: string]: any
 }
 
+// Señal codificada en binario por la API (encoding: 'base64-float32')
+export interface EncodedSignal {
+  encoding: 'base64-float32'
+  dtype: 'float32'
+  shape: number[]
+  data: string // base64 de float32 little-endian
+}
+
+// ECG binario para el request (ecgData): alternativa compacta a csvContent
+export interface ECGBinaryPayload {
+  encoding: 'base64-float32' | 'base64-int16'
+  shape: [number, number] // [muestras, derivaciones], intercaladas por muestra
+  fs: number
+  leads?: string[] // Derivaciones de las columnas de data; por defecto ['II', 'V1', 'V5']
+  gain?: number | number[] // Valor físico = valor codificado * gain (uno o por derivación)
+  label?: number
+  is_anomalo?: boolean
+  data: string // base64 little-endian
+}
+
+// Opciones de salida del request (para reducir el tamaño de la respuesta)
+export interface ProcessOptions {
+  outputs?: Array<'original' | 'filtrada' | 'normalizada' | 'resampleada' | 'tensor'>
+  previewPoints?: number // Máximo de puntos por señal (submuestreo min-max)
+  encoding?: 'json' | 'base64-float32'
+  timings?: boolean // Incluir estados.timings con tiempo y memoria por etapa
+  beatSegments?: boolean // Incluir segmentos_latidos
+  beatWindow?: [number, number] // Segundos antes y después del pico R
+  regridTimestamps?: boolean // Con timestamps irregulares, interpolar a un reloj uniforme
+  leads?: string[] // Derivaciones a procesar (por defecto las de los modelos pedidos)
+  fused?: boolean // Preprocesamiento en una pasada (solo si outputs no incluye señales intermedias)
+  precision?: 'float64' | 'float32' // float32: mitad de memoria y filtrado/normalización en el lugar
+}
+
+// Señales submuestreadas para visualización
+export interface SignalPreviewInfo {
+  puntos: number
+  muestras_originales: number
+}
+
 // Respuesta completa de la API
 export interface ProcessingResponse {
-  signal_original: ECGSignal
+  signal_original: ECGSignal | null
   signal_filtrada: ECGSignal | null
   signal_normalizada: ECGSignal | null
   signal_resampleada: ECGSignal | null
   tensor_final?: {
     shape: number[]
-    muestra_preview: number[][][] // Primeras muestras del tensor para visualización
+    muestra_preview?: number[][][] // Primeras muestras del tensor para visualización
   }
+  segmentos_latidos?: number[][][] | null // [latidos, muestras, canales]
   estados: ProcessingStates
   prediccion: {
     clase: 'anomalo' | 'normal'
     score: number
+    // Solo cuando el registro se evaluó en varias ventanas de 10 s
+    agregacion?: 'mean' | 'max'
+    ventanas?: number
+    ventanas_anomalas?: number
+    scores_ventanas?: number[]
+    // Solo con varios modelos: predicción de cada uno (null si falló) y pesos usados
+    ensemble?: {
+      modelos: Record<string, Omit<NonNullable<ProcessingResponse['prediccion']>, 'ensemble'> | null>
+      pesos: Record<string, number>
+    }
   } | null
   modelo: {
     nombre: string
     endpoint: string
+    error?: string // Motivo si no hubo predicción (endpoint caído, timeout, respuesta inválida)
     metadata?: Record<string, any>
   }
   etiqueta_real?: {
     label_real?: number // 0 = normal, 1 = anómalo
     is_anomalo_real?: boolean
   }
+  fusionado?: boolean // Procesado en modo fusionado (sin señales intermedias)
+  // Solo en modo streaming
+  streaming?: {
+    bloques: number
+    muestras_totales: number
+    ventanas?: number
+    truncado?: boolean // El registro supera ECG_STREAM_MAX_WINDOWS ventanas: solo se evaluó el comienzo
+    segundos_evaluados?: number
+  }
+  previews?: Partial<Record<'signal_original' | 'signal_filtrada' | 'signal_normalizada' | 'signal_resampleada', SignalPreviewInfo>>
+}
+
+// Registro de un request con varios ECG (records): id y CSV o ECG binario, más opciones del pipeline propias
+export interface ECGRecordInput extends Omit<ProcessOptions, 'outputs' | 'previewPoints' | 'encoding' | 'timings'> {
+  id: string
+  csvContent?: string
+  ecgData?: ECGBinaryPayload
+}
+
+// Resultado de cada registro: la respuesta habitual o el error
+export type ECGRecordResult =
+  | ({ id: string; status: 'OK'; cache: 'HIT' | 'MISS' } & ProcessingResponse)
+  | { id: string; status: 'ERROR'; mensaje: string; estados?: { timings?: PipelineTimings } }
+
+export interface RecordsResponse {
+  registros: ECGRecordResult[]
+  resumen: {
+    registros: number
+    errores: number
+    rechazados: number // Rechazados en el chequeo de calidad
+    con_prediccion: number
+    desde_cache: number
+  }
+  inferencia: {
+    llamadas_endpoint: number // Ventanas de todos los registros apiladas en los mismos lotes
+    ventanas: number
+    reintentos?: number
+    hedges?: number
+  }
 }
 
 // Configuración de modelo